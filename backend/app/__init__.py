@@ -15,3 +15,69 @@ SECRET_KEY_USER = getenv("SECRET_KEY_USER")
 ACCESS_TOKEN_EXPIRE_MINUTES = getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
 ADMIN_PANEL_PASSWORD = getenv("ADMIN_PANEL_PASSWORD")
 
+
+# Docker SDK calls run on a bounded thread pool, off the event loop
+DOCKER_WORKERS = int(getenv("DOCKER_WORKERS", "8"))
+DOCKER_MAX_CONCURRENCY = int(getenv("DOCKER_MAX_CONCURRENCY", "8"))
+DOCKER_TIMEOUT = float(getenv("DOCKER_TIMEOUT", "30"))
+DOCKER_PULL_TIMEOUT = float(getenv("DOCKER_PULL_TIMEOUT", "600"))
+# Daemons codespaces are placed on: "name=url[@capacity],..." (empty = local socket)
+DOCKER_HOSTS = getenv("DOCKER_HOSTS")
+
+CODESPACE_IMAGE = getenv("CODESPACE_IMAGE", "skfx/babirusa-codeserver")
+# User-defined network codespaces are attached to (reachable as codespace-<username>),
+# and containers connected to it so they can reach them (the proxy); empty = default bridge
+CODESPACE_NETWORK = getenv("CODESPACE_NETWORK", "babirusa-codespaces")
+CODESPACE_NETWORK_PEERS = [
+    name.strip() for name in getenv("CODESPACE_NETWORK_PEERS", "mitm_proxy").split(",") if name.strip()
+]
+# Recorded on every codespace container as the babirusa.template label
+CODESPACE_TEMPLATE_VERSION = getenv("CODESPACE_TEMPLATE_VERSION", "1")
+# Limits of one codespace container, and the host budget they are admitted
+# against (0 = unlimited; launches beyond the budget wait in a queue)
+CODESPACE_MEMORY_MB = float(getenv("CODESPACE_MEMORY_MB", "512"))
+CODESPACE_CPUS = float(getenv("CODESPACE_CPUS", "0.5"))
+CODESPACE_MEMORY_BUDGET_MB = float(getenv("CODESPACE_MEMORY_BUDGET_MB", "0"))
+CODESPACE_CPU_BUDGET = float(getenv("CODESPACE_CPU_BUDGET", "0"))
+# Started, unassigned codespaces kept ready for new pupils (0 = disabled)
+CODESPACE_WARM_POOL_SIZE = int(getenv("CODESPACE_WARM_POOL_SIZE", "0"))
+# A launch claimed by a worker that stays silent this long is taken over (seconds)
+CODESPACE_LAUNCH_LEASE = float(getenv("CODESPACE_LAUNCH_LEASE", "300"))
+# How user-<name>-* dirs are filled from the templates: reflink, copy
+WORKSPACE_MODE = getenv("WORKSPACE_MODE", "reflink")
+# FileManager's per-project file index: inotify where available, otherwise
+# directory mtimes rechecked at most this often (seconds); projects kept in memory.
+# Off by default once DOCKER_HOSTS has a TCP host: its codespaces write over
+# shared storage, which the backend's inotify does not see
+_REMOTE_DOCKER_HOSTS = any(
+    not item.split("=", 1)[-1].strip().startswith("unix://")
+    for item in (DOCKER_HOSTS or "").split(",")
+    if item.strip()
+)
+FILE_INDEX_INOTIFY = (
+    getenv("FILE_INDEX_INOTIFY") or ("false" if _REMOTE_DOCKER_HOSTS else "true")
+).lower() == "true"
+FILE_INDEX_POLL_INTERVAL = float(getenv("FILE_INDEX_POLL_INTERVAL", "2"))
+FILE_INDEX_MAX_PROJECTS = int(getenv("FILE_INDEX_MAX_PROJECTS", "64"))
+# Trigram index narrowing search_in_files to files that can match; files above
+# the size limit are always scanned
+SEARCH_INDEX = getenv("SEARCH_INDEX", "true").lower() == "true"
+SEARCH_INDEX_MAX_FILE_KB = int(getenv("SEARCH_INDEX_MAX_FILE_KB", "512"))
+SEARCH_INDEX_MAX_PROJECTS = int(getenv("SEARCH_INDEX_MAX_PROJECTS", "16"))
+# Most FileManager reads at once (a whole file, a byte range or a window of lines);
+# larger files are only read in ranges
+FILE_READ_MAX_KB = int(getenv("FILE_READ_MAX_KB", "1024"))
+# Search across a group's projects: worker processes, default matches per
+# pupil and the time the whole search may take (seconds)
+GROUP_SEARCH_WORKERS = int(getenv("GROUP_SEARCH_WORKERS", "4"))
+GROUP_SEARCH_MAX_RESULTS = int(getenv("GROUP_SEARCH_MAX_RESULTS", "100"))
+GROUP_SEARCH_DEADLINE = float(getenv("GROUP_SEARCH_DEADLINE", "30"))
+# Background provisioning of new pupils: workers, retries of a failed step
+# and the first retry delay (seconds, doubled on every attempt)
+PROVISION_WORKERS = int(getenv("PROVISION_WORKERS", "4"))
+PROVISION_MAX_ATTEMPTS = int(getenv("PROVISION_MAX_ATTEMPTS", "5"))
+PROVISION_RETRY_DELAY = float(getenv("PROVISION_RETRY_DELAY", "5"))
+
+# Pupil.container_status follows Docker events; full resync this often (seconds)
+STATUS_RECONCILE_INTERVAL = float(getenv("STATUS_RECONCILE_INTERVAL", "300"))
+STATUS_BATCH_INTERVAL = float(getenv("STATUS_BATCH_INTERVAL", "0.5"))
@@ -0,0 +1,30 @@
+"""Data fixes applied before init_beanie builds the indexes."""
+
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+
+async def dedupe_userips(collection: AsyncIOMotorCollection) -> int:
+    """
+    Keeps the newest UserIp of each pupil and deletes the others, which
+    concurrent launches used to leave behind; the unique index on username
+    can't be built while they exist. Returns how many rows were deleted.
+    """
+    duplicates = collection.aggregate([
+        {"$sort": {"_id": -1}},
+        {"$group": {"_id": "$username", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    stale = [_id async for group in duplicates for _id in group["ids"][1:]]
+    if not stale:
+        return 0
+    result = await collection.delete_many({"_id": {"$in": stale}})
+    logger.warning("Deleted %d duplicate UserIp rows", result.deleted_count)
+    return result.deleted_count
+
+
+async def migrate(database: AsyncIOMotorDatabase) -> None:
+    await dedupe_userips(database["UserIp"])
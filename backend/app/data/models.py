@@ -1,4 +1,6 @@
-from beanie import Document, Link
+from datetime import datetime
+
+from beanie import Document, Indexed, Link
 from pydantic import Field, BaseModel
 from typing import Optional, List
 from uuid import UUID, uuid4
@@ -24,11 +26,26 @@ class Pupil(Document):
     lastname: str
     hashed_password: str 
     container_status: str  #running, exited, dead
+    host: Optional[str] = None  # Docker host holding the codespace files
+    container_id: Optional[str] = None
+    # created, dirs_ready, container_started, ip_bound, ready
+    provision_state: str = "ready"
+    provision_error: Optional[str] = None
     
 class UserIp(Document):
-    username: str
-    ip: str
+    username: Indexed(str, unique=True)
+    ip: str  # "" while the codespace is being launched
     container_id: str
+    host: Optional[str] = None  # Docker host name, None = default host
+    port: Optional[int] = None  # published code-server port, None = 8080 on ip
+    claimed_at: Optional[datetime] = None  # launch placeholder: when it was claimed
+    owner: Optional[str] = None  # launch placeholder: the backend host that claimed it
+
+class WarmContainer(Document):
+    slot: str
+    container_id: str
+    ip: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
     
 class SecretAdmin(Document):
     """
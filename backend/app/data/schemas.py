@@ -1,6 +1,6 @@
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class RequestTeacher(BaseModel):
@@ -14,6 +14,24 @@ class Pupil_(BaseModel):
     firstname: str
     lastname: str
     container_status: str
+    provision_state: Optional[str] = None
+    provision_error: Optional[str] = None
+
+
+class CodespaceState(BaseModel):
+    username: str
+    container_id: str
+    container_status: str  # live, from Docker
+    recorded_status: Optional[str]  # Pupil.container_status
+    host: Optional[str] = None  # Docker host the container runs on
+
+
+class ImageStatus(BaseModel):
+    host: str
+    image: str
+    status: str  # pulling, ready, failed
+    digest: Optional[str] = None
+    error: Optional[str] = None
 
 
 class Teacher_(BaseModel):
@@ -34,6 +52,22 @@ class PupilCreate(BaseModel):
     lastname: str
 
 
+class LaunchQueue(BaseModel):
+    username: str
+    position: Optional[int]  # 1-based, None when not waiting for capacity
+    waiting: int
+    committed_memory_mb: float
+    committed_cpus: float
+
+
+class PupilImportEvent(BaseModel):
+    username: str
+    status: str  # rejected, created, ready, failed
+    id: Optional[str] = None
+    ip: Optional[str] = None
+    detail: Optional[str] = None
+
+
 class RequestLogInUser(BaseModel):
     login: str
     password: str
@@ -81,12 +115,36 @@ class SearchResult(BaseModel):
     relative_path: str
     line_number: int
     line_content: str
+    context_before: Optional[List[str]] = None  # only with context lines requested
+    context_after: Optional[List[str]] = None
+
+
+class GroupSearch(BaseModel):
+    pattern: str
+    is_regex: bool = False
+    case_sensitive: bool = False
+    file_pattern: Optional[str] = None
+    # per pupil, GROUP_SEARCH_MAX_RESULTS by default
+    max_results: Optional[int] = Field(default=None, ge=1, le=10000)
+
+
+class GroupSearchEvent(BaseModel):
+    username: str
+    status: str  # done, failed, timeout
+    results: List[SearchResult] = []
+    truncated: bool = False
+    detail: Optional[str] = None
 
 
 class FileContent(BaseModel):
     relative_path: str
     content: str
-    size: int
+    size: int  # of the whole file
+    # set by ranged reads: where the content starts/ends, and whether it was cut at the size limit
+    offset: Optional[int] = None
+    start_line: Optional[int] = None
+    end_line: Optional[int] = None
+    truncated: Optional[bool] = None
 
 
 class OperationResult(BaseModel):
@@ -7,17 +7,39 @@ from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from app import ENVIRONMENT, MONGO_DSN, projectConfig
+from app.data.migrations import migrate
 from app.routers import group, homework, pupil, system, teacher
+from app.utils import group_search
+from app.utils.codespaces import (
+    check_storage_later,
+    release_launches,
+    unshare_workspaces_later,
+    warm_pool,
+)
+from app.utils.images import image_cache
+from app.utils.provisioning import provisioner
+from app.utils.status_reconciler import status_reconciler
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     client = AsyncIOMotorClient(MONGO_DSN, uuidRepresentation="standard")
+    await migrate(client.get_default_database())
     await init_beanie(
         database=client.get_default_database(),
         document_models=Document.__subclasses__() + UnionDoc.__subclasses__(),
     )
+    await release_launches()
+    image_cache.prepare()
+    check_storage_later()
+    unshare_workspaces_later()
+    warm_pool.refill_later()
+    status_reconciler.start()
+    provisioner.start()
     yield
+    provisioner.stop()
+    status_reconciler.stop()
+    group_search.shutdown()
 
 
 if ENVIRONMENT == "prod":
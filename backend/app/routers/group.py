@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends, Body, Query
+from fastapi.responses import StreamingResponse
 
 from app.data.models import Teacher, Pupil, Group
 from app.data import schemas
 from app.utils.error import Error
+from app.utils.group_search import search_group_ndjson
+from app.utils.search_stream import check_pattern
 from app.utils.security import get_current_user
 
 
@@ -238,3 +241,16 @@ async def remove_pupils_from_group(group_id: Annotated[str, Query()],
         ]
     )
 
+
+@router.post("/{group_id}/search")
+async def search_group_projects(group_id: str, request: schemas.GroupSearch,
+                                current_teacher: Teacher = Depends(get_current_user)) -> StreamingResponse:
+    group = await Group.find_one(Group.id == uuid.UUID(group_id), fetch_links=True)
+    if not group or group.teacher.id != current_teacher.id:
+        raise Error.GROUP_NOT_FOUND
+    check_pattern(request.pattern, request.is_regex)
+
+    usernames = [pupil.username for pupil in group.pupils or []]
+    return StreamingResponse(
+        search_group_ndjson(usernames, request), media_type="application/x-ndjson"
+    )
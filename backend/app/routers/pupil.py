@@ -1,17 +1,24 @@
 import logging
 import os
 import uuid
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 
-import docker
 from app import SECRET_KEY_USER
 from app.data import schemas
-from app.data.models import Pupil, Teacher, UserIp
-from app.utils.codespaces import check_container_status, launch_codespace
+from app.data.models import Group, Pupil, Teacher, UserIp
+from app.utils.admission import PROVISIONING, QUEUED, admission
+from app.utils.codespaces import CREATED, start_later
+from app.utils.placement import placement
 from app.utils.error import Error
+from app.utils.images import image_cache
+from app.utils.provisioning import provisioner
+from app.utils.file_manager import FileManager
+from app.utils.pupil_import import import_pupils, parse_pupils_csv
+from app.utils.search_stream import MEDIA_TYPES, NDJSON, SSE, check_pattern, stream_search
 from app.utils.security import get_current_user
 from cryptography.fernet import Fernet
-from fastapi import APIRouter, Depends, Path
+from fastapi import APIRouter, Depends, Path, Query, UploadFile
+from fastapi.responses import StreamingResponse
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,6 +36,7 @@ async def teacher_create_pupil(
     pupil_exists = await Pupil.find_one(Pupil.username == request.username)
     if pupil_exists:
         raise Error.LOGIN_EXISTS
+    image_cache.check()
 
     hashed_password = cipher.encrypt(request.password.encode("utf-8")).decode("utf-8")
     pupil = Pupil(
@@ -36,7 +44,8 @@ async def teacher_create_pupil(
         firstname=request.firstname,
         lastname=request.lastname,
         hashed_password=hashed_password,
-        container_status="running",
+        container_status=PROVISIONING,
+        provision_state=CREATED,
     )
 
     await pupil.create()
@@ -46,7 +55,10 @@ async def teacher_create_pupil(
     current_teacher.pupils.append(pupil)
     await current_teacher.save()
 
-    await launch_codespace(pupil.username, request.password)
+    # answer now; the codespace is provisioned in the background
+    provisioner.submit(pupil.username, teacher_id=str(current_teacher.id))
+    if admission.would_wait():
+        pupil.container_status = QUEUED
 
     return schemas.Pupil_(
         id=str(pupil.id),
@@ -54,6 +66,32 @@ async def teacher_create_pupil(
         firstname=pupil.firstname,
         lastname=pupil.lastname,
         container_status=pupil.container_status,
+        provision_state=pupil.provision_state,
+    )
+
+
+@router.post("/import")
+async def teacher_import_pupils(
+    request: List[schemas.PupilCreate], current_teacher: Teacher = Depends(get_current_user)
+) -> StreamingResponse:
+    image_cache.check()
+    return StreamingResponse(
+        import_pupils(request, current_teacher), media_type="application/x-ndjson"
+    )
+
+
+@router.post("/import/csv")
+async def teacher_import_pupils_csv(
+    file: UploadFile, current_teacher: Teacher = Depends(get_current_user)
+) -> StreamingResponse:
+    try:
+        content = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise Error.INVALID_IMPORT_FILE
+    pupils, rejected = parse_pupils_csv(content)
+    image_cache.check()
+    return StreamingResponse(
+        import_pupils(pupils, current_teacher, rejected), media_type="application/x-ndjson"
     )
 
 
@@ -62,17 +100,87 @@ async def conteiner(username: str, start: bool) -> str:
     userip = await UserIp.find_one(UserIp.username == username)
     if not userip:
         raise Error.PUPIL_NOT_FOUND
+    if not userip.container_id:
+        raise Error.CODESPACE_LAUNCHING
 
-    client = docker.from_env()
-    container = client.containers.get(userip.container_id)
+    docker = placement.docker_for(userip.host)
     if start:
-        container.start()
+        if admission.would_wait(userip.host):
+            start_later(username, userip.container_id, docker, userip.host)
+            return QUEUED.upper()
+        await admission.acquire(username, host=userip.host)
+        try:
+            await docker.start(userip.container_id)
+        except BaseException:
+            admission.release(username)
+            raise
+        admission.started(username)
     else:
-        container.stop()
+        await docker.stop(userip.container_id)
+        admission.release(username)
 
     return "OK"
 
 
+@router.get("/{username}/queue")
+async def get_launch_queue_position(
+    username: str, _: Teacher = Depends(get_current_user)
+) -> schemas.LaunchQueue:
+    # the budget and queue of the pupil's Docker host
+    host_admission = admission.of(username)
+    memory, cpus = host_admission.committed
+    return schemas.LaunchQueue(
+        username=username,
+        position=host_admission.position(username),
+        waiting=host_admission.queued,
+        committed_memory_mb=memory,
+        committed_cpus=cpus,
+    )
+
+
+async def _teaches(teacher: Teacher, pupil: Pupil) -> bool:
+    """Whether the teacher created the pupil or has them in one of their groups."""
+    if any(p.id == pupil.id for p in teacher.pupils or []):
+        return True
+    group = await Group.find_one(
+        Group.teacher.id == teacher.id, {"pupils._id": pupil.id}, fetch_links=True
+    )
+    return group is not None
+
+
+@router.get("/{username}/search")
+async def search_pupil_project(
+    username: str,
+    pattern: str,
+    is_regex: bool = False,
+    case_sensitive: bool = False,
+    file_pattern: Optional[str] = None,
+    max_results: Annotated[int, Query(ge=1, le=10000)] = 1000,
+    context: Annotated[int, Query(ge=0, le=10)] = 0,
+    format: Annotated[str, Query(pattern=f"^({NDJSON}|{SSE})$")] = NDJSON,
+    current_teacher: Teacher = Depends(get_current_user),
+) -> StreamingResponse:
+    pupil = await Pupil.find_one(Pupil.username == username)
+    if not pupil or not await _teaches(current_teacher, pupil):
+        raise Error.PUPIL_NOT_FOUND
+    check_pattern(pattern, is_regex)
+    lines = stream_search(
+        FileManager(username),
+        pattern,
+        is_regex=is_regex,
+        case_sensitive=case_sensitive,
+        file_pattern=file_pattern,
+        max_results=max_results,
+        context=context,
+        fmt=format,
+    )
+    return StreamingResponse(
+        lines,
+        media_type=MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/{pupil_id}/password")
 async def teacher_get_pupil_passwor(
     pupil_id: Annotated[str, Path()], _: Teacher = Depends(get_current_user)
@@ -92,10 +200,7 @@ async def teacher_get_pupil_passwor(
 async def teacher_get_pupil_all(
     current_teacher: Teacher = Depends(get_current_user),
 ) -> List[schemas.Pupil_]:
-    print(current_teacher.pupils, flush=True)
-    # logger.info(current_teacher.pupils)
-    await check_container_status(current_teacher.pupils)
-
+    # container_status is kept current by the status reconciler
     return [
         schemas.Pupil_(
             id=str(pupil.id),
@@ -103,6 +208,8 @@ async def teacher_get_pupil_all(
             firstname=pupil.firstname,
             lastname=pupil.lastname,
             container_status=pupil.container_status,
+            provision_state=pupil.provision_state,
+            provision_error=pupil.provision_error,
         )
         for pupil in current_teacher.pupils
     ]
@@ -121,9 +228,9 @@ async def delete_pupil(
     if not userip:
         raise Error.USER_IP_NOT_FOUND
 
-    client = docker.from_env()
-    container = client.containers.get(userip.container_id)
-    container.remove(force=True, v=True)
+    if userip.container_id:
+        await placement.docker_for(userip.host).remove(userip.container_id, force=True, v=True)
+    admission.release(pupil.username)
 
     await userip.delete()
 
@@ -3,10 +3,12 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 from datetime import timedelta
 
-from app.data.models import Teacher
+from app.data.models import Pupil, Teacher, UserIp
 from app.data import schemas
 from app.utils.error import Error
 from app.utils.auth import create_user, authenticate_user
+from app.utils.codespaces import codespace_statuses_by_host
+from app.utils.images import image_cache
 from app.utils.security import verify_password, get_current_user
 
 from typing import Annotated
@@ -64,6 +66,49 @@ async def get_all_teachers(x_admin_password: Annotated[str, Header()] ) -> List[
     ) for t in teachers]
 
 
+@router.get("/codespaces")
+async def get_all_codespaces(x_admin_password: Annotated[str, Header()]) -> List[schemas.CodespaceState]:
+    if not ADMIN_PANEL_PASSWORD or x_admin_password != ADMIN_PANEL_PASSWORD:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    userips = await UserIp.find(UserIp.container_id != "").to_list()
+    statuses = await codespace_statuses_by_host(userips)
+    pupils = await Pupil.find({"username": {"$in": [u.username for u in userips]}}).to_list()
+    recorded = {p.username: p.container_status for p in pupils}
+
+    return [schemas.CodespaceState(
+        username=u.username,
+        container_id=u.container_id,
+        container_status=statuses[u.container_id],
+        recorded_status=recorded.get(u.username),
+        host=u.host
+    ) for u in userips]
+
+
+@router.get("/codespaces/images")
+async def get_codespace_images(x_admin_password: Annotated[str, Header()]) -> List[schemas.ImageStatus]:
+    if not ADMIN_PANEL_PASSWORD or x_admin_password != ADMIN_PANEL_PASSWORD:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    return [schemas.ImageStatus(
+        host=host,
+        image=image,
+        status=state.status,
+        digest=state.digest,
+        error=state.error
+    ) for (host, image), state in image_cache.states().items()]
+
+
+@router.post("/codespaces/images")
+async def prepull_codespace_image(image: str, x_admin_password: Annotated[str, Header()]) -> List[schemas.ImageStatus]:
+    """Pulls an image version on every Docker host in the background, ahead of a rollout."""
+    if not ADMIN_PANEL_PASSWORD or x_admin_password != ADMIN_PANEL_PASSWORD:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    image_cache.prepare(image)
+    return await get_codespace_images(x_admin_password)
+
+
 @router.delete("/{teacher_id}")
 async def delete_teacher(teacher_id: str, x_admin_password: Annotated[str, Header()]) -> str:
     if not ADMIN_PANEL_PASSWORD or x_admin_password != ADMIN_PANEL_PASSWORD:
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.utils.admission import PRIORITY_BULK, AdmissionController, HostAdmission
+from app.utils.placement import DockerHost, PlacementRegistry
+
+
+@pytest.mark.asyncio
+async def test_launches_wait_for_capacity_in_order():
+    admission = AdmissionController(memory_budget_mb=1024, cpu_budget=0, memory_mb=512, cpus=0.5)
+
+    await admission.acquire("pupil_a")
+    await admission.acquire("pupil_b")
+    admission.started("pupil_a")
+    admission.started("pupil_b")
+    assert admission.committed == (1024, 1.0)
+    assert admission.would_wait()
+
+    bulk = asyncio.create_task(admission.acquire("pupil_c", PRIORITY_BULK))
+    first = asyncio.create_task(admission.acquire("pupil_d"))
+    second = asyncio.create_task(admission.acquire("pupil_e"))
+    await asyncio.sleep(0)
+
+    assert admission.queued == 3
+    assert admission.position("pupil_d") == 1
+    assert admission.position("pupil_e") == 2
+    assert admission.position("pupil_c") == 3
+    assert admission.position("pupil_a") is None
+
+    admission.release("pupil_a")
+    await asyncio.sleep(0)
+    assert first.done() and not second.done() and not bulk.done()
+
+    # pupil_b stopped outside the API, pupil_d is still starting
+    second.cancel()
+    await asyncio.sleep(0)
+    admission.sync([])
+    await asyncio.sleep(0)
+    assert bulk.done()
+    assert admission.queued == 0
+    assert admission.committed == (1024, 1.0)
+
+
+@pytest.mark.asyncio
+async def test_budgets_are_per_host():
+    registry = PlacementRegistry([DockerHost("local", None, 0), DockerHost("node2", None, 0, "10.0.0.2")])
+    registry.mark_shared("node2")
+    admission = HostAdmission(registry, memory_budget_mb=512, cpu_budget=0, memory_mb=512, cpus=0.5)
+
+    await admission.acquire("pupil_a", host="local")
+    admission.started("pupil_a")
+    assert admission.would_wait("local") and not admission.would_wait("node2")
+    assert not admission.would_wait()  # node2 still has room
+
+    # node2's budget is its own: the local codespace does not count there
+    await asyncio.wait_for(admission.acquire("pupil_b", host="node2"), 1)
+    assert admission.would_wait()
+    assert admission.of("pupil_b").committed == (512, 0.5)
+
+    waiting = asyncio.create_task(admission.acquire("pupil_c", host="node2"))
+    await asyncio.sleep(0)
+    assert admission.position("pupil_c") == 1 and admission.host("local").queued == 0
+
+    admission.sync({None: ["pupil_a"], "node2": []})
+    await asyncio.sleep(0)
+    # pupil_b is still starting as far as node2 knows, pupil_c keeps waiting
+    assert not waiting.done()
+    admission.release("pupil_b")
+    await asyncio.sleep(0)
+    assert waiting.done()
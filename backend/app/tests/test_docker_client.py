@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import docker
+import pytest
+from fastapi import HTTPException
+from unittest.mock import MagicMock
+
+from app.utils.docker_client import AsyncDocker
+
+
+def slow_docker(delay):
+    client = MagicMock()
+
+    def pull(image_name):
+        time.sleep(delay)
+        return MagicMock(id="sha256:test")
+
+    def run(image_name, **kwargs):
+        time.sleep(delay)
+        container = MagicMock()
+        container.id = "container123"
+        return container
+
+    client.images.get.side_effect = docker.errors.ImageNotFound("missing")
+    client.images.pull.side_effect = pull
+    client.containers.run.side_effect = run
+    return client
+
+
+@pytest.mark.asyncio
+async def test_ping_latency_flat_during_provisioning(client):
+    fake = slow_docker(0.5)
+    docker_client = AsyncDocker(client_factory=lambda: fake, workers=4, concurrency=4)
+
+    async def provision():
+        await docker_client.ensure_image("skfx/babirusa-codeserver")
+        return await docker_client.run_container("skfx/babirusa-codeserver")
+
+    provisioning = [asyncio.create_task(provision()) for _ in range(4)]
+
+    latencies = []
+    while not all(task.done() for task in provisioning):
+        started = time.perf_counter()
+        response = await client.get("/api/system/ping")
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+        await asyncio.sleep(0.02)
+
+    assert [task.result() for task in provisioning] == ["container123"] * 4
+    assert len(latencies) > 10
+    assert max(latencies) < 0.25
+    docker_client.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_timeout_raises_http_error():
+    fake = slow_docker(0.5)
+    docker_client = AsyncDocker(client_factory=lambda: fake, timeout=0.05)
+
+    with pytest.raises(HTTPException) as error:
+        await docker_client.run_container("skfx/babirusa-codeserver")
+
+    assert error.value.status_code == 504
+    docker_client.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_container_reuses_named_container():
+    fake = MagicMock()
+    fake.containers.run.side_effect = docker.errors.APIError(
+        "Conflict", response=MagicMock(status_code=409)
+    )
+    fake.containers.get.return_value.id = "leftover123"
+    fake.containers.get.return_value.status = "exited"
+    docker_client = AsyncDocker(client_factory=lambda: fake)
+
+    container_id = await docker_client.run_container(
+        "skfx/babirusa-codeserver", name="codespace-john"
+    )
+
+    assert container_id == "leftover123"
+    fake.containers.get.assert_called_once_with("codespace-john")
+    fake.containers.get.return_value.start.assert_called_once()
+    docker_client.shutdown()
@@ -0,0 +1,121 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from app.utils.file_index import FileIndex
+
+
+def make_project(root):
+    os.makedirs(os.path.join(root, "src", "pkg"))
+    for rel, content in (("main.py", "print(1)\n"), ("src/a.py", "a"), ("src/pkg/b.py", "bb")):
+        with open(os.path.join(root, rel), "w") as f:
+            f.write(content)
+    os.symlink(os.path.join(root, "src"), os.path.join(root, "linked"))
+
+
+def listing(index):
+    return [(entry.relative_path, entry.size) for entry in index.entries()]
+
+
+def test_index_matches_walk(tmp_path):
+    root = str(tmp_path)
+    make_project(root)
+
+    index = FileIndex(root, use_inotify=False)
+
+    walked = sorted(
+        os.path.relpath(os.path.join(base, name), root)
+        for base, _dirs, files in os.walk(root)
+        for name in files
+    )
+    assert [entry.relative_path for entry in index.entries()] == walked
+    assert listing(index) == [("main.py", 9), ("src/a.py", 1), ("src/pkg/b.py", 2)]
+
+
+def test_polling_picks_up_changes(tmp_path):
+    root = str(tmp_path)
+    make_project(root)
+    index = FileIndex(root, use_inotify=False, poll_interval=0)
+    first = index.entries()
+    assert index.entries() is first  # unchanged project: the same list
+
+    with open(os.path.join(root, "src", "a.py"), "w") as f:
+        f.write("changed")  # in place: the directory's mtime stays
+    os.makedirs(os.path.join(root, "tests"))
+    with open(os.path.join(root, "tests", "test_a.py"), "w") as f:
+        f.write("")
+    os.remove(os.path.join(root, "src", "pkg", "b.py"))
+    os.rmdir(os.path.join(root, "src", "pkg"))
+
+    assert listing(index) == [("main.py", 9), ("src/a.py", 7), ("tests/test_a.py", 0)]
+
+
+def test_invalidate_skips_poll_interval(tmp_path):
+    root = str(tmp_path)
+    make_project(root)
+    index = FileIndex(root, use_inotify=False, poll_interval=3600)
+    index.entries()
+
+    path = os.path.join(root, "src", "new", "c.py")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write("ccc")
+    assert ("src/new/c.py", 3) not in listing(index)
+
+    index.invalidate(path)
+    assert ("src/new/c.py", 3) in listing(index)
+
+
+def test_inotify_picks_up_changes(tmp_path):
+    root = str(tmp_path)
+    make_project(root)
+    index = FileIndex(root, use_inotify=True, poll_interval=3600)
+    if not index.watching:
+        pytest.skip("inotify is not available")
+    index.entries()
+
+    with open(os.path.join(root, "src", "pkg", "b.py"), "a") as f:
+        f.write("b")
+    os.rename(os.path.join(root, "src", "pkg"), os.path.join(root, "pkg"))
+    os.remove(os.path.join(root, "main.py"))
+
+    assert listing(index) == [("pkg/b.py", 3), ("src/a.py", 1)]
+    index.close()
+
+
+def test_binary_cache_is_shared_under_the_lock(tmp_path):
+    root = str(tmp_path)
+    make_project(root)
+    index = FileIndex(root, use_inotify=False)
+    main = next(e for e in index.entries() if e.relative_path == "main.py")
+
+    answers = []
+    with index._lock:  # a query in another thread is pruning the cache
+        reader = threading.Thread(
+            target=lambda: answers.append(index.is_binary(main.path, main.mtime_ns, main.size))
+        )
+        reader.start()
+        reader.join(0.2)
+        assert reader.is_alive() and not answers
+    reader.join()
+
+    assert answers == [False]
+    assert [e.relative_path for e in index.text_entries()] == ["main.py", "src/a.py", "src/pkg/b.py"]
+
+
+@pytest.mark.parametrize("docker_hosts, inotify", [
+    ("", True),
+    ("local=unix:///var/run/docker.sock@40", True),
+    ("local=unix:///var/run/docker.sock@40,node2=tcp://10.0.0.2:2375@60", False),
+])
+def test_remote_docker_hosts_turn_inotify_off(docker_hosts, inotify):
+    # files written over shared storage by a remote host never reach local inotify
+    env = {**os.environ, "DOCKER_HOSTS": docker_hosts, "FILE_INDEX_INOTIFY": ""}
+    output = subprocess.run(
+        [sys.executable, "-c", "import app; print(app.FILE_INDEX_INOTIFY)"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    assert output.strip() == str(inotify)
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from app.data.schemas import FileInfo
+from app.utils import file_manager, homework_checker
+from app.utils.file_manager import FileManager
+
+
+@pytest.fixture
+def fm(tmp_path, mocker):
+    mocker.patch.object(file_manager, "BABIRUSA_HOME", str(tmp_path))
+    mocker.patch.object(homework_checker, "BABIRUSA_HOME", str(tmp_path))
+    # 1 KiB ceiling: the dataset below is only read in ranges, through mmap
+    mocker.patch.object(file_manager, "FILE_READ_MAX_KB", 1)
+    prj = tmp_path / "user-reads-prj"
+    prj.mkdir()
+    (prj / "main.py").write_text("print('eval')\n")
+    (prj / "model.bin").write_bytes(b"\x00\x01eval\x02" * 100)
+    (prj / "data.csv").write_text("".join(f"{n},eval{n}\n" for n in range(1000)))
+    return FileManager("reads")
+
+
+def test_binaries_are_sniffed_and_skipped(fm, mocker):
+    assert fm.is_binary("model.bin")
+    assert not fm.is_binary("main.py")
+    assert [r.relative_path for r in fm.iter_search("eval", max_results=2)] == [
+        "data.csv", "data.csv"
+    ]
+    assert "model.bin" not in {r.relative_path for r in fm.search_in_files("eval")}
+
+    sniff = mocker.patch("app.utils.file_index.sniff_binary")
+    assert fm.is_binary("model.bin")  # cached for the same mtime and size
+    sniff.assert_not_called()
+
+
+def test_large_files_are_read_in_ranges(fm):
+    with pytest.raises(ValueError):
+        fm.read_file("data.csv")
+
+    window = fm.read_lines("data.csv", start_line=501, count=3)
+    assert window.content == "500,eval500\n501,eval501\n502,eval502\n"
+    assert (window.start_line, window.end_line, window.truncated) == (501, 503, False)
+    assert fm.read_lines("data.csv", start_line=2000).content == ""
+
+    cut = fm.read_lines("data.csv", count=1000)
+    assert len(cut.content) == 1024 and cut.truncated
+
+    part = fm.read_range("data.csv", offset=2, length=6)
+    assert (part.content, part.offset, part.truncated) == ("eval0\n", 2, False)
+    assert fm.read_range("main.py").content == "print('eval')\n"
+
+
+def test_checker_tools(fm):
+    def tool(name, **arguments):
+        return json.loads(homework_checker._execute_tool(name, {"username": "reads", **arguments}, ["reads"]))
+
+    listing = {f["path"]: f["binary"] for f in tool("list_files")}
+    assert listing == {"data.csv": False, "main.py": False, "model.bin": True}
+    assert "error" in tool("read_file", path="model.bin")
+    assert tool("read_file", path="main.py")["content"] == "print('eval')\n"
+
+    window = tool("read_file", path="data.csv")
+    assert (window["start_line"], window["end_line"]) == (1, homework_checker.TOOL_WINDOW_LINES)
+    assert tool("read_file", path="data.csv", start_line=10, line_count=1)["content"] == "9,eval9\n"
+    assert len(tool("search_in_files", text="eval")) == homework_checker.TOOL_MAX_MATCHES
+
+
+def test_checker_survives_a_stale_listing(fm, tmp_path, mocker):
+    other = tmp_path / "user-reads2-prj"
+    other.mkdir()
+    (other / "main.py").write_text("print('ok')\n")
+    gone = FileInfo(name="main.py", relative_path="main.py", size=14, is_directory=False)
+    stale = {"reads": [gone], "reads2": [gone]}
+    mocker.patch.object(
+        FileManager, "find_by_name", autospec=True,
+        side_effect=lambda self, pattern: stale[self._username],
+    )
+    (tmp_path / "user-reads-prj" / "main.py").unlink()  # after the listing was taken
+
+    codes = homework_checker._gather_pupil_codes(["reads", "reads2"], "main.py")
+
+    assert codes["reads"].startswith("[ОШИБКА: File not found")
+    assert codes["reads2"] == "print('ok')\n"
@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pydantic import ValidationError
+
+from app.data import schemas
+from app.utils import file_index, file_manager, group_search, search_index
+from app.utils.group_search import search_group
+
+
+def make_projects(root):
+    for username, source in (
+        ("gs_anna", "x = eval(input())\ny = eval('2')\nz = eval('3')\n"),
+        ("gs_boris", "# TODO: use eval\nprint(1)\n"),
+        ("gs_clara", "print('no match here')\n"),
+    ):
+        prj = root / f"user-{username}-prj"
+        prj.mkdir()
+        (prj / "main.py").write_text(source)
+
+
+@pytest.mark.asyncio
+async def test_group_search_streams_per_pupil(tmp_path, mocker):
+    make_projects(tmp_path)
+    mocker.patch.object(file_manager, "BABIRUSA_HOME", str(tmp_path))
+    # the process pool is swapped for threads, the search itself is the same
+    mocker.patch.object(group_search, "_pool", ThreadPoolExecutor(2))
+
+    request = schemas.GroupSearch(pattern="eval(", max_results=2)
+    events = {
+        event.username: event
+        async for event in search_group(["gs_anna", "gs_boris", "gs_clara", "gs_nobody"], request)
+    }
+
+    assert {name: event.status for name, event in events.items()} == {
+        "gs_anna": "done", "gs_boris": "done", "gs_clara": "done", "gs_nobody": "done"
+    }
+    assert [r.line_number for r in events["gs_anna"].results] == [1, 2]
+    assert events["gs_anna"].truncated
+    assert events["gs_boris"].results == []
+    assert events["gs_clara"].results == [] and not events["gs_clara"].truncated
+
+    request = schemas.GroupSearch(pattern=r"eval\b", is_regex=True)
+    events = [event async for event in search_group(["gs_boris"], request)]
+    assert [r.line_content for r in events[0].results] == ["# TODO: use eval"]
+
+
+@pytest.mark.asyncio
+async def test_group_search_deadline(mocker):
+    def search(username, request, max_results):
+        if username == "slow":
+            time.sleep(1)
+        return [("main.py", 1, "eval()")], False
+
+    mocker.patch.object(group_search, "_pool", ThreadPoolExecutor(2))
+    mocker.patch.object(group_search, "_search_project", search)
+
+    started = time.monotonic()
+    events = [
+        event
+        async for event in search_group(
+            ["fast", "slow"], schemas.GroupSearch(pattern="eval"), deadline=0.3
+        )
+    ]
+
+    assert time.monotonic() - started < 0.9
+    assert [(e.username, e.status) for e in events] == [("fast", "done"), ("slow", "timeout")]
+
+
+@pytest.mark.asyncio
+async def test_group_search_pool_workers(tmp_path, monkeypatch):
+    make_projects(tmp_path)
+    monkeypatch.setattr(file_index, "_indexes", file_index._indexes.copy())
+    monkeypatch.setattr(search_index, "_indexes", search_index._indexes.copy())
+    file_index.file_index(str(tmp_path / "user-gs_anna-prj")).entries()
+
+    group_search._init_worker()
+    assert not file_index._indexes and not search_index._indexes
+
+    monkeypatch.setattr(group_search, "_pool", None)
+    try:
+        assert group_search._executor()._mp_context.get_start_method() == "spawn"
+        events = [e async for e in search_group(["gs_nobody"], schemas.GroupSearch(pattern="x"))]
+        assert [(e.username, e.status) for e in events] == [("gs_nobody", "done")]
+    finally:
+        group_search.shutdown()
+
+    for bad in (0, 10_001):
+        with pytest.raises(ValidationError):
+            schemas.GroupSearch(pattern="x", max_results=bad)
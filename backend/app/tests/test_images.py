@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.utils.images import FAILED, READY, ImageCache
+from app.utils.placement import DockerHost, PlacementRegistry
+
+
+@pytest.mark.asyncio
+async def test_launches_refused_until_image_is_ready():
+    pulled = asyncio.Event()
+
+    async def ensure_image(image):
+        await pulled.wait()
+        return "sha256:abc"
+
+    local = MagicMock()
+    local.ensure_image = ensure_image
+    broken = MagicMock()
+    broken.ensure_image = AsyncMock(side_effect=OSError("registry unreachable"))
+    registry = PlacementRegistry([
+        DockerHost("local", local, 0),
+        DockerHost("node2", broken, 0, "10.0.0.2"),
+    ])
+    cache = ImageCache(registry, "skfx/babirusa-codeserver")
+
+    cache.prepare()
+    with pytest.raises(Exception) as e:
+        cache.require(registry.get("local"))
+    assert e.value.status_code == 503
+    with pytest.raises(Exception):
+        cache.check()
+
+    pulled.set()
+    assert await cache.wait(registry.get("local")) == "sha256:abc"
+    assert cache.require(registry.get("local")) == "sha256:abc"
+    cache.check()
+
+    assert cache.state(registry.get("node2")).status == FAILED
+    broken.ensure_image.side_effect = None
+    broken.ensure_image.return_value = "sha256:abc"
+    with pytest.raises(Exception):
+        cache.require(registry.get("node2"))  # retries the pull in the background
+    assert await cache.wait(registry.get("node2")) == "sha256:abc"
+    assert cache.state(registry.get("node2")).status == READY
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.utils import codespaces
+from app.utils.placement import DockerHost, PlacementRegistry, parse_docker_hosts
+
+
+def fake_docker(running=0, stopped=0):
+    docker = MagicMock()
+    statuses = {f"r{i}": "running" for i in range(running)}
+    statuses.update({f"s{i}": "exited" for i in range(stopped)})
+    docker.container_statuses = AsyncMock(return_value=statuses)
+    return docker
+
+
+@pytest.mark.asyncio
+async def test_choose_least_loaded_host():
+    registry = PlacementRegistry([
+        DockerHost("local", fake_docker(running=3), 4),
+        DockerHost("node2", fake_docker(running=5, stopped=10), 20, "10.0.0.2"),
+        DockerHost("node3", fake_docker(running=1), 2, "10.0.0.3"),
+    ])
+    # remote hosts take new codespaces once their storage is known to be shared
+    assert (await registry.choose()).name == "local"
+    registry.mark_shared("node2")
+    registry.mark_shared("node3")
+
+    assert (await registry.choose()).name == "node2"
+    # a pupil whose files are on a host stays there, whatever the load
+    assert (await registry.choose(sticky="local")).name == "local"
+    assert (await registry.choose(sticky="gone")).name == "node2"
+
+
+@pytest.mark.asyncio
+async def test_choose_skips_full_and_unreachable_hosts():
+    down = MagicMock()
+    down.container_statuses = AsyncMock(side_effect=OSError("connection refused"))
+    registry = PlacementRegistry([
+        DockerHost("local", fake_docker(running=2), 2),
+        DockerHost("node2", down, 0, "10.0.0.2"),
+        DockerHost("node3", fake_docker(running=7), 8, "10.0.0.3"),
+    ])
+    registry.mark_shared("node2")
+    registry.mark_shared("node3")
+    assert (await registry.choose()).name == "node3"
+
+    registry.hosts["node3"] = DockerHost("node3", fake_docker(running=8), 8, "10.0.0.3")
+    with pytest.raises(Exception) as e:
+        await registry.choose()
+    assert e.value.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_address_of_remote_codespace():
+    docker = fake_docker()
+    docker.container_attrs = AsyncMock(return_value={
+        "NetworkSettings": {
+            "IPAddress": "172.17.0.4",
+            "Ports": {"8080/tcp": [{"HostIp": "0.0.0.0", "HostPort": "32768"}]},
+        }
+    })
+    registry = PlacementRegistry([
+        DockerHost("local", docker, 0),
+        DockerHost("node2", docker, 0, "10.0.0.2"),
+    ])
+
+    assert await registry.address(registry.get(None), "c1") == ("172.17.0.4", None)
+    assert await registry.address(registry.get("node2"), "c1") == ("10.0.0.2", 32768)
+
+
+def test_parse_docker_hosts():
+    hosts = parse_docker_hosts(
+        "local=unix:///var/run/docker.sock@40, node2=tcp://10.0.0.2:2375@60"
+    )
+    assert [(h.name, h.capacity, h.address) for h in hosts] == [
+        ("local", 40, None),
+        ("node2", 60, "10.0.0.2"),
+    ]
+    assert [h.name for h in parse_docker_hosts(None)] == ["local"]
+
+
+@pytest.mark.asyncio
+async def test_remote_hosts_need_shared_storage(tmp_path, mocker):
+    babirusa = str(tmp_path)
+    mocker.patch.object(codespaces, "_get_paths", return_value=(babirusa, babirusa))
+    mocker.patch.object(codespaces, "image_cache", AsyncMock())
+
+    def mounting(shared):
+        async def run_once(image, entrypoint, command, volumes):
+            if not shared:
+                return b""  # another disk: the marker is not there
+            (source,) = volumes
+            with open(os.path.join(source, os.path.basename(command[0])), "rb") as f:
+                return f.read()
+
+        docker = fake_docker()
+        docker.run_once = run_once
+        return docker
+
+    registry = PlacementRegistry([
+        DockerHost("local", fake_docker(running=4), 4),
+        DockerHost("node2", mounting(shared=True), 0, "10.0.0.2"),
+        DockerHost("node3", mounting(shared=False), 0, "10.0.0.3"),
+    ])
+    await codespaces.check_shared_storage(registry)
+
+    assert registry.shared == {"local", "node2"}
+    assert (await registry.choose()).name == "node2"
+    assert not os.path.exists(os.path.join(babirusa, codespaces.STORAGE_CHECK))
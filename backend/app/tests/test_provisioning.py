@@ -0,0 +1,219 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+from unittest.mock import MagicMock
+
+from app import CODESPACE_NETWORK
+from app.data.migrations import dedupe_userips
+from app.data.models import Pupil, UserIp
+from app.utils import codespaces, provisioning
+from app.utils.codespaces import cipher
+from app.utils.docker_client import docker_client
+from app.utils.images import ImageCache
+from app.utils.placement import DockerHost, PlacementRegistry
+from app.utils.provisioning import ProvisioningWorker
+
+ATTRS = {"NetworkSettings": {"Networks": {CODESPACE_NETWORK: {"IPAddress": "172.17.0.2"}}}}
+
+
+@pytest.mark.asyncio
+async def test_provisioning_resumes_after_failed_step(tmp_path, mocker):
+    babirusa = str(tmp_path)
+    mocker.patch.object(codespaces, "_get_paths", return_value=(babirusa, babirusa))
+    mocker.patch.object(codespaces, "image_cache")
+    mock_docker = MagicMock()
+    mock_docker.containers.run.side_effect = [
+        RuntimeError("docker is down"),
+        MagicMock(id="container123"),
+    ]
+    mock_docker.containers.get.return_value.status = "running"
+    mock_docker.containers.get.return_value.attrs = ATTRS
+    mocker.patch.object(docker_client, "client", mock_docker)
+
+    await Pupil(
+        username="prov_pupil",
+        firstname="John",
+        lastname="Smith",
+        hashed_password=cipher.encrypt(b"pupil_pass").decode("utf-8"),
+        container_status="provisioning",
+        provision_state="created",
+    ).create()
+
+    worker = ProvisioningWorker(workers=1, max_attempts=1, retry_delay=0)
+    assert await worker.provision("prov_pupil") is None
+
+    pupil = await Pupil.find_one(Pupil.username == "prov_pupil")
+    assert pupil.provision_state == "dirs_ready"
+    assert pupil.provision_error == "docker is down"
+    assert pupil.host == "local"
+    assert (tmp_path / "user-prov_pupil-prj").is_dir()
+
+    # a restarted backend picks the pupil up from the step it reached
+    assert await worker.provision("prov_pupil") == "172.17.0.2"
+
+    pupil = await Pupil.find_one(Pupil.username == "prov_pupil")
+    assert pupil.provision_state == "ready"
+    assert pupil.provision_error is None
+    assert pupil.container_id == "container123"
+    assert pupil.container_status == "running"
+    userip = await UserIp.find_one(UserIp.username == "prov_pupil")
+    assert (userip.ip, userip.container_id) == ("172.17.0.2", "container123")
+    assert mock_docker.containers.run.call_count == 2
+    options = mock_docker.containers.run.call_args.kwargs
+    assert (options["name"], options["network"]) == ("codespace-prov_pupil", CODESPACE_NETWORK)
+
+    await UserIp.delete_all()
+    await Pupil.delete_all()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_launches_start_one_container(tmp_path, mocker):
+    babirusa = str(tmp_path)
+    mocker.patch.object(codespaces, "_get_paths", return_value=(babirusa, babirusa))
+    mocker.patch.object(codespaces, "image_cache")
+    created = []
+
+    def run(image, **kwargs):
+        time.sleep(0.2)  # Docker takes a while, the other launches arrive meanwhile
+        created.append(kwargs)
+        return MagicMock(id="container123")
+
+    mock_docker = MagicMock()
+    mock_docker.containers.run.side_effect = run
+    mock_docker.containers.get.return_value.status = "running"
+    mock_docker.containers.get.return_value.attrs = ATTRS
+    mocker.patch.object(docker_client, "client", mock_docker)
+
+    await Pupil(
+        username="race_pupil",
+        firstname="John",
+        lastname="Smith",
+        hashed_password=cipher.encrypt(b"pupil_pass").decode("utf-8"),
+        container_status="provisioning",
+        provision_state="created",
+    ).create()
+
+    # same process: the calls share one launch
+    ips = await asyncio.gather(
+        *(codespaces.launch_codespace("race_pupil", "pupil_pass") for _ in range(5))
+    )
+    assert ips == ["172.17.0.2"] * 5
+    assert len(created) == 1
+    assert await UserIp.find(UserIp.username == "race_pupil").count() == 1
+
+    # another worker holds the launch: wait for its result instead of launching
+    await UserIp.find(UserIp.username == "race_pupil").delete()
+    await Pupil.find_one(Pupil.username == "race_pupil").update(
+        {"$set": {"provision_state": "created"}}
+    )
+    await UserIp(
+        username="race_pupil", ip="", container_id="", claimed_at=datetime.utcnow()
+    ).insert()
+
+    async def other_worker_finishes():
+        await asyncio.sleep(0.3)
+        await UserIp.find_one(UserIp.username == "race_pupil").update(
+            {"$set": {"ip": "172.17.0.3", "container_id": "container456"}}
+        )
+
+    ip, _ = await asyncio.gather(
+        codespaces.launch_codespace("race_pupil", "pupil_pass"), other_worker_finishes()
+    )
+    assert ip == "172.17.0.3"
+    assert len(created) == 1
+
+    await UserIp.delete_all()
+    await Pupil.delete_all()
+
+
+@pytest.mark.asyncio
+async def test_submit_without_lifespan_starts_the_workers():
+    worker = ProvisioningWorker(workers=1)
+    provisioned = asyncio.Event()
+
+    async def provision(username, teacher_id=None, priority=None):
+        provisioned.set()
+
+    worker.provision = provision
+    worker.submit("lazy_pupil")  # no start(): nothing would pick it up before
+
+    await asyncio.wait_for(provisioned.wait(), 1)
+    worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_startup_cleans_userips_left_by_a_previous_run():
+    collection = UserIp.get_motor_collection().database["UserIp_migration"]
+    await collection.insert_many([
+        {"username": "dup_pupil", "ip": "172.17.0.2", "container_id": "old"},
+        {"username": "dup_pupil", "ip": "172.17.0.3", "container_id": "new"},
+        {"username": "single_pupil", "ip": "172.17.0.4", "container_id": "c1"},
+    ])
+    assert await dedupe_userips(collection) == 1
+    assert [doc["container_id"] async for doc in collection.find({}, sort=[("_id", 1)])] == [
+        "new", "c1"
+    ]
+    await collection.drop()
+
+    for username, owner in (
+        ("crashed_pupil", codespaces.LAUNCH_OWNER),
+        ("legacy_pupil", None),
+        ("remote_pupil", "other-backend"),
+    ):
+        await UserIp(
+            username=username, ip="", container_id="", claimed_at=datetime.utcnow(), owner=owner
+        ).insert()
+
+    assert await codespaces.release_launches() == 2
+    # the crashed launch is claimed again at once instead of after the lease
+    assert await asyncio.wait_for(codespaces._claim_launch("crashed_pupil"), 1) is None
+    assert sorted(u.username for u in await UserIp.find(UserIp.ip == "").to_list()) == [
+        "crashed_pupil", "remote_pupil"
+    ]
+
+    await UserIp.delete_all()
+
+
+@pytest.mark.asyncio
+async def test_provisioning_waits_for_the_image_pull(mocker):
+    pulled = asyncio.Event()
+
+    async def ensure_image(image):
+        await pulled.wait()
+        return "sha256:abc"
+
+    local = MagicMock()
+    local.ensure_image = ensure_image
+    registry = PlacementRegistry([DockerHost("local", local, 0)])
+    cache = ImageCache(registry, "skfx/babirusa-codeserver")
+    mocker.patch.object(provisioning, "image_cache", cache)
+    mocker.patch.object(provisioning, "placement", registry)
+
+    async def launch(username, password, teacher_id=None, priority=None):
+        cache.require(registry.get("local"))
+        return "172.17.0.2"
+
+    launch_mock = mocker.patch.object(provisioning, "launch_codespace", side_effect=launch)
+    await Pupil(
+        username="pull_pupil",
+        firstname="John",
+        lastname="Smith",
+        hashed_password=cipher.encrypt(b"pupil_pass").decode("utf-8"),
+        container_status="provisioning",
+        provision_state="created",
+    ).create()
+
+    # the pull outlasts the whole retry budget
+    worker = ProvisioningWorker(workers=1, max_attempts=2, retry_delay=0.01)
+    provision = asyncio.create_task(worker.provision("pull_pupil"))
+    await asyncio.sleep(0.3)
+    assert not provision.done() and launch_mock.await_count == 1
+    pulled.set()
+
+    assert await asyncio.wait_for(provision, 1) == "172.17.0.2"
+    assert launch_mock.await_count == 2
+    assert (await Pupil.find_one(Pupil.username == "pull_pupil")).provision_error is None
+
+    await Pupil.delete_all()
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from proxy.routing import RoutingTable
+from proxy.server import Message, ProxyError, ReverseProxy
+from proxy.static_cache import StaticAssetCache
+from proxy.wake import CodespaceWaker
+
+
+@pytest.mark.asyncio
+async def test_upstream_closing_mid_body_releases_the_connection():
+    async def upstream(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\npartial")
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(upstream, "127.0.0.1", 0)
+    routes = RoutingTable.static({"alice": "127.0.0.1"})
+    routes._ports["alice"] = server.sockets[0].getsockname()[1]
+    proxy = ReverseProxy(routes)
+
+    opened = []
+    acquire = proxy.pool.acquire
+
+    async def tracked_acquire(host, port):
+        connection = await acquire(host, port)
+        opened.append(connection[1])
+        return connection
+
+    proxy.pool.acquire = tracked_acquire
+    front = await asyncio.start_server(proxy.handle_client, "127.0.0.1", 0)
+    try:
+        reader, writer = await asyncio.open_connection(*front.sockets[0].getsockname()[:2])
+        writer.write(b"GET /alice/ HTTP/1.1\r\nHost: alice.babirusa.space\r\n\r\n")
+        await writer.drain()
+        received = await asyncio.wait_for(reader.read(), 5)  # client closed after the short body
+        writer.close()
+
+        assert received.endswith(b"partial")
+        assert len(opened) == 1 and opened[0].is_closing()
+    finally:
+        front.close()
+        server.close()
+
+
+@pytest.mark.parametrize("value", ["-1", "+5", "1_0", "５"])
+def test_content_length_must_be_digits(value):
+    with pytest.raises(ProxyError) as error:
+        Message("POST / HTTP/1.1", [("Content-Length", value)]).content_length
+    assert error.value.status == 400
+
+
+@pytest.mark.asyncio
+async def test_chunked_request_drops_content_length():
+    heads = []
+
+    async def upstream(reader, writer):
+        heads.append(await reader.readuntil(b"\r\n\r\n"))
+        await reader.readuntil(b"0\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+        await writer.drain()
+
+    server = await asyncio.start_server(upstream, "127.0.0.1", 0)
+    routes = RoutingTable.static({"alice": "127.0.0.1"})
+    routes._ports["alice"] = server.sockets[0].getsockname()[1]
+    front = await asyncio.start_server(ReverseProxy(routes).handle_client, "127.0.0.1", 0)
+    try:
+        reader, writer = await asyncio.open_connection(*front.sockets[0].getsockname()[:2])
+        writer.write(
+            b"POST /alice/ HTTP/1.1\r\nHost: alice.babirusa.space\r\nConnection: close\r\n"
+            b"Transfer-Encoding: chunked\r\nContent-Length: 5\r\n\r\n5\r\nhello\r\n0\r\n\r\n"
+        )
+        await writer.drain()
+        received = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+
+        assert received.startswith(b"HTTP/1.1 200") and received.endswith(b"ok")
+        head = Message.parse(heads[0])
+        assert head.get("Content-Length") is None and head.is_chunked
+    finally:
+        front.close()
+        server.close()
+
+
+@pytest.mark.asyncio
+async def test_static_cache_reads_disk_off_the_event_loop(tmp_path):
+    key = "/stable-" + "0" * 40 + "/static/out/main.js"
+    StaticAssetCache(str(tmp_path)).put(key, b"main()", {"Content-Type": "text/javascript"})
+
+    cache = StaticAssetCache(str(tmp_path))
+    load = cache._load
+    threads = []
+
+    def tracked_load(k):
+        threads.append(threading.get_ident())
+        return load(k)
+
+    cache._load = tracked_load
+    asset = await cache.get(key)
+
+    assert asset.variants["identity"] == b"main()" and "gzip" in asset.variants
+    assert threads and threads[0] != threading.get_ident()
+    assert await cache.get(key) is asset and len(threads) == 1  # memory from now on
+
+
+class Container:
+    def __init__(self, status):
+        self.status = status
+        self.attrs = {"NetworkSettings": {"IPAddress": "127.0.0.1"}}
+
+    def unpause(self):
+        self.status = "running"
+
+    def reload(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_waker_unpauses_a_container_paused_before_a_restart():
+    async def code_server(reader, writer):
+        if await reader.read(1024):  # the TCP probe sends nothing
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+        writer.close()
+
+    server = await asyncio.start_server(code_server, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    routes = RoutingTable.static({"alice": "127.0.0.1"})
+    routes._containers["alice"] = "c1"
+    routes._ports["alice"] = port  # published port, as on a remote Docker host
+    container = Container("paused")
+    docker_client = MagicMock()
+    docker_client.containers.get.return_value = container
+    # a fresh waker knows nothing about earlier suspensions
+    waker = CodespaceWaker(routes, docker_client=docker_client, docker_hosts={})
+    try:
+        assert await waker.ensure_awake("alice", "127.0.0.1", port) == ("127.0.0.1", port)
+        assert container.status == "running"
+    finally:
+        server.close()
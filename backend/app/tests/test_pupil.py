@@ -1,7 +1,11 @@
+import json
+
 import pytest
 from httpx import AsyncClient
 from unittest.mock import AsyncMock, MagicMock, patch
-from app.data.models import Teacher, UserIp
+from app.data.models import Pupil, Teacher, UserIp
+from app.utils.docker_client import docker_client
+from app.utils.provisioning import provisioner
 
 import uuid
 
@@ -27,8 +31,8 @@ async def test_create_pupil(client, test_teacher, monkeypatch):
     
     monkeypatch.setattr("app.utils.security.verify_password", lambda x, y: True)
     
-    with patch("app.routers.pupil.launch_codespace", new_callable=AsyncMock) as mock_launch:
-        mock_launch.return_value = "172.17.0.2"
+    with patch("app.routers.pupil.provisioner") as mock_provisioner, \
+            patch("app.routers.pupil.image_cache"):
         
         login_response = await client.post(
             "/api/teacher/login",
@@ -59,6 +63,11 @@ async def test_create_pupil(client, test_teacher, monkeypatch):
         pupil_id = data["id"]
         assert data["username"] == pupil_data["username"]
         assert data["firstname"] == pupil_data["firstname"]
+        assert data["provision_state"] == "created"
+
+        pupil = await Pupil.find_one(Pupil.username == pupil_data["username"])
+        assert pupil.provision_state == "created"
+        assert pupil.container_status in ("provisioning", "queued")
         
         userip = UserIp(
             username=pupil_data["username"],
@@ -74,9 +83,9 @@ async def test_create_pupil(client, test_teacher, monkeypatch):
         assert len(teacher.pupils) == 1
         assert teacher.pupils[0].username == pupil_data["username"]
         
-        mock_launch.assert_awaited_once_with(
+        mock_provisioner.submit.assert_called_once_with(
             pupil_data["username"],
-            pupil_data["password"]
+            teacher_id=str(teacher.id)
         )
         
 @pytest.mark.asyncio
@@ -218,9 +227,10 @@ async def test_delete_pupil(client, test_teacher, mocker):
 
     token = login_response.json()["access_token"]
     
-    mock_docker = mocker.patch('docker.from_env')
+    mock_docker = mocker.MagicMock()
     mock_container = mocker.MagicMock()
-    mock_docker.return_value.containers.get.return_value = mock_container
+    mock_docker.containers.get.return_value = mock_container
+    mocker.patch.object(docker_client, "client", mock_docker)
     
     mock_os = mocker.patch('os.listdir')
     mock_os.return_value = []
@@ -233,7 +243,7 @@ async def test_delete_pupil(client, test_teacher, mocker):
     assert delete_response.status_code == 200
     assert delete_response.text == '"OK"'
     
-    mock_docker.return_value.containers.get.assert_called_once()
+    mock_docker.containers.get.assert_called_once()
     mock_container.remove.assert_called_once_with(force=True, v=True)
     await UserIp.delete_all()
     
@@ -241,4 +251,98 @@ async def test_delete_pupil(client, test_teacher, mocker):
         f"/api/teacher/pupils/{pupil_id}",
         headers={"Authorization": f"Bearer {token}"}
     )
-    assert get_response.status_code == 404
\ No newline at end of file
+    assert get_response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_import_pupils(client, test_teacher):
+    login_response = await client.post(
+            "/api/teacher/login",
+            data={
+                "username": test_teacher["login"],
+                "password": test_teacher["password"]
+            },
+            headers={"Content-Type": "application/x-www-form-urlencoded"}
+        )
+
+    token = login_response.json()["access_token"]
+
+    async def fake_launch(username, password, teacher_id=None, priority=None):
+        if username == "import_pupil_2":
+            raise RuntimeError("docker is down")
+        return "172.17.0.5"
+
+    pupils = [
+        {"username": f"import_pupil_{n}", "password": "pass", "firstname": "John", "lastname": "Smith"}
+        for n in range(1, 4)
+    ]
+    pupils.append(pupils[0])
+
+    with patch("app.utils.provisioning.launch_codespace", side_effect=fake_launch) as mock_launch, \
+            patch.object(provisioner, "max_attempts", 1), \
+            patch("app.routers.pupil.image_cache"):
+        response = await client.post(
+            "/api/teacher/pupils/import",
+            json=pupils,
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    statuses = {}
+    for event in events:
+        statuses.setdefault(event["username"], []).append(event["status"])
+
+    assert statuses["import_pupil_1"] == ["rejected", "created", "ready"]
+    assert statuses["import_pupil_2"] == ["created", "failed"]
+    failed = next(e for e in events if e["status"] == "failed")
+    assert failed["detail"] == "docker is down"
+    assert statuses["import_pupil_3"] == ["created", "ready"]
+    assert mock_launch.await_count == 3
+
+    teacher = await Teacher.find_one(
+        Teacher.login == test_teacher["login"],
+        fetch_links=True
+    )
+    assert sorted(pupil.username for pupil in teacher.pupils) == [
+        "import_pupil_1", "import_pupil_2", "import_pupil_3"
+    ]
+
+    await Pupil.find({"username": {"$in": list(statuses)}}).delete()
+
+
+@pytest.mark.asyncio
+async def test_search_only_pupils_of_the_teacher(client, test_teacher):
+    login_response = await client.post(
+        "/api/teacher/login",
+        data={"username": test_teacher["login"], "password": test_teacher["password"]},
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    pupils = {}
+    for username in ("search_stranger", "search_grouped", "search_own"):
+        pupils[username] = Pupil(
+            username=username, firstname="S", lastname="P",
+            hashed_password="x", container_status="running",
+        )
+        await pupils[username].create()
+
+    group_res = await client.post("/api/teacher/groups/new", json="Search Group", headers=headers)
+    await client.post(
+        "/api/teacher/groups/pupils",
+        json={"group_id": group_res.json()["id"], "pupil_id": [str(pupils["search_grouped"].id)]},
+        headers=headers,
+    )
+    teacher = await Teacher.find_one(Teacher.login == test_teacher["login"], fetch_links=True)
+    teacher.pupils = (teacher.pupils or []) + [pupils["search_own"]]
+    await teacher.save()
+
+    statuses = {}
+    for username in pupils:
+        response = await client.get(
+            f"/api/teacher/pupils/{username}/search", params={"pattern": "x"}, headers=headers
+        )
+        statuses[username] = response.status_code
+    assert statuses == {"search_stranger": 404, "search_grouped": 200, "search_own": 200}
+
+    await Pupil.find({"username": {"$in": list(pupils)}}).delete()
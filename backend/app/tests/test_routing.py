@@ -0,0 +1,52 @@
+from proxy.metrics import ProxyMetrics
+from proxy.routing import RoutingTable, resolve_route
+
+
+class Collection:
+    """find() returns the snapshot taken before on_find runs, like a slow load."""
+
+    def __init__(self, docs, on_find=None):
+        self.docs = docs
+        self.on_find = on_find
+
+    def find(self, *args):
+        snapshot = [dict(d) for d in self.docs]
+        if self.on_find:
+            self.on_find()
+        return snapshot
+
+
+def test_changes_during_resync_survive_the_swap():
+    collection = Collection([{"_id": 1, "username": "alice", "ip": "10.0.0.2"}])
+    table = RoutingTable(collection)
+    table.resync()
+
+    def concurrent_update():
+        table.apply_change({
+            "operationType": "update",
+            "documentKey": {"_id": 1},
+            "fullDocument": {"_id": 1, "username": "alice", "ip": "10.0.0.9"},
+        })
+
+    collection.on_find = concurrent_update
+    table.resync()
+
+    assert table.get("alice") == "10.0.0.9"
+    assert table._missed is None
+
+
+def test_unknown_pupils_are_counted_in_both_modes():
+    table = RoutingTable.static({"alice": "10.0.0.2"})
+    metrics = ProxyMetrics()
+    for mode, host, path in (
+        ("PATH", "babirusa.space", "/alice/"),
+        ("PATH", "babirusa.space", "/bob/"),
+        ("PATH", "babirusa.space", "/workspace"),
+        ("PATH", "babirusa.space", "/"),
+        (None, "bob.babirusa.space", "/"),
+        (None, "www.babirusa.space", "/"),
+        (None, "api.babirusa.space", "/pupil"),
+    ):
+        metrics.unknown_host(resolve_route(host, path, table, mode=mode, ip_address="127.0.0.1"))
+
+    assert metrics.unknown_subdomains == 2
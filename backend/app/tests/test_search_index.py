@@ -0,0 +1,65 @@
+import os
+import re
+
+from app.utils import file_manager
+from app.utils.file_manager import FileManager
+from app.utils.search_index import required_trigrams
+
+FILES = {
+    "main.py": "import os\nresult = eval(input())\nprint(result)\n",
+    "src/utils.py": "def helper():\n    # TODO: finish\n    return None\r\n",
+    "src/data.txt": "Straße ſtatus KELVIN\nПривет, мир\n",
+    "notes.md": "TODO list\n- eval is evil\n",
+}
+
+QUERIES = [
+    ("eval", {}),
+    ("EVAL", {"case_sensitive": True}),
+    ("todo", {}),
+    ("TODO: finish", {"case_sensitive": True}),
+    ("status", {}),
+    ("kelvin", {}),
+    ("привет", {}),
+    ("return None", {}),
+    (r"def \w+\(\)", {"is_regex": True}),
+    (r"(eval|print)\(", {"is_regex": True}),
+    (r"res(ult)+ =", {"is_regex": True}),
+    (r"^- eval", {"is_regex": True}),
+    ("missing text", {}),
+    ("eval", {"file_pattern": "*.md"}),
+]
+
+
+def test_required_trigrams():
+    assert required_trigrams(re.compile(re.escape("Eval("), re.I)) == {b"eva", b"val", b"al("}
+    assert required_trigrams(re.compile(r"(foo|bar)baz")) == {b"baz"}
+    assert required_trigrams(re.compile(r"x(?:abc)?y")) == set()
+    assert required_trigrams(re.compile("ab")) == set()
+
+
+def test_index_keeps_search_results(tmp_path, mocker):
+    mocker.patch.object(file_manager, "BABIRUSA_HOME", str(tmp_path))
+    root = tmp_path / "user-search-prj"
+    for rel, content in FILES.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content.encode("utf-8"))
+    fm = FileManager("search")
+
+    for text, options in QUERIES:
+        mocker.patch.object(file_manager, "SEARCH_INDEX", False)
+        expected = fm.search_in_files(text, **options)
+        mocker.patch.object(file_manager, "SEARCH_INDEX", True)
+        assert fm.search_in_files(text, **options) == expected, text
+
+    assert [r.relative_path for r in fm.search_in_files("status")] == ["src/data.txt"]
+
+    fm.edit_file("src/utils.py", "value = eval('1')\n")
+    assert [r.relative_path for r in fm.search_in_files("eval(")] == [
+        "main.py",
+        "src/utils.py",
+    ]
+    os.remove(root / "main.py")
+    fm.delete_file("notes.md")
+    fm._index.invalidate(str(root / "main.py"))
+    assert [r.relative_path for r in fm.search_in_files("eval(")] == ["src/utils.py"]
@@ -0,0 +1,48 @@
+from app.utils import file_manager
+from app.utils.file_manager import FileManager
+from app.utils.search_stream import SSE, stream_search
+
+SOURCE = "import os\nx = 1\nprint(x)\ny = 2\nprint(y)\n"
+
+
+def make_manager(tmp_path, mocker):
+    mocker.patch.object(file_manager, "BABIRUSA_HOME", str(tmp_path))
+    prj = tmp_path / "user-stream-prj"
+    prj.mkdir()
+    (prj / "a.py").write_text(SOURCE)
+    (prj / "b.py").write_text("print('b')\n")
+    return FileManager("stream")
+
+
+def test_iter_search_context_and_limit(tmp_path, mocker):
+    fm = make_manager(tmp_path, mocker)
+
+    results = list(fm.iter_search("print", context=1))
+    assert [(r.relative_path, r.line_number) for r in results] == [
+        ("a.py", 3), ("a.py", 5), ("b.py", 1)
+    ]
+    assert (results[0].context_before, results[0].context_after) == (["x = 1"], ["y = 2"])
+    assert (results[1].context_before, results[1].context_after) == (["y = 2"], [])
+    assert (results[2].context_before, results[2].context_after) == ([], [])
+
+    assert [r.line_number for r in fm.iter_search("print", max_results=1)] == [3]
+    assert fm.search_in_files("print") == list(fm.iter_search("print"))
+    assert fm.search_in_files("print")[0].context_before is None
+
+    search = fm.iter_search("print")
+    assert next(search).line_number == 3
+    search.close()  # early termination closes the open file
+
+
+def test_stream_search_sse(tmp_path, mocker):
+    fm = make_manager(tmp_path, mocker)
+
+    events = list(stream_search(fm, "print", max_results=2, fmt=SSE))
+
+    assert events[0] == (
+        'event: match\ndata: {"relative_path":"a.py","line_number":3,'
+        '"line_content":"print(x)"}\n\n'
+    )
+    assert len(events) == 3
+    assert events[-1] == 'event: done\ndata: {"count": 2, "limited": true}\n\n'
+    assert list(stream_search(fm, "import", max_results=10))[0].endswith('"import os"}\n')
@@ -0,0 +1,115 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.data.models import Pupil, UserIp
+from app.utils.placement import DockerHost, PlacementRegistry
+from app.utils.status_reconciler import StatusReconciler
+
+
+async def create_pupil(username, container_id, status):
+    await Pupil(
+        username=username,
+        firstname="John",
+        lastname="Smith",
+        hashed_password="x",
+        container_status=status,
+    ).create()
+    await UserIp(username=username, ip="172.17.0.2", container_id=container_id).create()
+
+
+async def status_of(username):
+    return (await Pupil.find_one(Pupil.username == username)).container_status
+
+
+def codespace_event(action, container_id, **labels):
+    attributes = {"babirusa.codespace": "1", **labels}
+    return {"Action": action, "id": container_id, "Actor": {"Attributes": attributes}}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_and_events():
+    await create_pupil("rec_running", "c1", "exited")
+    await create_pupil("rec_suspended", "c2", "suspended")
+    await create_pupil("rec_removed", "c3", "running")
+
+    docker = MagicMock()
+    docker.container_statuses = AsyncMock(return_value={"c1": "running", "c2": "exited"})
+    reconciler = StatusReconciler(PlacementRegistry([DockerHost("local", docker, 0)]))
+
+    await reconciler.reconcile()
+
+    assert await status_of("rec_running") == "running"
+    assert await status_of("rec_suspended") == "suspended"
+    assert await status_of("rec_removed") == "removed"
+    docker.container_statuses.assert_any_await({"label": "babirusa.codespace"})
+
+    pending = {}
+    for event in (
+        codespace_event("die", "c1"),
+        codespace_event("start", "c2"),
+        codespace_event("start", "unknown"),
+        codespace_event("start", "c9", **{"babirusa.pupil": "rec_removed"}),
+        codespace_event("stop", "c1"),
+    ):
+        await reconciler._collect(event, pending)
+    assert pending == {
+        "rec_running": "exited",
+        "rec_suspended": "running",
+        "rec_removed": "running",
+    }
+    await reconciler.write(pending)
+
+    assert await status_of("rec_running") == "exited"
+    assert await status_of("rec_suspended") == "running"
+
+    await Pupil.find({"username": {"$regex": "^rec_"}}).delete()
+    await UserIp.find({"username": {"$regex": "^rec_"}}).delete()
+
+
+@pytest.mark.asyncio
+async def test_start_event_refreshes_ip():
+    await create_pupil("rec_restarted", "c4", "exited")
+
+    docker = MagicMock()
+    docker.container_attrs = AsyncMock(
+        return_value={"NetworkSettings": {"IPAddress": "172.17.0.7"}}
+    )
+    host = DockerHost("local", docker, 0)
+    reconciler = StatusReconciler(PlacementRegistry([host]))
+
+    pending, started = {}, {}
+    await reconciler._collect(codespace_event("start", "c4"), pending, host, started)
+    assert started == {"rec_restarted": (host, "c4")}
+    await reconciler.refresh_addresses(started)
+
+    userip = await UserIp.find_one(UserIp.username == "rec_restarted")
+    assert userip.ip == "172.17.0.7"
+    docker.container_attrs.assert_awaited_once_with("c4")
+
+    await Pupil.find({"username": {"$regex": "^rec_"}}).delete()
+    await UserIp.find({"username": {"$regex": "^rec_"}}).delete()
+
+
+@pytest.mark.asyncio
+async def test_events_of_other_containers_are_ignored(mocker):
+    find_one = mocker.patch.object(UserIp, "find_one")
+    docker = MagicMock()
+    host = DockerHost("local", docker, 0)
+    reconciler = StatusReconciler(PlacementRegistry([host]))
+
+    pending = {}
+    await reconciler._collect(
+        {"Action": "die", "id": "mongo1", "Actor": {"Attributes": {"name": "mongo"}}}, pending, host, {}
+    )
+    assert pending == {}
+    find_one.assert_not_called()
+
+    # the stream itself only carries codespace events
+    def events(**kwargs):
+        reconciler._stop.set()
+        return iter(())
+
+    docker.get_client.return_value.events.side_effect = events
+    reconciler._follow_events(MagicMock(), host)
+    filters = docker.get_client.return_value.events.call_args.kwargs["filters"]
+    assert filters["label"] == ["babirusa.codespace=1"]
@@ -0,0 +1,62 @@
+import hashlib
+import os
+
+import pytest
+from unittest.mock import MagicMock
+
+from app.data.models import Pupil, UserIp, WarmContainer
+from app.utils import codespaces
+from app.utils.codespaces import WarmPool, cipher, launch_codespace
+from app.utils.docker_client import docker_client
+
+
+@pytest.mark.asyncio
+async def test_launch_claims_warm_container(tmp_path, mocker):
+    babirusa = str(tmp_path)
+    for kind in ("config", "prj"):
+        os.makedirs(os.path.join(babirusa, f"warm-slot1-{kind}"))
+    with open(os.path.join(babirusa, "warm-slot1-prj", "main.py"), "w") as f:
+        f.write("print('hi')\n")
+
+    mocker.patch.object(codespaces, "_get_paths", return_value=(babirusa, babirusa))
+    mock_docker = MagicMock()
+    mock_docker.containers.get.return_value.attrs = {
+        "NetworkSettings": {"IPAddress": "172.17.0.9"}
+    }
+    mocker.patch.object(docker_client, "client", mock_docker)
+    pool = WarmPool(size=1)
+    mocker.patch.object(codespaces, "warm_pool", pool)
+    refill = mocker.patch.object(pool, "refill_later")
+
+    await WarmContainer(slot="slot1", container_id="warm123", ip="172.17.0.9").create()
+    await Pupil(
+        username="warm_pupil",
+        firstname="John",
+        lastname="Smith",
+        hashed_password=cipher.encrypt(b"pupil_pass").decode("utf-8"),
+        container_status="running",
+    ).create()
+
+    ip = await launch_codespace("warm_pupil", "pupil_pass")
+    for task in list(pool._tasks):
+        await task
+
+    assert ip == "172.17.0.9"
+    assert await WarmContainer.count() == 0
+    userip = await UserIp.find_one(UserIp.username == "warm_pupil")
+    assert userip.container_id == "warm123"
+    assert os.path.exists(os.path.join(babirusa, "user-warm_pupil-prj", "main.py"))
+    assert os.readlink(os.path.join(babirusa, "warm-slot1-prj")) == "user-warm_pupil-prj"
+    with open(os.path.join(babirusa, "user-warm_pupil-config", "code-server", "config.yaml")) as f:
+        config = f.read()
+    assert f'hashed-password: "{hashlib.sha256(b"pupil_pass").hexdigest()}"' in config
+    assert "pupil_pass" not in config
+    pupil = await Pupil.find_one(Pupil.username == "warm_pupil")
+    assert (pupil.container_id, pupil.host, pupil.provision_state) == ("warm123", "local", "ready")
+    mock_docker.containers.get.return_value.rename.assert_called_once_with("codespace-warm_pupil")
+    mock_docker.containers.get.return_value.restart.assert_called_once()
+    mock_docker.containers.run.assert_not_called()
+    refill.assert_called_once()
+
+    await UserIp.delete_all()
+    await Pupil.delete_all()
@@ -0,0 +1,85 @@
+import os
+
+from app.utils.codespaces import (
+    SHARED_EXTENSIONS_MOUNT,
+    _container_options,
+    _prepare_user_dirs,
+    _shared_extensions,
+)
+from app.utils.workspace import populate, unshare
+
+
+def make_template(root):
+    os.makedirs(os.path.join(root, "extensions", "ext1"))
+    with open(os.path.join(root, "extensions", "ext1", "bundle.js"), "wb") as f:
+        f.write(b"x" * 100_000)
+    with open(os.path.join(root, "settings.json"), "w") as f:
+        f.write("{}")
+
+
+def write_in_place(path, data):
+    # what code-server does through its bind mount, without FileManager
+    with open(path, "r+b") as f:
+        f.write(data)
+
+
+def test_writes_in_a_workspace_never_reach_the_template(tmp_path):
+    template = str(tmp_path / "baseconfig")
+    make_template(template)
+    bundle = os.path.join(template, "extensions", "ext1", "bundle.js")
+
+    for mode in ("reflink", "copy", "hardlink"):  # hardlink: the legacy setting
+        user_dir = str(tmp_path / f"user-{mode}-config")
+        populate(template, user_dir, mode=mode)
+        write_in_place(os.path.join(user_dir, "extensions", "ext1", "bundle.js"), b"changed")
+        with open(bundle, "rb") as f:
+            assert f.read() == b"x" * 100_000
+
+    # a workspace filled by the former hardlink mode
+    legacy = tmp_path / "user-legacy-config"
+    legacy.mkdir()
+    os.link(bundle, legacy / "bundle.js")
+    assert unshare([template], [str(legacy)]) == 1
+    assert unshare([template], [str(legacy)]) == 0
+    write_in_place(legacy / "bundle.js", b"changed")
+    with open(bundle, "rb") as f:
+        assert f.read() == b"x" * 100_000
+
+
+def test_populate_keeps_existing_files(tmp_path):
+    template = str(tmp_path / "baseconfig")
+    make_template(template)
+    user_dir = tmp_path / "user-john-config"
+    user_dir.mkdir()
+    (user_dir / "settings.json").write_text('{"theme": "dark"}')
+
+    for mode in ("reflink", "copy"):
+        stats = populate(template, str(user_dir), mode=mode)
+        assert (user_dir / "settings.json").read_text() == '{"theme": "dark"}'
+    assert stats.files == 0
+    assert (user_dir / "extensions" / "ext1" / "bundle.js").stat().st_size == 100_000
+
+
+def test_shared_extensions_layer(tmp_path):
+    babirusa = str(tmp_path)
+    template = os.path.join(babirusa, "baseconfig")
+    os.makedirs(os.path.join(template, "code-server", "extensions", "ms-python"))
+    os.makedirs(os.path.join(babirusa, "extensions"))
+
+    _prepare_user_dirs(
+        babirusa,
+        os.path.join(babirusa, "user-john-config"),
+        os.path.join(babirusa, "user-john-prj"),
+    )
+    assert not os.path.exists(
+        os.path.join(babirusa, "user-john-config", "code-server", "extensions")
+    )
+
+    options = _container_options(
+        "/host/user-john-config", "/host/user-john-prj", [], {}, {},
+        _shared_extensions(babirusa, "/host"),
+    )
+    assert options["volumes"]["/host/extensions"] == {
+        "bind": SHARED_EXTENSIONS_MOUNT, "mode": "ro"
+    }
+    assert options["command"][3:5] == ["--extensions-dir", SHARED_EXTENSIONS_MOUNT]
@@ -0,0 +1,227 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Iterable, Mapping, Optional
+
+from app import (
+    CODESPACE_CPU_BUDGET,
+    CODESPACE_CPUS,
+    CODESPACE_MEMORY_BUDGET_MB,
+    CODESPACE_MEMORY_MB,
+)
+from app.data.models import Pupil
+from app.utils.placement import PlacementRegistry, placement
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+PROVISIONING = "provisioning"
+
+# lower runs first; equal priorities are served in arrival order
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_WARM_POOL = 2
+
+
+class AdmissionController:
+    """
+    Keeps the memory/CPU committed to running codespaces within a host's budget.
+
+    Every running codespace holds one reservation (its container limits),
+    keyed by username, or "warm:<slot>" for warm pool containers. A launch
+    that does not fit waits in a priority queue, first come first served
+    within a priority, and the pupil is shown as "queued" meanwhile. A budget
+    of 0 means unlimited.
+    """
+
+    def __init__(
+        self,
+        memory_budget_mb: float = CODESPACE_MEMORY_BUDGET_MB,
+        cpu_budget: float = CODESPACE_CPU_BUDGET,
+        memory_mb: float = CODESPACE_MEMORY_MB,
+        cpus: float = CODESPACE_CPUS,
+    ):
+        self.memory_budget_mb = memory_budget_mb
+        self.cpu_budget = cpu_budget
+        self.memory_mb = memory_mb
+        self.cpus = cpus
+        self._running: set[str] = set()
+        self._starting: set[str] = set()  # admitted, container not seen running yet
+        self._queue: list = []  # heap of (priority, seq, key, future)
+        self._seq = itertools.count()
+
+    @property
+    def committed(self) -> tuple[float, float]:
+        count = len(self._running)
+        return count * self.memory_mb, count * self.cpus
+
+    def _fits(self) -> bool:
+        memory, cpu = self.committed
+        if self.memory_budget_mb and memory + self.memory_mb > self.memory_budget_mb:
+            return False
+        if self.cpu_budget and cpu + self.cpus > self.cpu_budget + 1e-9:
+            return False
+        return True
+
+    def would_wait(self) -> bool:
+        return bool(self._queue) or not self._fits()
+
+    def position(self, key: str) -> Optional[int]:
+        """1-based place in the launch queue, None when not waiting."""
+        for place, entry in enumerate(sorted(self._queue), start=1):
+            if entry[2] == key:
+                return place
+        return None
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    async def acquire(self, key: str, priority: int = PRIORITY_INTERACTIVE) -> None:
+        """Returns once the codespace may start; the reservation is held from then on."""
+        if key in self._running:
+            return
+        if not self._queue and self._fits():
+            self._admit(key)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), key, future)
+        heapq.heappush(self._queue, entry)
+        logger.info("Codespace of %s queued for capacity (%d waiting)", key, len(self._queue))
+        await set_status(key, QUEUED)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            else:
+                self.release(key)
+            raise
+
+    def _admit(self, key: str) -> None:
+        self._running.add(key)
+        self._starting.add(key)
+
+    def _admit_waiting(self) -> None:
+        while self._queue and self._fits():
+            _, _, key, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._admit(key)
+            future.set_result(None)
+
+    def started(self, key: str) -> None:
+        """The container is running (also for starts that bypassed the queue)."""
+        self._running.add(key)
+        self._starting.discard(key)
+
+    def release(self, key: str) -> None:
+        self._running.discard(key)
+        self._starting.discard(key)
+        self._admit_waiting()
+
+    def rename(self, old: str, new: str) -> None:
+        if old in self._running:
+            self._running.discard(old)
+            self._running.add(new)
+        if old in self._starting:
+            self._starting.discard(old)
+            self._starting.add(new)
+
+    def sync(self, running: Iterable[str]) -> None:
+        """Replaces the reservations with the codespaces Docker reports running."""
+        self._running = set(running) | self._starting
+        self._admit_waiting()
+
+
+class HostAdmission:
+    """
+    One AdmissionController per Docker host: the budgets hold for each
+    daemon, so placement cannot overcommit one host while another is idle.
+    The host of a reservation is remembered with its key; later calls only
+    need the key.
+    """
+
+    def __init__(self, placements: PlacementRegistry = placement, **limits):
+        self.placements = placements
+        self._limits = limits
+        self._hosts: dict[str, AdmissionController] = {}
+        self._placed: dict[str, str] = {}  # key → host of its reservation
+
+    def host(self, name: Optional[str] = None) -> AdmissionController:
+        """The controller of a host; None (records without a host) is the default one."""
+        name = self.placements.get(name).name
+        if name not in self._hosts:
+            self._hosts[name] = AdmissionController(**self._limits)
+        return self._hosts[name]
+
+    def of(self, key: str) -> AdmissionController:
+        """The controller holding (or last holding) key's reservation."""
+        return self.host(self._placed.get(key))
+
+    def would_wait(self, host: Optional[str] = None) -> bool:
+        """For a host, or with none given, whether a launch would wait on every host."""
+        if host is not None:
+            return self.host(host).would_wait()
+        return all(self.host(name).would_wait() for name in self.placements.shared)
+
+    def position(self, key: str) -> Optional[int]:
+        return self.of(key).position(key)
+
+    async def acquire(
+        self, key: str, priority: int = PRIORITY_INTERACTIVE, host: Optional[str] = None
+    ) -> None:
+        name = self.placements.get(host).name
+        previous = self._placed.get(key)
+        if previous is not None and previous != name:
+            self.host(previous).release(key)  # moved to another host
+        self._placed[key] = name
+        await self.host(name).acquire(key, priority)
+
+    def started(self, key: str, host: Optional[str] = None) -> None:
+        if host is not None:
+            name = self.placements.get(host).name
+            previous = self._placed.get(key)
+            if previous is not None and previous != name:
+                self.host(previous).release(key)
+            self._placed[key] = name
+        self.of(key).started(key)
+
+    def release(self, key: str) -> None:
+        self.of(key).release(key)
+        self._placed.pop(key, None)
+
+    def rename(self, old: str, new: str) -> None:
+        controller = self.of(old)
+        if old in self._placed:
+            self._placed[new] = self._placed.pop(old)
+        controller.rename(old, new)
+
+    def sync(self, running: Mapping[Optional[str], Iterable[str]]) -> None:
+        """Replaces the reservations with the codespaces Docker reports running, per host."""
+        by_host: dict[str, set[str]] = {}
+        for host, keys in running.items():
+            by_host.setdefault(self.placements.get(host).name, set()).update(keys)
+        for name in set(self._hosts) | set(by_host):
+            keys = by_host.get(name, set())
+            for key in keys:
+                self._placed[key] = name
+            self.host(name).sync(keys)
+
+
+async def set_status(username: str, status: str) -> None:
+    if username.startswith("warm:"):
+        return
+    try:
+        await Pupil.get_motor_collection().update_one(
+            {"username": username}, {"$set": {"container_status": status}}
+        )
+    except PyMongoError as e:
+        logger.error(f"MongoDB Error: {e}")
+
+
+admission = HostAdmission()
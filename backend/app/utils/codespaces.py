@@ -1,14 +1,42 @@
+import asyncio
+import hashlib
+import json
 import logging
 import os
+import secrets
 import shutil
-from distutils.dir_util import copy_tree
+import socket
+import uuid
+from datetime import datetime, timedelta
 from typing import Optional
 
-import docker
-from app import SECRET_KEY_USER
-from app.data.models import Pupil, UserIp
-from app.utils.error import Error
+from app import (
+    CODESPACE_CPUS,
+    CODESPACE_IMAGE,
+    CODESPACE_LAUNCH_LEASE,
+    CODESPACE_MEMORY_MB,
+    CODESPACE_NETWORK,
+    CODESPACE_NETWORK_PEERS,
+    CODESPACE_TEMPLATE_VERSION,
+    CODESPACE_WARM_POOL_SIZE,
+    SECRET_KEY_USER,
+)
+from app.data.models import Pupil, UserIp, WarmContainer
+from app.utils.admission import PRIORITY_INTERACTIVE, PRIORITY_WARM_POOL, admission
+from app.utils.docker_client import (
+    LABEL_CODESPACE,
+    LABEL_PUPIL,
+    LABEL_TEACHER,
+    LABEL_TEMPLATE,
+    AsyncDocker,
+    container_ip,
+    docker_client,
+)
+from app.utils.images import image_cache
+from app.utils.placement import CODESPACE_PORT, DockerHost, PlacementRegistry, placement
+from app.utils.workspace import populate, unshare
 from cryptography.fernet import Fernet
+from pymongo.errors import DuplicateKeyError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,6 +44,32 @@ logger = logging.getLogger(__name__)
 dir_path = os.path.dirname(os.path.realpath(__file__))
 cipher = Fernet(SECRET_KEY_USER)
 
+CODE_SERVER_CONFIG = "code-server/config.yaml"
+
+# Pupil.provision_state, in order; launch_codespace advances a pupil through
+# them and resumes from the recorded one
+CREATED = "created"
+DIRS_READY = "dirs_ready"
+CONTAINER_STARTED = "container_started"
+IP_BOUND = "ip_bound"
+READY = "ready"
+
+# UserIp.owner of the launch placeholders claimed here: the backend runs one
+# process per host, and the hostname outlives a restart of the container
+LAUNCH_OWNER = socket.gethostname()
+
+# Extensions shared by every codespace: babirusa/extensions, mounted read-only.
+# While it exists, per-user config dirs no longer get their own copy of the
+# template's extensions.
+SHARED_EXTENSIONS = "extensions"
+SHARED_EXTENSIONS_MOUNT = "/home/coder/.shared/extensions"
+CONFIG_EXTENSIONS = "code-server/extensions"
+
+
+def codespace_name(username: str) -> str:
+    """Container name, also the hostname the proxy resolves on CODESPACE_NETWORK."""
+    return f"codespace-{username}"
+
 
 def _get_paths():
     """
@@ -61,167 +115,684 @@ def _get_paths():
     return container_babirusa, host_babirusa
 
 
-async def launch_codespace(username: str, password: str) -> Optional[str]:
+def _prepare_user_dirs(container_babirusa: str, config_dir: str, prj_dir: str) -> None:
+    """Fills a codespace's config/project directories from the base templates."""
+    # ---- ensure base directories exist (inside container) ----
+    baseconfig_path = os.path.join(container_babirusa, "baseconfig")
+    baseprj_path = os.path.join(container_babirusa, "baseprj")
+
+    os.makedirs(baseconfig_path, exist_ok=True)
+    os.makedirs(baseprj_path, exist_ok=True)
+
+    shared = os.path.isdir(os.path.join(container_babirusa, SHARED_EXTENSIONS))
+
+    # Fill user dirs from the base templates if they don't exist yet
+    # (cloned or linked, see app.utils.workspace)
+    if not os.path.exists(config_dir) or not os.path.exists(prj_dir):
+        for template, user_dir, skip in (
+            (baseconfig_path, config_dir, [CONFIG_EXTENSIONS] if shared else []),
+            (baseprj_path, prj_dir, []),
+        ):
+            try:
+                stats = populate(template, user_dir, skip=skip)
+                logger.info(
+                    "Workspace %s: %d files, %d shared, %d bytes copied",
+                    user_dir, stats.files, stats.shared, stats.copied_bytes,
+                )
+            except Exception as e:
+                logger.error(f"Could not fill {user_dir} from {template}: {e}")
+                os.makedirs(user_dir, exist_ok=True)
+
+    # Ensure directories exist even if populating was skipped
+    os.makedirs(config_dir, exist_ok=True)
+    os.makedirs(prj_dir, exist_ok=True)
+
+    # ---- ensure main.py is in the USER's project dir ----
+    base_main = os.path.join(baseprj_path, "main.py")
+    user_main = os.path.join(prj_dir, "main.py")
+
+    if os.path.exists(base_main) and not os.path.exists(user_main):
+        shutil.copy2(base_main, user_main)
+        logger.info("Copied main.py → %s", user_main)
+
+
+def _codespace_labels(username: Optional[str] = None, teacher_id: Optional[str] = None) -> dict:
+    labels = {LABEL_CODESPACE: "1", LABEL_TEMPLATE: CODESPACE_TEMPLATE_VERSION}
+    if username:
+        labels[LABEL_PUPIL] = username
+    if teacher_id:
+        labels[LABEL_TEACHER] = teacher_id
+    return labels
+
+
+def _shared_extensions(container_babirusa: str, host_babirusa: str) -> Optional[str]:
+    """Host path of the shared extensions layer, None when there is none."""
+    if os.path.isdir(os.path.join(container_babirusa, SHARED_EXTENSIONS)):
+        return os.path.join(host_babirusa, SHARED_EXTENSIONS)
+    return None
+
+
+def _container_options(
+    host_config: str,
+    host_prj: str,
+    command: list,
+    environment: dict,
+    labels: dict,
+    host_extensions: Optional[str] = None,
+    name: Optional[str] = None,
+) -> dict:
+    volumes = {
+        host_config: {
+            "bind": "/home/coder/.config",
+            "mode": "rw",
+        },
+        host_prj: {
+            "bind": "/home/coder/prj",
+            "mode": "rw",
+        },
+    }
+    if host_extensions:
+        # one copy on disk and in the page cache for all containers
+        volumes[host_extensions] = {"bind": SHARED_EXTENSIONS_MOUNT, "mode": "ro"}
+        command = ["--extensions-dir", SHARED_EXTENSIONS_MOUNT, *command]
+    return dict(
+        user=0,
+        command=[
+            "--disable-telemetry",
+            "--disable-update-check",
+            "--log=debug",
+            *command,
+            "/home/coder/prj",
+        ],
+        hostname="0.0.0.0",
+        volumes=volumes,
+        environment={
+            "XDG_DATA_HOME": "/home/coder/.config",
+            **environment,
+        },
+        labels=labels,
+        mem_limit=f"{CODESPACE_MEMORY_MB:.0f}m",
+        mem_reservation=f"{CODESPACE_MEMORY_MB / 2:.0f}m",
+        nano_cpus=int(CODESPACE_CPUS * 1e9),
+        cpu_shares=int(CODESPACE_CPUS * 1024),
+        **({"name": name} if name else {}),
+        **({"network": CODESPACE_NETWORK} if CODESPACE_NETWORK else {}),
+    )
+
+
+# launches in flight in this process, by username
+_launches: dict[str, asyncio.Future] = {}
+
+
+async def launch_codespace(
+    username: str,
+    password: str,
+    teacher_id: Optional[str] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    placements: PlacementRegistry = placement,
+) -> Optional[str]:
+    """
+    Runs the pupil's provisioning to the end, from whatever state it was
+    left in, and returns the codespace IP. Every step is recorded on the
+    Pupil, so a launch interrupted by a restart resumes where it stopped.
+
+    Launches are single-flight per pupil: concurrent calls in this process
+    share one launch, and across backend workers the unique UserIp row
+    (a placeholder until the container has an address) decides who starts
+    the container while the others wait for its address.
+    """
     user = await Pupil.find_one(Pupil.username == username)
-    if user and password == (
+    if not user or password != (
         cipher.decrypt(user.hashed_password.encode("utf-8")).decode("utf-8")
     ):
-        client = docker.from_env()
+        return None
+
+    launch = _launches.get(username)
+    if launch is None:
+        launch = asyncio.ensure_future(
+            _launch(user, password, teacher_id, priority, placements)
+        )
+        _launches[username] = launch
+        launch.add_done_callback(lambda _: _launches.pop(username, None))
+    # a caller going away must not cancel the launch for the others
+    return await asyncio.shield(launch)
+
+
+async def _launch(
+    user: Pupil,
+    password: str,
+    teacher_id: Optional[str],
+    priority: int,
+    placements: PlacementRegistry,
+) -> Optional[str]:
+    username = user.username
+    userip = await UserIp.find_one(UserIp.username == username)
+    state = user.provision_state
+    if userip and userip.ip:
+        state = READY if state == READY else IP_BOUND
+    elif state in (IP_BOUND, READY):
+        # the codespace was removed since; start over from the container
+        state = CONTAINER_STARTED if user.container_id else CREATED
+
+    if state in (CREATED, DIRS_READY):
+        done = await _claim_launch(username)
+        if done is not None:
+            # another backend worker launched it meanwhile
+            return str(done.ip)
+        try:
+            state = await _provision_until_started(
+                user, password, teacher_id, priority, placements, state
+            )
+        except BaseException:
+            await UserIp.find(UserIp.username == username, UserIp.ip == "").delete()
+            raise
+        if state == READY:
+            return str((await UserIp.find_one(UserIp.username == username)).ip)
+
+    if state == CONTAINER_STARTED:
+        userip = await _provision_userip(user, placements)
+        state = await _set_provision_state(username, IP_BOUND)
+
+    if state == IP_BOUND:
+        status = await placements.docker_for(userip.host).container_status(userip.container_id)
+        if status != "running":
+            raise RuntimeError(f"codespace of {username} is {status}")
+        await _set_provision_state(username, READY, container_status="running")
+
+    return str(userip.ip)
+
+
+async def _provision_until_started(
+    user: Pupil,
+    password: str,
+    teacher_id: Optional[str],
+    priority: int,
+    placements: PlacementRegistry,
+    state: str,
+) -> str:
+    username = user.username
+    if state == CREATED:
+        warm_ip = await warm_pool.claim(username, password)
+        if warm_ip:
+            return await _set_provision_state(username, READY, container_status="running")
+        host = await _provision_dirs(user, placements)
+        state = await _set_provision_state(username, DIRS_READY, host=host.name)
+        user.host = host.name
+
+    user.container_id = await _provision_container(user, password, teacher_id, priority, placements)
+    return await _set_provision_state(username, CONTAINER_STARTED, container_id=user.container_id)
+
+
+async def release_launches() -> int:
+    """
+    Deletes the launch placeholders a previous run of this backend left
+    behind, so a pupil whose launch was cut short by a crash doesn't wait
+    out CODESPACE_LAUNCH_LEASE. Called at startup, before any launch of
+    this run: placeholders of other backend hosts are left to their lease.
+    """
+    result = await UserIp.get_motor_collection().delete_many(
+        {"ip": "", "owner": {"$in": [LAUNCH_OWNER, None]}}  # None: claimed before owners
+    )
+    released = result.deleted_count
+    if released:
+        logger.warning("Released %d codespace launches interrupted by a restart", released)
+    return released
 
-        container_babirusa, host_babirusa = _get_paths()
 
-        logger.info(
-            "Codespace paths — container: %s, host: %s",
-            container_babirusa,
-            host_babirusa,
+async def _claim_launch(username: str) -> Optional[UserIp]:
+    """
+    Makes this process the one launching the pupil's codespace: inserts the
+    placeholder UserIp, or takes over one whose launcher has been silent for
+    CODESPACE_LAUNCH_LEASE seconds. Returns None once claimed, or the UserIp
+    another worker completed while this one waited.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + 2 * CODESPACE_LAUNCH_LEASE
+    while True:
+        now = datetime.utcnow()
+        try:
+            await UserIp(
+                username=username, ip="", container_id="", claimed_at=now, owner=LAUNCH_OWNER
+            ).insert()
+            return None
+        except DuplicateKeyError:
+            pass
+        taken_over = await UserIp.get_motor_collection().update_one(
+            {
+                "username": username,
+                "ip": "",
+                "claimed_at": {"$lt": now - timedelta(seconds=CODESPACE_LAUNCH_LEASE)},
+            },
+            {"$set": {"claimed_at": now, "owner": LAUNCH_OWNER}},
         )
+        if taken_over.modified_count:
+            return None
+        userip = await UserIp.find_one(UserIp.username == username)
+        if userip is not None and userip.ip:
+            return userip
+        if loop.time() > deadline:
+            raise RuntimeError(f"codespace launch of {username} is stuck in another worker")
+        await asyncio.sleep(0.5)
+
+
+async def _bind_userip(
+    username: str, ip: str, container_id: str, host: Optional[str], port: Optional[int]
+) -> UserIp:
+    """Fills the pupil's UserIp (the launch placeholder, if there is one)."""
+    fields = dict(ip=ip, container_id=container_id, host=host, port=port, claimed_at=None)
+    await UserIp.get_motor_collection().update_one(
+        {"username": username}, {"$set": fields}, upsert=True
+    )
+    return UserIp(username=username, **fields)
 
-        ex_userip = await UserIp.find_one(UserIp.username == username)
 
-        if ex_userip:
-            return str(ex_userip.ip)
-        else:
-            # ---- ensure base directories exist (inside container) ----
-            baseconfig_path = os.path.join(container_babirusa, "baseconfig")
-            baseprj_path = os.path.join(container_babirusa, "baseprj")
+async def _set_provision_state(username: str, state: str, **fields) -> str:
+    await Pupil.get_motor_collection().update_one(
+        {"username": username},
+        {"$set": {"provision_state": state, "provision_error": None, **fields}},
+    )
+    return state
 
-            os.makedirs(baseconfig_path, exist_ok=True)
-            os.makedirs(baseprj_path, exist_ok=True)
 
-            # ---- per-user directories (container paths for file-ops) ----
-            user_config_container = os.path.join(
-                container_babirusa, f"user-{username}-config"
-            )
-            user_prj_container = os.path.join(
-                container_babirusa, f"user-{username}-prj"
-            )
+async def _provision_dirs(user: Pupil, placements: PlacementRegistry) -> DockerHost:
+    """created → dirs_ready: picks the Docker host and fills the user dirs."""
+    # ---- pick a Docker host; a pupil stays where its files are ----
+    host = await placements.choose(sticky=user.host)
+    # the image is pulled in the background; refuse rather than wait for it
+    image_cache.require(host)
+
+    container_babirusa, _ = _get_paths()
+    # ---- per-user directories (container paths for file-ops) ----
+    user_config_container = os.path.join(
+        container_babirusa, f"user-{user.username}-config"
+    )
+    user_prj_container = os.path.join(
+        container_babirusa, f"user-{user.username}-prj"
+    )
+    await asyncio.to_thread(
+        _prepare_user_dirs, container_babirusa, user_config_container, user_prj_container
+    )
+    return host
+
+
+async def _provision_container(
+    user: Pupil,
+    password: str,
+    teacher_id: Optional[str],
+    priority: int,
+    placements: PlacementRegistry,
+) -> str:
+    """dirs_ready → container_started: starts the container once it fits the budget."""
+    host = placements.get(user.host)
+    image_cache.require(host)
+    container_babirusa, host_babirusa = _get_paths()
+
+    # ---- HOST paths for Docker bind-mounts ----
+    host_user_config = os.path.normpath(
+        os.path.join(host_babirusa, f"user-{user.username}-config")
+    )
+    host_user_prj = os.path.normpath(
+        os.path.join(host_babirusa, f"user-{user.username}-prj")
+    )
+
+    logger.info(
+        "Volume mounts (host paths) — config: %s, prj: %s",
+        host_user_config,
+        host_user_prj,
+    )
+
+    options = _container_options(
+        host_user_config,
+        host_user_prj,
+        [],
+        {"HASHED_PASSWORD": _code_server_hash(password)},
+        _codespace_labels(user.username, teacher_id),
+        _shared_extensions(container_babirusa, host_babirusa),
+        codespace_name(user.username),
+    )
+    if not host.is_local:
+        # remote daemons are reached through a published port
+        options["ports"] = {f"{CODESPACE_PORT}/tcp": None}
+
+    await _ensure_network(host)
+    # ---- wait for host capacity, then start with HOST paths in volumes ----
+    await admission.acquire(user.username, priority, host.name)
+    try:
+        container_id = await host.docker.run_container(CODESPACE_IMAGE, **options)
+    except BaseException:
+        admission.release(user.username)
+        raise
+    admission.started(user.username)
+    return container_id
 
-            # Copy base templates if user dirs don't exist yet
-            if not os.path.exists(user_config_container) or not os.path.exists(
-                user_prj_container
-            ):
-                if os.path.exists(baseconfig_path):
-                    try:
-                        copy_tree(baseconfig_path, user_config_container)
-                    except Exception:
-                        os.makedirs(user_config_container, exist_ok=True)
-
-                if os.path.exists(baseprj_path):
-                    try:
-                        copy_tree(baseprj_path, user_prj_container)
-                    except Exception:
-                        os.makedirs(user_prj_container, exist_ok=True)
-
-            # Ensure directories exist even if copy_tree was skipped
-            os.makedirs(user_config_container, exist_ok=True)
-            os.makedirs(user_prj_container, exist_ok=True)
-
-            # ---- ensure main.py is in the USER's project dir ----
-            base_main = os.path.join(baseprj_path, "main.py")
-            user_main = os.path.join(user_prj_container, "main.py")
-
-            if os.path.exists(base_main) and not os.path.exists(user_main):
-                shutil.copy2(base_main, user_main)
-                logger.info("Copied main.py → %s", user_main)
-
-            # ---- HOST paths for Docker bind-mounts ----
-            host_user_config = os.path.normpath(
-                os.path.join(host_babirusa, f"user-{username}-config")
+
+async def _provision_userip(user: Pupil, placements: PlacementRegistry) -> UserIp:
+    """container_started → ip_bound: records where the proxy reaches the codespace."""
+    host = placements.get(user.host)
+    ip_address, port = await placements.address(host, user.container_id)
+    if not ip_address:
+        raise RuntimeError(f"codespace {user.container_id} of {user.username} has no address yet")
+
+    logger.info("Creating UserIp entry for user %s on %s", user.username, host.name)
+    return await _bind_userip(user.username, ip_address, user.container_id, host.name, port)
+
+
+# Docker hosts CODESPACE_NETWORK is known to exist on
+_networks: set[str] = set()
+
+
+async def _ensure_network(host: DockerHost) -> None:
+    if not CODESPACE_NETWORK or host.name in _networks:
+        return
+    # only the local daemon runs the proxy's container, remote codespaces use published ports
+    peers = CODESPACE_NETWORK_PEERS if host.is_local else []
+    await host.docker.ensure_network(CODESPACE_NETWORK, peers)
+    _networks.add(host.name)
+
+
+# launches running after their request returned; kept referenced until done
+_background: set[asyncio.Task] = set()
+
+
+def _keep(task: asyncio.Task) -> asyncio.Task:
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+# written to babirusa/ and read back through a bind mount on every remote host
+STORAGE_CHECK = ".storage-check"
+
+
+async def check_shared_storage(placements: PlacementRegistry = placement) -> None:
+    """
+    Lets remote Docker hosts take new codespaces once they see the babirusa
+    directory: user dirs are filled here and bind-mounted there, so without
+    shared storage (the same host path everywhere) a pupil would get empty
+    directories while FileManager reads a copy the container never sees.
+    """
+    remote = [host for host in placements.hosts.values() if host.name not in placements.shared]
+    if not remote:
+        return
+    container_babirusa, host_babirusa = _get_paths()
+    marker = os.path.join(container_babirusa, STORAGE_CHECK)
+    token = secrets.token_hex(16)
+    await asyncio.to_thread(_write_file, marker, token)
+
+    async def check(host: DockerHost) -> None:
+        try:
+            await image_cache.wait(host)
+            output = await host.docker.run_once(
+                CODESPACE_IMAGE,
+                entrypoint=["cat"],
+                command=[f"/babirusa/{STORAGE_CHECK}"],
+                volumes={host_babirusa: {"bind": "/babirusa", "mode": "ro"}},
             )
-            host_user_prj = os.path.normpath(
-                os.path.join(host_babirusa, f"user-{username}-prj")
+        except Exception as e:
+            logger.error(f"Storage check on {host.name} failed: {getattr(e, 'detail', e)}")
+            output = b""
+        if output.strip() == token.encode():
+            placements.mark_shared(host.name)
+            logger.info("Docker host %s shares %s", host.name, host_babirusa)
+        else:
+            logger.error(
+                f"Docker host {host.name} does not see {host_babirusa} as shared storage, "
+                "no new codespaces are placed there"
             )
 
-            logger.info(
-                "Volume mounts (host paths) — config: %s, prj: %s",
-                host_user_config,
-                host_user_prj,
-            )
+    try:
+        await asyncio.gather(*(check(host) for host in remote))
+    finally:
+        await asyncio.to_thread(os.remove, marker)
+
+
+def check_storage_later(placements: PlacementRegistry = placement) -> asyncio.Task:
+    return _keep(asyncio.create_task(check_shared_storage(placements)))
+
 
-            # ---- pull / verify image ----
-            image_name = os.getenv("CODESPACE_IMAGE", "skfx/babirusa-codeserver")
+def unshare_workspaces() -> int:
+    """
+    Separates user and warm dirs filled by the former hardlink mode from the
+    templates, so a write inside a codespace stays in its workspace.
+    """
+    container_babirusa, _ = _get_paths()
+    try:
+        names = os.listdir(container_babirusa)
+    except FileNotFoundError:
+        return 0
+    templates = [os.path.join(container_babirusa, name) for name in ("baseconfig", "baseprj")]
+    roots = [
+        os.path.join(container_babirusa, name) for name in names
+        if name.startswith(("user-", "warm-"))
+    ]
+    separated = unshare(templates, roots)
+    if separated:
+        logger.warning("Gave %d hard-linked workspace files their own copy", separated)
+    return separated
+
+
+def unshare_workspaces_later() -> asyncio.Task:
+    return _keep(asyncio.create_task(asyncio.to_thread(unshare_workspaces)))
+
+
+async def _start_logged(
+    username: str, container_id: str, docker: AsyncDocker, host: Optional[str]
+) -> None:
+    try:
+        await admission.acquire(username, host=host)
+        await docker.start(container_id)
+    except Exception as e:
+        admission.release(username)
+        logger.error(f"Background codespace start failed for {username}: {e}")
+        return
+    admission.started(username)
+
+
+def start_later(
+    username: str,
+    container_id: str,
+    docker: AsyncDocker = docker_client,
+    host: Optional[str] = None,
+) -> asyncio.Task:
+    """Starts an existing container once it fits its host's budget."""
+    return _keep(asyncio.create_task(_start_logged(username, container_id, docker, host)))
+
+
+class WarmPool:
+    """
+    Already running codespace containers that no pupil owns yet.
+
+    Each one is started on its own pair of slot directories
+    (warm-<slot>-config / warm-<slot>-prj) filled from the templates, with
+    code-server reading its password hash from a config.yaml inside the
+    config directory. Claiming a container renames the slot directories to
+    the pupil's user-<username>-* directories (leaving relative symlinks
+    behind, so the container's bind mounts still resolve after a restart),
+    writes the hash of the pupil's password, records the container and host
+    on the Pupil and restarts code-server in the background. The container
+    keeps the labels it was started with, so it carries no LABEL_PUPIL:
+    lookups by container id go through UserIp.
+    """
+
+    def __init__(self, size: int = CODESPACE_WARM_POOL_SIZE):
+        self.size = size
+        self._refilling: Optional[asyncio.Task] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def claim(self, username: str, password: str) -> Optional[str]:
+        """Binds a warm container to the pupil; returns its IP or None if the pool is empty."""
+        if self.size <= 0 or not placement.default.is_local:
+            # warm containers run on the local daemon, reached by container IP
+            return None
+        container_babirusa, _ = _get_paths()
+        if os.path.exists(os.path.join(container_babirusa, f"user-{username}-prj")):
+            # a pupil re-created under an old username keeps its files
+            return None
+
+        doc = await WarmContainer.get_motor_collection().find_one_and_delete(
+            {}, sort=[("created_at", 1)]
+        )
+        self.refill_later()
+        if doc is None:
+            return None
+        warm = WarmContainer.model_validate(doc)
+
+        try:
+            await asyncio.to_thread(self._bind_dirs, container_babirusa, warm.slot, username, password)
+        except OSError as e:
+            logger.error(f"Could not bind warm codespace {warm.slot} to {username}: {e}")
+            self._spawn(docker_client.remove(warm.container_id, force=True, v=True))
+            admission.release(f"warm:{warm.slot}")
+            return None
+
+        admission.rename(f"warm:{warm.slot}", username)
+        await _bind_userip(username, warm.ip, warm.container_id, placement.default.name, None)
+        await Pupil.get_motor_collection().update_one(
+            {"username": username},
+            {"$set": {"container_id": warm.container_id, "host": placement.default.name}},
+        )
+        self._spawn(self._restart(username, warm.container_id))
+        logger.info("Bound warm codespace %s to %s", warm.slot, username)
+        return warm.ip
+
+    @staticmethod
+    def _bind_dirs(container_babirusa: str, slot: str, username: str, password: str) -> None:
+        for kind in ("config", "prj"):
+            slot_dir = os.path.join(container_babirusa, f"warm-{slot}-{kind}")
+            user_dir = os.path.join(container_babirusa, f"user-{username}-{kind}")
+            os.rename(slot_dir, user_dir)
+            os.symlink(f"user-{username}-{kind}", slot_dir)
+        _write_code_server_config(
+            os.path.join(container_babirusa, f"user-{username}-config"), password
+        )
+
+    async def _restart(self, username: str, container_id: str) -> None:
+        """Restarts code-server so it picks up the pupil's password."""
+        try:
+            await docker_client.rename(container_id, codespace_name(username))
+            await docker_client.restart(container_id)
+            ip = container_ip(await docker_client.container_attrs(container_id), CODESPACE_NETWORK)
+        except Exception as e:
+            logger.error(f"Could not restart codespace of {username}: {e}")
+            return
+        userip = await UserIp.find_one(UserIp.username == username)
+        if ip and userip and userip.ip != ip:
+            userip.ip = ip
+            await userip.save()
+
+    def refill_later(self) -> None:
+        if not (self.size > 0 and placement.default.is_local):
+            return
+        if self._refilling is None or self._refilling.done():
+            self._refilling = self._spawn(self.refill())
+
+    async def refill(self) -> None:
+        while await WarmContainer.count() < self.size:
             try:
-                client.images.get(image_name)
-            except docker.errors.ImageNotFound:
-                logger.info("Image %s not found locally, pulling…", image_name)
-                client.images.pull(image_name)
-
-            # ---- start container with HOST paths in volumes ----
-            new_container = client.containers.run(
-                image_name,
-                detach=True,
-                user=0,
-                command=[
-                    "--disable-telemetry",
-                    "--disable-update-check",
-                    "--log=debug",
-                    "/home/coder/prj",
-                ],
-                hostname="0.0.0.0",
-                volumes={
-                    host_user_config: {
-                        "bind": "/home/coder/.config",
-                        "mode": "rw",
-                    },
-                    host_user_prj: {
-                        "bind": "/home/coder/prj",
-                        "mode": "rw",
-                    },
-                },
-                environment={
-                    "XDG_DATA_HOME": "/home/coder/.config",
-                    "PASSWORD": password,
-                },
-                mem_limit="512m",
-                mem_reservation="256m",
-                nano_cpus=500000000,
-                cpu_shares=512,
-            ).id
-
-            # ---- resolve container IP on the bridge network ----
-            network = client.networks.get("bridge").attrs
-
-            for cid, payload in network["Containers"].items():
-                if new_container == cid:
-                    ip_address = payload["IPv4Address"].split("/")[0]
-                    logger.info("Found IP address: %s", ip_address)
-                    userport = UserIp(
-                        username=username,
-                        ip=ip_address,
-                        container_id=new_container,
-                    )
-                    logger.info("Creating UserIp entry for user %s", username)
-                    await userport.create()
-                    return ip_address
+                await self.provision()
+            except Exception as e:
+                logger.error(f"Could not provision warm codespace: {e}")
+                return
+
+    async def provision(self) -> WarmContainer:
+        container_babirusa, host_babirusa = _get_paths()
+        slot = uuid.uuid4().hex[:12]
+        config_dir = os.path.join(container_babirusa, f"warm-{slot}-config")
+        prj_dir = os.path.join(container_babirusa, f"warm-{slot}-prj")
+        await asyncio.to_thread(_prepare_user_dirs, container_babirusa, config_dir, prj_dir)
+        # nobody can log in until the container is claimed and restarted
+        await asyncio.to_thread(_write_code_server_config, config_dir, secrets.token_urlsafe(24))
+
+        await image_cache.wait(placement.default)
+        await _ensure_network(placement.default)
+        # warm containers count against the budget, behind real launches
+        key = f"warm:{slot}"
+        await admission.acquire(key, PRIORITY_WARM_POOL)
+        try:
+            container_id = await docker_client.run_container(
+                CODESPACE_IMAGE,
+                **_container_options(
+                    os.path.join(host_babirusa, f"warm-{slot}-config"),
+                    os.path.join(host_babirusa, f"warm-{slot}-prj"),
+                    ["--config", f"/home/coder/.config/{CODE_SERVER_CONFIG}"],
+                    {},
+                    _codespace_labels(),
+                    _shared_extensions(container_babirusa, host_babirusa),
+                    f"codespace-warm-{slot}",
+                ),
+            )
+        except BaseException:
+            admission.release(key)
+            raise
+        admission.started(key)
+        ip = container_ip(await docker_client.container_attrs(container_id), CODESPACE_NETWORK)
+        if not ip:
+            await docker_client.remove(container_id, force=True, v=True)
+            admission.release(key)
+            raise RuntimeError(f"warm codespace {container_id} has no IP")
+        warm = WarmContainer(slot=slot, container_id=container_id, ip=ip)
+        await warm.create()
+        return warm
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        # keep a reference, the event loop only holds tasks weakly
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+
+def _write_file(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def _code_server_hash(password: str) -> str:
+    # code-server takes an argon2 or a SHA-256 hash; argon2 needs another dependency
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+
+def _write_code_server_config(config_dir: str, password: str) -> None:
+    """Writes the code-server config of a shared config dir, without the plaintext password."""
+    path = os.path.join(config_dir, CODE_SERVER_CONFIG)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(
+            "bind-addr: 0.0.0.0:8080\n"
+            "auth: password\n"
+            f"hashed-password: {json.dumps(_code_server_hash(password))}\n"
+            "cert: false\n"
+        )
 
-    else:
-        return None
 
+warm_pool = WarmPool()
 
-async def check_container_status(pupils):
-    usernames = []
-    for pupil in pupils:
-        usernames.append(pupil.username)
 
-    userips = await UserIp.find_many({"username": {"$in": usernames}}).to_list()
-    print(userips, flush=True)
-    if not userips:
-        raise Error.PUPIL_NOT_FOUND
+async def codespace_statuses(
+    container_ids: list[str], docker: AsyncDocker = docker_client
+) -> dict[str, str]:
+    """
+    Docker status of the given containers by id, "removed" for missing ones.
 
-    client = docker.from_env()
-    pupils = []
+    One labelled list call covers every codespace; containers created before
+    labels existed are fetched with one more call filtered by id.
+    """
+    statuses = await docker.container_statuses({"label": LABEL_CODESPACE})
+    unlabelled = [cid for cid in container_ids if cid not in statuses]
+    if unlabelled:
+        statuses.update(await docker.container_statuses({"id": unlabelled}))
+    return {cid: statuses.get(cid, "removed") for cid in container_ids}
+
+
+async def codespace_statuses_by_host(
+    userips: list[UserIp], placements: PlacementRegistry = placement
+) -> dict[str, str]:
+    """codespace_statuses over every Docker host, by container id."""
+    by_host: dict[str, list[str]] = {}
     for userip in userips:
-        pupil = await Pupil.find_one(Pupil.username == userip.username)
-        try:
-            status = client.containers.get(userip.container_id).status.lower()
-        except docker.errors.NotFound:
-            status = "removed"
-        except Exception:
-            status = "unknown"
-
-        if pupil.container_status != status:
-            pupil.container_status = status
-            await pupil.save()
-        pupils.append(pupil)
-
-    return pupils
+        by_host.setdefault(placements.get(userip.host).name, []).append(userip.container_id)
+    statuses = {}
+    for name, container_ids in by_host.items():
+        statuses.update(await codespace_statuses(container_ids, placements.docker_for(name)))
+    return statuses
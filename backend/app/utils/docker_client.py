@@ -0,0 +1,212 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import docker
+from app import (
+    DOCKER_MAX_CONCURRENCY,
+    DOCKER_PULL_TIMEOUT,
+    DOCKER_TIMEOUT,
+    DOCKER_WORKERS,
+)
+from app.utils.error import Error
+
+logger = logging.getLogger(__name__)
+
+# Codespace container labels. Labels are fixed at creation, so containers
+# bound from the warm pool carry only LABEL_CODESPACE and LABEL_TEMPLATE.
+LABEL_CODESPACE = "babirusa.codespace"
+LABEL_PUPIL = "babirusa.pupil"
+LABEL_TEACHER = "babirusa.teacher"
+LABEL_TEMPLATE = "babirusa.template"
+
+
+class AsyncDocker:
+    """
+    Async facade over one shared docker SDK client.
+
+    The SDK is synchronous, so every call runs on a small dedicated thread
+    pool; at most `concurrency` calls are in flight and each one is bounded by
+    a timeout. A call that times out keeps its worker thread until Docker
+    answers, but the request waiting for it gets Error.DOCKER_TIMEOUT.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable = docker.from_env,
+        workers: int = DOCKER_WORKERS,
+        concurrency: int = DOCKER_MAX_CONCURRENCY,
+        timeout: float = DOCKER_TIMEOUT,
+        pull_timeout: float = DOCKER_PULL_TIMEOUT,
+    ):
+        self.client = None
+        self._client_factory = client_factory
+        self._client_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="docker")
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        self.pull_timeout = pull_timeout
+
+    def get_client(self):
+        """The shared SDK client, created on first use. Blocking calls only off the loop."""
+        with self._client_lock:
+            if self.client is None:
+                self.client = self._client_factory()
+        return self.client
+
+    def _call(self, func: Callable, *args, **kwargs):
+        return func(self.get_client(), *args, **kwargs)
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """Runs func(client, *args, **kwargs) on the Docker thread pool."""
+        timeout = timeout or self.timeout
+        call = functools.partial(self._call, func, *args, **kwargs)
+        async with self._semaphore:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, call)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Docker call {func.__name__} timed out after {timeout:g}s")
+                raise Error.DOCKER_TIMEOUT
+
+    async def container_status(self, container_id: str) -> str:
+        return await self.run(_container_status, container_id)
+
+    async def start(self, container_id: str) -> None:
+        await self.run(_start, container_id)
+
+    async def stop(self, container_id: str) -> None:
+        await self.run(_stop, container_id)
+
+    async def restart(self, container_id: str) -> None:
+        await self.run(_restart, container_id)
+
+    async def container_attrs(self, container_id: str) -> dict:
+        return await self.run(_container_attrs, container_id)
+
+    async def remove(self, container_id: str, **kwargs) -> None:
+        await self.run(_remove, container_id, **kwargs)
+
+    async def ensure_image(self, image_name: str) -> str:
+        """Pulls the image if it is missing; returns its id."""
+        return await self.run(_ensure_image, image_name, timeout=self.pull_timeout)
+
+    async def run_container(self, image_name: str, **kwargs) -> str:
+        """Starts a detached container and returns its id."""
+        return await self.run(_run_container, image_name, **kwargs)
+
+    async def run_once(self, image_name: str, **kwargs) -> bytes:
+        """Runs a container to completion, removes it and returns its output."""
+        return await self.run(_run_once, image_name, **kwargs)
+
+    async def container_statuses(self, filters: Optional[dict] = None) -> dict[str, str]:
+        """Status of every container (stopped ones included) by id, in one call."""
+        return await self.run(_container_statuses, filters)
+
+    async def rename(self, container_id: str, name: str) -> None:
+        await self.run(_rename, container_id, name)
+
+    async def ensure_network(self, name: str, peers: list[str] = ()) -> None:
+        """Creates the bridge network if missing and connects the peer containers to it."""
+        await self.run(_ensure_network, name, list(peers))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def container_ip(attrs: dict, network: Optional[str] = None) -> Optional[str]:
+    settings = attrs.get("NetworkSettings", {})
+    if network and settings.get("Networks", {}).get(network, {}).get("IPAddress"):
+        return settings["Networks"][network]["IPAddress"]
+    if settings.get("IPAddress"):
+        return settings["IPAddress"]
+    for network in settings.get("Networks", {}).values():
+        if network.get("IPAddress"):
+            return network["IPAddress"]
+    return None
+
+
+def _container_status(client, container_id: str) -> str:
+    return client.containers.get(container_id).status.lower()
+
+
+def _start(client, container_id: str) -> None:
+    client.containers.get(container_id).start()
+
+
+def _stop(client, container_id: str) -> None:
+    client.containers.get(container_id).stop()
+
+
+def _restart(client, container_id: str) -> None:
+    client.containers.get(container_id).restart()
+
+
+def _container_attrs(client, container_id: str) -> dict:
+    return client.containers.get(container_id).attrs
+
+
+def _remove(client, container_id: str, **kwargs) -> None:
+    client.containers.get(container_id).remove(**kwargs)
+
+
+def _ensure_image(client, image_name: str) -> str:
+    try:
+        return client.images.get(image_name).id
+    except docker.errors.ImageNotFound:
+        logger.info("Image %s not found locally, pulling…", image_name)
+        return client.images.pull(image_name).id
+
+
+def _run_container(client, image_name: str, **kwargs) -> str:
+    try:
+        return client.containers.run(image_name, detach=True, **kwargs).id
+    except docker.errors.APIError as e:
+        if e.status_code != 409 or not kwargs.get("name"):
+            raise
+    # containers are named: one left behind by an interrupted launch is reused
+    container = client.containers.get(kwargs["name"])
+    logger.info("Reusing existing container %s", kwargs["name"])
+    if container.status != "running":
+        container.start()
+    return container.id
+
+
+def _run_once(client, image_name: str, **kwargs) -> bytes:
+    return client.containers.run(image_name, remove=True, **kwargs)
+
+
+def _container_statuses(client, filters: Optional[dict]) -> dict[str, str]:
+    # sparse: one list call instead of an inspect per container
+    return {
+        container.id: container.status.lower()
+        for container in client.containers.list(all=True, sparse=True, filters=filters or {})
+    }
+
+
+def _rename(client, container_id: str, name: str) -> None:
+    client.containers.get(container_id).rename(name)
+
+
+def _ensure_network(client, name: str, peers: list[str]) -> None:
+    try:
+        network = client.networks.get(name)
+    except docker.errors.NotFound:
+        logger.info("Creating network %s", name)
+        network = client.networks.create(name, driver="bridge", labels={LABEL_CODESPACE: "1"})
+    connected = set(network.attrs.get("Containers") or {})
+    for peer in peers:
+        try:
+            container = client.containers.get(peer)
+            if container.id not in connected:
+                network.connect(container)
+        except docker.errors.NotFound:
+            logger.warning("Container %s to connect to %s not found", peer, name)
+        except docker.errors.APIError as e:
+            logger.error(f"Could not connect {peer} to {name}: {e}")
+
+
+docker_client = AsyncDocker()
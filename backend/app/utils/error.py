@@ -42,5 +42,33 @@ class Error(Exception):
         status_code=status.HTTP_404_NOT_FOUND,
         detail="User ip not found."
     )
-    
-    
\ No newline at end of file
+
+    DOCKER_TIMEOUT = HTTPException(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        detail="Docker did not respond in time."
+    )
+
+    INVALID_IMPORT_FILE = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Import file must be UTF-8 CSV."
+    )
+
+    NO_HOST_CAPACITY = HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="No Docker host has room for another codespace."
+    )
+
+    IMAGE_NOT_READY = HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Codespace image is still being prepared, try again shortly."
+    )
+
+    CODESPACE_LAUNCHING = HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Codespace is still being launched."
+    )
+
+    INVALID_SEARCH_PATTERN = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Search pattern is not a valid regular expression."
+    )
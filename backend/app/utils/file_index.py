@@ -0,0 +1,382 @@
+"""
+In-memory index of a pupil project's files, shared by every FileManager
+query instead of an os.walk plus an os.stat per file on each call.
+
+The index keeps one listing per directory (built with os.scandir, with the
+size and mtime the scan already returned) and brings itself up to date
+before each query:
+
+inotify — Linux: every indexed directory is watched and only directories
+          with pending events are rescanned; an unchanged project costs a
+          single non-blocking read.
+polling — elsewhere, or when the watch limit is reached: at most every
+          FILE_INDEX_POLL_INTERVAL seconds, directories whose mtime changed
+          are rescanned and the files of the others re-stat'ed (an in-place
+          edit does not touch the directory's mtime).
+
+inotify only reports writes made through this machine's kernel. Codespaces
+on a remote Docker host write over shared storage (NFS and the like), so
+FILE_INDEX_INOTIFY defaults to off once DOCKER_HOSTS has a TCP host and the
+index polls instead (polling as a backstop next to inotify would cost as
+much as polling alone).
+
+Like os.walk, symlinked directories are listed but not descended into.
+Whether a file is binary (a NUL byte in its first BINARY_SNIFF_BYTES, as
+git decides) is sniffed once per mtime and size.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, NamedTuple, Optional
+
+from app import FILE_INDEX_INOTIFY, FILE_INDEX_MAX_PROJECTS, FILE_INDEX_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+BINARY_SNIFF_BYTES = 8000
+
+
+class FileEntry(NamedTuple):
+    relative_path: str  # "/"-separated, relative to the project root
+    path: str
+    name: str
+    size: int
+    mtime_ns: int
+
+
+def sniff_binary(path: str) -> bool:
+    with open(path, "rb") as f:
+        return b"\0" in f.read(BINARY_SNIFF_BYTES)
+
+
+class _Dir:
+    __slots__ = ("mtime_ns", "files", "subdirs")
+
+    def __init__(self, mtime_ns: int, files: dict[str, FileEntry], subdirs: list[str]):
+        self.mtime_ns = mtime_ns
+        self.files = files
+        self.subdirs = subdirs
+
+
+class _Inotify:
+    """Just enough of inotify(7) through ctypes: watches and a non-blocking drain."""
+
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x01000000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+
+    MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        | IN_CREATE | IN_DELETE | IN_ONLYDIR
+    )
+    _EVENT = struct.Struct("iIII")
+
+    _libc = None
+
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    @classmethod
+    def create(cls) -> Optional["_Inotify"]:
+        try:
+            if cls._libc is None:
+                cls._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = cls._libc.inotify_init1(cls.IN_NONBLOCK | cls.IN_CLOEXEC)
+        except (OSError, AttributeError):  # not Linux
+            return None
+        if fd < 0:
+            logger.warning("inotify unavailable: %s", os.strerror(ctypes.get_errno()))
+            return None
+        return cls(fd)
+
+    def add_watch(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), path)
+        return wd
+
+    def remove_watch(self, wd: int) -> None:
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self) -> list[tuple[int, int]]:
+        """Pending (watch descriptor, mask) pairs; empty when there are none."""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = self._EVENT.unpack_from(data, offset)
+                events.append((wd, mask))
+                offset += self._EVENT.size + length
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FileIndex:
+    def __init__(
+        self,
+        root: str,
+        use_inotify: bool = FILE_INDEX_INOTIFY,
+        poll_interval: float = FILE_INDEX_POLL_INTERVAL,
+    ):
+        self.root = root
+        self.poll_interval = poll_interval
+        self._inotify = _Inotify.create() if use_inotify else None
+        self._dirs: dict[str, _Dir] = {}  # relative dir ("" = root) → listing
+        self._watches: dict[int, str] = {}  # watch descriptor → relative dir
+        self._dirty: set[str] = set()
+        self._entries: Optional[list[FileEntry]] = None
+        self._derived: dict[str, Any] = {}  # built from _entries, dropped with it
+        self._binary: dict[str, tuple[int, int, bool]] = {}  # path → (mtime, size, binary)
+        self._polled_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def watching(self) -> bool:
+        return self._inotify is not None
+
+    def entries(self) -> list[FileEntry]:
+        """All files of the project, sorted by relative path. Do not modify the list."""
+        with self._lock:
+            return self._current()
+
+    def derived(self, key: str, build: Callable[[list[FileEntry]], Any]) -> Any:
+        """build(entries), computed again only once the project has changed."""
+        with self._lock:
+            entries = self._current()
+            if key not in self._derived:
+                self._derived[key] = build(entries)
+            return self._derived[key]
+
+    def text_entries(self) -> list[FileEntry]:
+        """entries() without binary files."""
+        return self.derived("text", self._without_binaries)
+
+    def is_binary(self, path: str, mtime_ns: int, size: int) -> bool:
+        with self._lock:
+            return self._is_binary(path, mtime_ns, size)
+
+    def _is_binary(self, path: str, mtime_ns: int, size: int) -> bool:
+        cached = self._binary.get(path)
+        if cached is not None and cached[:2] == (mtime_ns, size):
+            return cached[2]
+        try:
+            binary = size > 0 and sniff_binary(path)
+        except OSError:
+            binary = False
+        self._binary[path] = (mtime_ns, size, binary)
+        return binary
+
+    def _without_binaries(self, entries: list[FileEntry]) -> list[FileEntry]:
+        # runs under the lock, from derived()
+        text = [e for e in entries if not self._is_binary(e.path, e.mtime_ns, e.size)]
+        present = {e.path for e in entries}
+        self._binary = {path: v for path, v in self._binary.items() if path in present}
+        return text
+
+    def _current(self) -> list[FileEntry]:
+        self._refresh()
+        if self._entries is None:
+            entries = [entry for d in self._dirs.values() for entry in d.files.values()]
+            entries.sort(key=lambda entry: entry.relative_path)
+            self._entries = entries
+            self._derived = {}
+        return self._entries
+
+    def invalidate(self, path: str) -> None:
+        """Marks the directory holding path (absolute) for a rescan on the next query."""
+        parent = os.path.relpath(os.path.dirname(path), self.root)
+        with self._lock:
+            self._dirty.add("" if parent == "." else parent.replace(os.sep, "/"))
+
+    def close(self) -> None:
+        with self._lock:
+            self._stop_watching()
+            self._dirs.clear()
+            self._entries = None
+
+    def _refresh(self) -> None:
+        if "" not in self._dirs:
+            self._dirty.clear()
+            self._scan_tree("")
+            self._polled_at = time.monotonic()
+            return
+
+        if self._inotify is not None:
+            for wd, mask in self._inotify.read():
+                if mask & _Inotify.IN_Q_OVERFLOW:
+                    self._dirty.add("")
+                    self._polled_at = None  # lost events: check everything
+                elif not mask & _Inotify.IN_IGNORED and wd in self._watches:
+                    self._dirty.add(self._watches[wd])
+            if self._polled_at is not None:
+                self._rescan_dirty()
+                return
+
+        now = time.monotonic()
+        if self._polled_at is not None and now - self._polled_at < self.poll_interval:
+            self._rescan_dirty()
+            return
+        self._dirty.clear()
+        self._poll()
+        self._polled_at = now
+
+    def _rescan_dirty(self) -> None:
+        # parents first, so a removed directory is dropped before its children
+        for rel in sorted(self._dirty, key=len):
+            # a directory created since the last scan shows up in its nearest known parent
+            while rel and rel not in self._dirs:
+                rel = os.path.dirname(rel)
+            self._rescan(rel)
+        self._dirty.clear()
+
+    def _poll(self) -> None:
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            listing = self._dirs.get(rel)
+            if listing is None:
+                continue
+            try:
+                mtime_ns = os.stat(self._path(rel)).st_mtime_ns
+            except OSError:
+                self._drop(rel)
+                continue
+            if mtime_ns != listing.mtime_ns:
+                self._rescan(rel)
+            else:
+                self._restat(listing)
+            if rel in self._dirs:
+                stack.extend(self._dirs[rel].subdirs)
+
+    def _restat(self, listing: _Dir) -> None:
+        for name, entry in listing.files.items():
+            try:
+                stat = os.stat(entry.path)
+            except OSError:
+                continue  # removal shows in the directory's mtime
+            if stat.st_size != entry.size or stat.st_mtime_ns != entry.mtime_ns:
+                listing.files[name] = entry._replace(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                self._entries = None
+
+    def _rescan(self, rel: str) -> None:
+        old = self._dirs.get(rel)
+        new = self._scan(rel)
+        if new is None:
+            self._drop(rel)
+            return
+        if old is not None:
+            for sub in set(old.subdirs) - set(new.subdirs):
+                self._drop(sub)
+        self._dirs[rel] = new
+        self._entries = None
+        for sub in new.subdirs:
+            if sub not in self._dirs:
+                self._scan_tree(sub)
+
+    def _scan_tree(self, rel: str) -> None:
+        stack = [rel]
+        while stack:
+            current = stack.pop()
+            listing = self._scan(current)
+            if listing is None:
+                continue
+            self._dirs[current] = listing
+            stack.extend(listing.subdirs)
+        self._entries = None
+
+    def _scan(self, rel: str) -> Optional[_Dir]:
+        path = self._path(rel)
+        try:
+            # mtime before the listing: a change during the scan triggers another one
+            mtime_ns = os.stat(path).st_mtime_ns
+            self._watch(rel, path)
+            files: dict[str, FileEntry] = {}
+            subdirs: list[str] = []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    child = f"{rel}/{entry.name}" if rel else entry.name
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirs.append(child)
+                        continue
+                    try:
+                        stat = entry.stat()
+                        size, entry_mtime_ns = stat.st_size, stat.st_mtime_ns
+                    except OSError:  # dangling symlink
+                        size = entry_mtime_ns = 0
+                    files[entry.name] = FileEntry(child, entry.path, entry.name, size, entry_mtime_ns)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return _Dir(mtime_ns, files, subdirs)
+
+    def _watch(self, rel: str, path: str) -> None:
+        if self._inotify is None:
+            return
+        try:
+            wd = self._inotify.add_watch(path)
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                return
+            # ENOSPC: fs.inotify.max_user_watches reached
+            logger.warning(f"Falling back to polling for {self.root}: {e}")
+            self._stop_watching()
+            return
+        self._watches[wd] = rel
+
+    def _stop_watching(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+            self._watches.clear()
+
+    def _drop(self, rel: str) -> None:
+        prefix = f"{rel}/" if rel else ""
+        for key in [key for key in self._dirs if key == rel or key.startswith(prefix)]:
+            del self._dirs[key]
+        if self._inotify is not None:
+            for wd in [wd for wd, key in self._watches.items() if key == rel or key.startswith(prefix)]:
+                self._inotify.remove_watch(wd)
+                del self._watches[wd]
+        self._entries = None
+
+    def _path(self, rel: str) -> str:
+        return os.path.join(self.root, rel) if rel else self.root
+
+
+_indexes: "OrderedDict[str, FileIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def file_index(root: str) -> FileIndex:
+    """The shared index of a project root; the least recently used ones are closed."""
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = FileIndex(root)
+        _indexes.move_to_end(root)
+        while len(_indexes) > FILE_INDEX_MAX_PROJECTS:
+            _root, evicted = _indexes.popitem(last=False)
+            evicted.close()
+        return index
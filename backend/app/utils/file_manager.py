@@ -1,14 +1,19 @@
 import fnmatch
+import mmap
 import os
 import re
 import shutil
-from typing import Optional
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Optional, Union
 
 from cryptography.fernet import Fernet
 
-from app import SECRET_KEY_USER
+from app import FILE_READ_MAX_KB, SEARCH_INDEX, SECRET_KEY_USER
 from app.data.models import Pupil
 from app.data.schemas import FileContent, FileInfo, OperationResult, SearchResult
+from app.utils.file_index import FileEntry, file_index
+from app.utils.search_index import search_index
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 cipher = Fernet(SECRET_KEY_USER) if SECRET_KEY_USER else None
@@ -22,6 +27,7 @@ class FileManager:
         self._prj_root = os.path.normpath(
             os.path.join(BABIRUSA_HOME, f"user-{username}-prj")
         )
+        self._index = file_index(self._prj_root)
 
     @staticmethod
     async def authenticate(username: str, password: str) -> "FileManager":
@@ -56,64 +62,39 @@ class FileManager:
     def _rel(self, abs_path: str) -> str:
         return os.path.relpath(abs_path, self._prj_root).replace("\\", "/")
 
-    def _walk_files(self) -> list[str]:
-        results: list[str] = []
-        for root, _dirs, files in os.walk(self._prj_root):
-            for f in files:
-                abs_path = os.path.join(root, f)
-                results.append(self._rel(abs_path))
-        results.sort()
-        return results
+    def _files(self) -> list[FileEntry]:
+        return self._index.entries()
+
+    @staticmethod
+    def _info(entry: FileEntry) -> FileInfo:
+        return FileInfo(
+            name=entry.name,
+            relative_path=entry.relative_path,
+            size=entry.size,
+            is_directory=False,
+        )
 
     def list_all_files(self) -> list[FileInfo]:
-        entries: list[FileInfo] = []
-        for rel in self._walk_files():
-            abs_path = self._abs(rel)
-            stat = os.stat(abs_path)
-            entries.append(
-                FileInfo(
-                    name=os.path.basename(rel),
-                    relative_path=rel,
-                    size=stat.st_size,
-                    is_directory=False,
-                )
-            )
-        return entries
+        infos = self._index.derived(
+            "list_all_files", lambda entries: [self._info(entry) for entry in entries]
+        )
+        return list(infos)
 
     def find_by_name(self, pattern: str) -> list[FileInfo]:
-        results: list[FileInfo] = []
-        for rel in self._walk_files():
-            name = os.path.basename(rel)
-            if fnmatch.fnmatch(name, pattern):
-                abs_path = self._abs(rel)
-                stat = os.stat(abs_path)
-                results.append(
-                    FileInfo(
-                        name=name,
-                        relative_path=rel,
-                        size=stat.st_size,
-                        is_directory=False,
-                    )
-                )
-        return results
+        return [
+            self._info(entry)
+            for entry in self._files()
+            if fnmatch.fnmatch(entry.name, pattern)
+        ]
 
     def find_by_path(self, pattern: str) -> list[FileInfo]:
-        results: list[FileInfo] = []
-        for rel in self._walk_files():
-            if fnmatch.fnmatch(rel, pattern):
-                abs_path = self._abs(rel)
-                stat = os.stat(abs_path)
-                results.append(
-                    FileInfo(
-                        name=os.path.basename(rel),
-                        relative_path=rel,
-                        size=stat.st_size,
-                        is_directory=False,
-                    )
-                )
-        return results
+        return [
+            self._info(entry)
+            for entry in self._files()
+            if fnmatch.fnmatch(entry.relative_path, pattern)
+        ]
 
-    def read_file(self, relative_path: str, encoding: str = "utf-8") -> FileContent:
+    def _existing_file(self, relative_path: str) -> tuple[str, os.stat_result]:
         abs_path = self._abs(relative_path)
         if not os.path.exists(abs_path):
             raise FileNotFoundError(f"File not found: '{relative_path}'")
@@ -121,6 +102,19 @@ class FileManager:
             raise IsADirectoryError(
                 f"Path is a directory, not a file: '{relative_path}'"
             )
+        return abs_path, os.stat(abs_path)
+
+    def is_binary(self, relative_path: str) -> bool:
+        abs_path, stat = self._existing_file(relative_path)
+        return self._index.is_binary(abs_path, stat.st_mtime_ns, stat.st_size)
+
+    def read_file(self, relative_path: str, encoding: str = "utf-8") -> FileContent:
+        abs_path, stat = self._existing_file(relative_path)
+        if stat.st_size > FILE_READ_MAX_KB * 1024:
+            raise ValueError(
+                f"File is too large to read at once ({stat.st_size} bytes), "
+                f"read it by lines or ranges: '{relative_path}'"
+            )
 
         with open(abs_path, "r", encoding=encoding) as f:
             content = f.read()
@@ -128,9 +122,75 @@ class FileManager:
         return FileContent(
             relative_path=self._rel(abs_path),
             content=content,
-            size=os.path.getsize(abs_path),
+            size=stat.st_size,
         )
 
+    def read_range(
+        self, relative_path: str, offset: int = 0, length: int = FILE_READ_MAX_KB * 1024,
+        encoding: str = "utf-8",
+    ) -> FileContent:
+        """Bytes offset..offset+length (at most FILE_READ_MAX_KB), decoded with replacements."""
+        abs_path, stat = self._existing_file(relative_path)
+        offset = min(max(offset, 0), stat.st_size)
+        end = min(offset + min(max(length, 0), FILE_READ_MAX_KB * 1024), stat.st_size)
+        with self._mapped(abs_path, stat.st_size) as mm:
+            data = mm[offset:end]
+        return FileContent(
+            relative_path=self._rel(abs_path),
+            content=data.decode(encoding, errors="replace"),
+            size=stat.st_size,
+            offset=offset,
+            truncated=end < min(offset + length, stat.st_size),
+        )
+
+    def read_lines(
+        self, relative_path: str, start_line: int = 1, count: int = 200, encoding: str = "utf-8",
+    ) -> FileContent:
+        """
+        Lines start_line..start_line+count-1 (1-based), found through an mmap
+        of the file so only the window is read; cut at FILE_READ_MAX_KB.
+        """
+        abs_path, stat = self._existing_file(relative_path)
+        size = stat.st_size
+        limit = FILE_READ_MAX_KB * 1024
+        start_line = max(start_line, 1)
+        with self._mapped(abs_path, size) as mm:
+            start = 0
+            for _ in range(start_line - 1):
+                newline = mm.find(b"\n", start)
+                if newline < 0:
+                    start = size
+                    break
+                start = newline + 1
+            end, lines = start, 0
+            while lines < count and end < size:
+                newline = mm.find(b"\n", end)
+                end = size if newline < 0 else newline + 1
+                lines += 1
+            truncated = end - start > limit
+            data = mm[start:min(end, start + limit)]
+        return FileContent(
+            relative_path=self._rel(abs_path),
+            content=data.decode(encoding, errors="replace").replace("\r\n", "\n"),
+            size=size,
+            offset=start,
+            start_line=start_line,
+            end_line=start_line + lines - 1,
+            truncated=truncated,
+        )
+
+    @staticmethod
+    @contextmanager
+    def _mapped(abs_path: str, size: int) -> Iterator[Union[mmap.mmap, bytes]]:
+        with open(abs_path, "rb") as f:
+            if size <= FILE_READ_MAX_KB * 1024:
+                # small files are read whole: a mapping of a file the pupil
+                # truncates while it is read would fault
+                yield f.read()
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+
     def search_in_files(
         self,
         text: str,
@@ -139,33 +199,84 @@ class FileManager:
         case_sensitive: bool = False,
         file_pattern: Optional[str] = None,
     ) -> list[SearchResult]:
+        return list(
+            self.iter_search(
+                text,
+                is_regex=is_regex,
+                case_sensitive=case_sensitive,
+                file_pattern=file_pattern,
+            )
+        )
+
+    def iter_search(
+        self,
+        text: str,
+        *,
+        is_regex: bool = False,
+        case_sensitive: bool = False,
+        file_pattern: Optional[str] = None,
+        max_results: Optional[int] = None,
+        context: int = 0,
+    ) -> Iterator[SearchResult]:
+        """
+        Yields matching lines as they are found, in search_in_files order,
+        stopping after max_results. With context, each result carries up to
+        that many lines before and after it (within its file).
+        """
         flags = 0 if case_sensitive else re.IGNORECASE
         if is_regex:
             pattern = re.compile(text, flags)
         else:
             pattern = re.compile(re.escape(text), flags)
+        if max_results is not None and max_results <= 0:
+            return
 
-        results: list[SearchResult] = []
-        for rel in self._walk_files():
-            if file_pattern and not fnmatch.fnmatch(
-                os.path.basename(rel), file_pattern
-            ):
+        entries = self._index.text_entries()
+        if SEARCH_INDEX:
+            # only files holding the pattern's literals can match
+            entries = search_index(self._prj_root).filter(entries, pattern)
+
+        found = 0
+        for entry in entries:
+            if file_pattern and not fnmatch.fnmatch(entry.name, file_pattern):
                 continue
-            abs_path = self._abs(rel)
             try:
-                with open(abs_path, "r", encoding="utf-8", errors="ignore") as f:
-                    for lineno, line in enumerate(f, start=1):
-                        if pattern.search(line):
-                            results.append(
-                                SearchResult(
-                                    relative_path=rel,
-                                    line_number=lineno,
-                                    line_content=line.rstrip("\n\r"),
-                                )
-                            )
+                for result in self._search_file(entry, pattern, context):
+                    yield result
+                    found += 1
+                    if found == max_results:
+                        return
             except (OSError, UnicodeDecodeError):
                 continue
-        return results
+
+    @staticmethod
+    def _search_file(
+        entry: FileEntry, pattern: re.Pattern, context: int
+    ) -> Iterator[SearchResult]:
+        before: deque[str] = deque(maxlen=context)
+        waiting: deque[SearchResult] = deque()  # results still taking lines after them
+        with open(entry.path, "r", encoding="utf-8", errors="ignore") as f:
+            for lineno, line in enumerate(f, start=1):
+                content = line.rstrip("\n\r")
+                for result in waiting:
+                    result.context_after.append(content)
+                while waiting and len(waiting[0].context_after) == context:
+                    yield waiting.popleft()
+                if pattern.search(line):
+                    result = SearchResult(
+                        relative_path=entry.relative_path,
+                        line_number=lineno,
+                        line_content=content,
+                    )
+                    if context:
+                        result.context_before = list(before)
+                        result.context_after = []
+                        waiting.append(result)
+                    else:
+                        yield result
+                if context:
+                    before.append(content)
+        yield from waiting
 
     def create_file(
         self, relative_path: str, content: str = "", encoding: str = "utf-8"
@@ -179,6 +290,7 @@ class FileManager:
 
         with open(abs_path, "w", encoding=encoding) as f:
             f.write(content)
+        self._index.invalidate(abs_path)
 
         return OperationResult(
             success=True,
@@ -199,6 +311,7 @@ class FileManager:
 
         with open(abs_path, "w", encoding=encoding) as f:
             f.write(content)
+        self._index.invalidate(abs_path)
 
         return OperationResult(
             success=True,
@@ -214,6 +327,7 @@ class FileManager:
             raise IsADirectoryError(f"Path is a directory: '{relative_path}'.")
 
         os.remove(abs_path)
+        self._index.invalidate(abs_path)
 
         return OperationResult(
             success=True,
@@ -229,6 +343,7 @@ class FileManager:
             raise NotADirectoryError(f"Path is not a directory: '{relative_path}'")
 
         shutil.rmtree(abs_path)
+        self._index.invalidate(abs_path)
 
         return OperationResult(
             success=True,
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterable, Optional
+
+from app import GROUP_SEARCH_DEADLINE, GROUP_SEARCH_MAX_RESULTS, GROUP_SEARCH_WORKERS
+from app.data import schemas
+from app.utils import file_index, search_index
+from app.utils.file_manager import FileManager
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _init_worker() -> None:
+    """Starts a worker without the backend's project indexes, their inotify fds and locks."""
+    for module in (file_index, search_index):
+        module._indexes = OrderedDict()
+        module._indexes_lock = threading.Lock()
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: a forked worker could inherit an index lock held by another thread
+        _pool = ProcessPoolExecutor(
+            max_workers=GROUP_SEARCH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _search_project(
+    username: str, request: schemas.GroupSearch, max_results: int
+) -> tuple[list[tuple[str, int, str]], bool]:
+    """Runs in a worker process: (relative path, line, content) of the first matches."""
+    results = FileManager(username).iter_search(
+        request.pattern,
+        is_regex=request.is_regex,
+        case_sensitive=request.case_sensitive,
+        file_pattern=request.file_pattern,
+        max_results=max_results + 1,  # one more tells whether there are others
+    )
+    matches = [(r.relative_path, r.line_number, r.line_content) for r in results]
+    return matches[:max_results], len(matches) > max_results
+
+
+async def search_group(
+    usernames: Iterable[str],
+    request: schemas.GroupSearch,
+    deadline: float = GROUP_SEARCH_DEADLINE,
+) -> AsyncIterator[schemas.GroupSearchEvent]:
+    """
+    Searches every pupil's project on the process pool and yields one event
+    per pupil as its search finishes. Pupils not done by the deadline get a
+    timeout event; their searches are dropped from the queue (one already
+    running finishes in the background).
+    """
+    loop = asyncio.get_running_loop()
+    max_results = request.max_results or GROUP_SEARCH_MAX_RESULTS
+    pending = {
+        loop.run_in_executor(_executor(), _search_project, username, request, max_results): username
+        for username in dict.fromkeys(usernames)
+    }
+    ends_at = loop.time() + deadline
+    try:
+        while pending:
+            done, _ = await asyncio.wait(
+                pending, timeout=max(ends_at - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for future in done:
+                username = pending.pop(future)
+                try:
+                    matches, truncated = future.result()
+                except Exception as e:
+                    logger.error(f"Group search failed for {username}: {e}")
+                    yield schemas.GroupSearchEvent(username=username, status="failed", detail=str(e))
+                    continue
+                yield schemas.GroupSearchEvent(
+                    username=username,
+                    status="done",
+                    results=[
+                        schemas.SearchResult(relative_path=path, line_number=line, line_content=content)
+                        for path, line, content in matches
+                    ],
+                    truncated=truncated,
+                )
+        for username in pending.values():
+            yield schemas.GroupSearchEvent(
+                username=username, status="timeout", detail="Search deadline exceeded."
+            )
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def search_group_ndjson(
+    usernames: Iterable[str], request: schemas.GroupSearch
+) -> AsyncIterator[str]:
+    async for event in search_group(usernames, request):
+        yield event.model_dump_json(exclude_none=True) + "\n"
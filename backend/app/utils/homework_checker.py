@@ -5,6 +5,10 @@ from app.data.schemas import PupilReview
 from app.utils.file_manager import BABIRUSA_HOME, FileManager
 from app.utils.gigachat import gigachat_client
 
+# a tool answer has to fit into the model's context
+TOOL_MAX_MATCHES = 200
+TOOL_WINDOW_LINES = 200
+
 TOOL_DEFINITIONS = [
     {
         "name": "list_files",
@@ -22,7 +26,10 @@ TOOL_DEFINITIONS = [
     },
     {
         "name": "read_file",
-        "description": "Прочитать содержимое конкретного файла из проекта ученика",
+        "description": (
+            "Прочитать содержимое конкретного файла из проекта ученика. "
+            "Большие файлы читаются по частям: укажи start_line и line_count"
+        ),
         "parameters": {
             "type": "object",
             "properties": {
@@ -34,6 +41,14 @@ TOOL_DEFINITIONS = [
                     "type": "string",
                     "description": "Относительный путь к файлу внутри проекта",
                 },
+                "start_line": {
+                    "type": "integer",
+                    "description": "Первая строка для чтения (с 1)",
+                },
+                "line_count": {
+                    "type": "integer",
+                    "description": f"Сколько строк прочитать (до {TOOL_WINDOW_LINES})",
+                },
             },
             "required": ["username", "path"],
         },
@@ -81,7 +96,12 @@ def _execute_tool(name: str, arguments: dict, allowed_usernames: list[str]) -> s
             files = fm.list_all_files()
             return json.dumps(
                 [
-                    {"name": f.name, "path": f.relative_path, "size": f.size}
+                    {
+                        "name": f.name,
+                        "path": f.relative_path,
+                        "size": f.size,
+                        "binary": fm.is_binary(f.relative_path),
+                    }
                     for f in files
                 ],
                 ensure_ascii=False,
@@ -89,19 +109,43 @@ def _execute_tool(name: str, arguments: dict, allowed_usernames: list[str]) -> s
 
         elif name == "read_file":
             path = arguments.get("path", "")
-            content = fm.read_file(path)
+            if fm.is_binary(path):
+                return json.dumps(
+                    {"error": f"Файл '{path}' двоичный, его нельзя прочитать как текст."},
+                    ensure_ascii=False,
+                )
+            start_line = arguments.get("start_line")
+            if start_line is None:
+                try:
+                    content = fm.read_file(path)
+                    return json.dumps(
+                        {
+                            "path": content.relative_path,
+                            "content": content.content,
+                            "size": content.size,
+                        },
+                        ensure_ascii=False,
+                    )
+                except ValueError:
+                    pass  # larger than FILE_READ_MAX_KB: the first window instead
+            line_count = min(int(arguments.get("line_count") or TOOL_WINDOW_LINES), TOOL_WINDOW_LINES)
+            content = fm.read_lines(path, int(start_line or 1), line_count)
             return json.dumps(
                 {
                     "path": content.relative_path,
                     "content": content.content,
                     "size": content.size,
+                    "start_line": content.start_line,
+                    "end_line": content.end_line,
+                    "truncated": content.truncated,
                 },
                 ensure_ascii=False,
             )
 
         elif name == "search_in_files":
             text = arguments.get("text", "")
-            results = fm.search_in_files(text)
+            # binaries are skipped by the search
+            results = fm.iter_search(text, max_results=TOOL_MAX_MATCHES)
             return json.dumps(
                 [
                     {
@@ -128,12 +172,12 @@ def _gather_pupil_codes(usernames: list[str], file_pattern: str) -> dict[str, st
             continue
 
         fm = FileManager(username=username)
-        found = fm.find_by_name(file_pattern)
-        if not found:
-            codes[username] = f"[ОШИБКА: файл по шаблону '{file_pattern}' не найден]"
-            continue
-
         try:
+            # the listing may be a poll interval old: a file deleted since fails here
+            found = [f for f in fm.find_by_name(file_pattern) if not fm.is_binary(f.relative_path)]
+            if not found:
+                codes[username] = f"[ОШИБКА: файл по шаблону '{file_pattern}' не найден]"
+                continue
             content = fm.read_file(found[0].relative_path)
             codes[username] = content.content
         except Exception as e:
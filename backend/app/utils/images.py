@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import Iterable, NamedTuple, Optional
+
+from app import CODESPACE_IMAGE
+from app.utils.error import Error
+from app.utils.placement import DockerHost, PlacementRegistry, placement
+
+logger = logging.getLogger(__name__)
+
+PULLING = "pulling"
+READY = "ready"
+FAILED = "failed"
+
+
+class ImageState(NamedTuple):
+    status: str
+    digest: Optional[str] = None
+    error: Optional[str] = None
+
+
+class ImageCache:
+    """
+    Which codespace images are present on which Docker host.
+
+    Images are checked (and pulled if missing) in the background: at startup
+    for CODESPACE_IMAGE, or on request for a new version before it is rolled
+    out. A launch never waits for a pull; until the image is ready on its
+    host it is refused with Error.IMAGE_NOT_READY.
+    """
+
+    def __init__(self, placements: PlacementRegistry = placement, image: str = CODESPACE_IMAGE):
+        self.placements = placements
+        self.image = image
+        self._states: dict[tuple[str, str], ImageState] = {}  # (host, image) → state
+        self._pulls: dict[tuple[str, str], asyncio.Task] = {}
+
+    def state(self, host: DockerHost, image: Optional[str] = None) -> Optional[ImageState]:
+        return self._states.get((host.name, image or self.image))
+
+    def states(self) -> dict[tuple[str, str], ImageState]:
+        return dict(self._states)
+
+    def prepare(self, image: Optional[str] = None) -> None:
+        """Starts checking / pulling the image on every host, without waiting."""
+        for host in self.placements.hosts.values():
+            self.pull(host, image)
+
+    def pull(self, host: DockerHost, image: Optional[str] = None) -> asyncio.Task:
+        image = image or self.image
+        key = (host.name, image)
+        task = self._pulls.get(key)
+        if task is None or task.done():
+            self._states[key] = ImageState(PULLING)
+            task = self._pulls[key] = asyncio.create_task(self._pull(host, image))
+        return task
+
+    async def _pull(self, host: DockerHost, image: str) -> None:
+        try:
+            digest = await host.docker.ensure_image(image)
+        except Exception as e:
+            logger.error(f"Could not pull {image} on {host.name}: {e}")
+            self._states[(host.name, image)] = ImageState(FAILED, error=str(getattr(e, "detail", e)))
+            return
+        logger.info("Image %s ready on %s (%s)", image, host.name, digest)
+        self._states[(host.name, image)] = ImageState(READY, digest)
+
+    def require(self, host: DockerHost, image: Optional[str] = None) -> str:
+        """The image digest on the host; raises IMAGE_NOT_READY (and retries a failed pull) otherwise."""
+        state = self.state(host, image)
+        if state is not None and state.status == READY:
+            return state.digest
+        if state is None or state.status == FAILED:
+            self.pull(host, image)
+        raise Error.IMAGE_NOT_READY
+
+    def check(self, image: Optional[str] = None) -> None:
+        """Raises IMAGE_NOT_READY unless the image is ready on at least one host."""
+        for host in self.placements.hosts.values():
+            state = self.state(host, image)
+            if state is not None and state.status == READY:
+                return
+        self.prepare(image)
+        raise Error.IMAGE_NOT_READY
+
+    async def settle(self, hosts: Iterable[DockerHost], image: Optional[str] = None) -> bool:
+        """
+        Waits for the pulls still running on the hosts (background work only).
+        True if one of them made the image ready: a launch refused with
+        IMAGE_NOT_READY meanwhile is worth another try.
+        """
+        pulling = [
+            host for host in hosts
+            if (state := self.state(host, image)) is not None and state.status == PULLING
+        ]
+        if not pulling:
+            return False
+        await asyncio.gather(*(asyncio.shield(self.pull(host, image)) for host in pulling))
+        return any(self.state(host, image).status == READY for host in pulling)
+
+    async def wait(self, host: DockerHost, image: Optional[str] = None) -> str:
+        """Waits for a pending pull (background work only, requests use require())."""
+        state = self.state(host, image)
+        if state is None or state.status != READY:
+            await asyncio.shield(self.pull(host, image))
+        return self.require(host, image)
+
+
+image_cache = ImageCache()
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
+
+import docker
+from app import CODESPACE_NETWORK, DOCKER_HOSTS
+from app.utils.docker_client import LABEL_CODESPACE, AsyncDocker, container_ip, docker_client
+from app.utils.error import Error
+
+logger = logging.getLogger(__name__)
+
+LOCAL_HOST = "local"
+CODESPACE_PORT = 8080
+
+
+class DockerHost(NamedTuple):
+    name: str
+    docker: AsyncDocker
+    capacity: int  # codespaces; 0 = unlimited
+    # Address the proxy reaches published ports on; None for the daemon the
+    # proxy shares a bridge network with (containers are reached by bridge IP).
+    address: Optional[str] = None
+
+    @property
+    def is_local(self) -> bool:
+        return self.address is None
+
+
+def parse_docker_hosts(spec: Optional[str]) -> list[DockerHost]:
+    """
+    DOCKER_HOSTS="local=unix:///var/run/docker.sock@40,node2=tcp://10.0.0.2:2375@60"
+    name=url[@capacity], comma separated. Unix sockets are local, TCP hosts
+    are reached through ports they publish. Empty: the local daemon only.
+    """
+    if not spec:
+        return [DockerHost(LOCAL_HOST, docker_client, 0)]
+
+    hosts = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, target = item.split("=", 1)
+        url, _, capacity = target.partition("@")
+        url = url.strip()
+        if url.startswith("unix://"):
+            client = docker_client if not hosts else AsyncDocker(
+                client_factory=lambda url=url: docker.DockerClient(base_url=url)
+            )
+            address = None
+        else:
+            client = AsyncDocker(client_factory=lambda url=url: docker.DockerClient(base_url=url))
+            address = urlparse(url).hostname
+        hosts.append(DockerHost(name.strip(), client, int(capacity or 0), address))
+    return hosts
+
+
+class PlacementRegistry:
+    """
+    The Docker daemons codespaces can run on.
+
+    A pupil whose codespace already lives on a host stays there (its files
+    and container are on that host); new codespaces go to the host with the
+    lowest share of its capacity in use.
+
+    User directories are written by this process and bind-mounted by the
+    daemon, so a remote host only takes new codespaces once it is known to
+    see the babirusa directory as shared storage (see mark_shared).
+    """
+
+    def __init__(self, hosts: list[DockerHost]):
+        self.hosts = {host.name: host for host in hosts}
+        self.default = hosts[0]
+        self.shared = {host.name for host in hosts if host.is_local}
+
+    def mark_shared(self, name: str) -> None:
+        self.shared.add(name)
+
+    def get(self, name: Optional[str]) -> DockerHost:
+        """The host a UserIp.host refers to; records without one are on the default host."""
+        return self.hosts.get(name or self.default.name, self.default)
+
+    def docker_for(self, name: Optional[str]) -> AsyncDocker:
+        return self.get(name).docker
+
+    async def load(self) -> dict[str, int]:
+        """Running codespaces per host; unreachable hosts are left out."""
+        async def count(host: DockerHost) -> Optional[int]:
+            try:
+                statuses = await host.docker.container_statuses({"label": LABEL_CODESPACE})
+            except Exception as e:
+                logger.error(f"Docker host {host.name} unavailable: {e}")
+                return None
+            return sum(status in ("running", "paused") for status in statuses.values())
+
+        counts = await asyncio.gather(*(count(host) for host in self.hosts.values()))
+        return {
+            name: running
+            for name, running in zip(self.hosts, counts)
+            if running is not None
+        }
+
+    async def choose(self, sticky: Optional[str] = None) -> DockerHost:
+        if sticky in self.hosts:
+            return self.hosts[sticky]
+        if len(self.hosts) == 1 and self.default.name in self.shared:
+            return self.default
+
+        load = await self.load()
+        candidates = []
+        for name, running in load.items():
+            if name not in self.shared:
+                continue
+            capacity = self.hosts[name].capacity
+            if capacity and running >= capacity:
+                continue
+            candidates.append((running / capacity if capacity else 0.0, running, name))
+        if not candidates:
+            raise Error.NO_HOST_CAPACITY
+        _, _, name = min(candidates)
+        return self.hosts[name]
+
+    async def address(self, host: DockerHost, container_id: str) -> tuple[Optional[str], Optional[int]]:
+        """(ip, port) the proxy reaches a started codespace on; port None means 8080."""
+        attrs = await host.docker.container_attrs(container_id)
+        if host.is_local:
+            return container_ip(attrs, CODESPACE_NETWORK), None
+        bindings = attrs.get("NetworkSettings", {}).get("Ports", {}).get(f"{CODESPACE_PORT}/tcp")
+        if not bindings:
+            return None, None
+        return host.address, int(bindings[0]["HostPort"])
+
+
+placement = PlacementRegistry(parse_docker_hosts(DOCKER_HOSTS))
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from typing import Optional
+
+from app import PROVISION_MAX_ATTEMPTS, PROVISION_RETRY_DELAY, PROVISION_WORKERS, SECRET_KEY_USER
+from app.data.models import Pupil
+from app.utils.admission import PRIORITY_INTERACTIVE
+from app.utils.codespaces import READY, launch_codespace
+from app.utils.error import Error
+from app.utils.images import image_cache
+from app.utils.placement import placement
+from cryptography.fernet import Fernet
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+cipher = Fernet(SECRET_KEY_USER)
+
+
+class ProvisioningWorker:
+    """
+    Background provisioning of new pupils' codespaces.
+
+    The API records a pupil in the "created" state and submits it here;
+    workers drive launch_codespace, which persists every step on the Pupil.
+    A failed step is recorded in Pupil.provision_error and retried with a
+    growing delay. A launch refused while the codespace image is still being
+    pulled waits for the pull instead and does not count as an attempt. On
+    startup every pupil that is not "ready" is picked up again from the step
+    it reached.
+    """
+
+    def __init__(
+        self,
+        workers: int = PROVISION_WORKERS,
+        max_attempts: int = PROVISION_MAX_ATTEMPTS,
+        retry_delay: float = PROVISION_RETRY_DELAY,
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: dict[str, asyncio.Future] = {}  # username → its provisioning result
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._start_workers()
+        self._tasks.append(asyncio.create_task(self.resume()))
+
+    def _start_workers(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._pending = {}
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._queue = None
+
+    def submit(
+        self, username: str, teacher_id: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE
+    ) -> asyncio.Future:
+        """
+        Queues a pupil; the returned future gets the codespace IP, or None once
+        every attempt has failed. A pupil already queued keeps its future.
+        """
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            # no lifespan ran on this loop (an ASGITransport client, a script):
+            # start the workers now rather than dropping the pupil
+            logger.warning("Provisioning workers were not started, starting them now")
+            self._start_workers()
+        if username not in self._pending:
+            self._pending[username] = self._loop.create_future()
+            self._queue.put_nowait((username, teacher_id, priority))
+        return self._pending[username]
+
+    async def resume(self) -> None:
+        try:
+            pupils = await Pupil.find({"provision_state": {"$ne": READY}}).to_list()
+        except PyMongoError as e:
+            logger.error(f"MongoDB Error: {e}")
+            return
+        for pupil in pupils:
+            logger.info("Resuming provisioning of %s at %s", pupil.username, pupil.provision_state)
+            self.submit(pupil.username)
+
+    async def _work(self) -> None:
+        while True:
+            username, teacher_id, priority = await self._queue.get()
+            result = self._pending[username]
+            try:
+                ip = await self.provision(username, teacher_id, priority)
+            except asyncio.CancelledError:
+                result.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Provisioning of {username} failed: {e}")
+                ip = None
+            finally:
+                del self._pending[username]
+            if not result.done():
+                result.set_result(ip)
+
+    async def provision(
+        self, username: str, teacher_id: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE
+    ) -> Optional[str]:
+        attempt = 0
+        while attempt < self.max_attempts:
+            pupil = await Pupil.find_one(Pupil.username == username)
+            if pupil is None:
+                return None  # deleted meanwhile
+            password = cipher.decrypt(pupil.hashed_password.encode("utf-8")).decode("utf-8")
+            try:
+                return await launch_codespace(username, password, teacher_id, priority)
+            except Exception as e:
+                if e is Error.IMAGE_NOT_READY and await image_cache.settle(placement.hosts.values()):
+                    continue  # the image was still being pulled: not a failed attempt
+                attempt += 1
+                detail = str(getattr(e, "detail", e))
+                logger.error(
+                    f"Provisioning of {username} failed "
+                    f"(attempt {attempt}/{self.max_attempts}): {detail}"
+                )
+                await Pupil.get_motor_collection().update_one(
+                    {"username": username}, {"$set": {"provision_error": detail}}
+                )
+            if attempt < self.max_attempts:
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+        return None
+
+
+provisioner = ProvisioningWorker()
@@ -0,0 +1,139 @@
+import asyncio
+import csv
+import io
+import logging
+from typing import AsyncIterator, Iterable, List
+
+from app import SECRET_KEY_USER
+from app.data import schemas
+from app.data.models import Pupil, Teacher
+from app.utils.admission import PRIORITY_BULK, PROVISIONING
+from app.utils.codespaces import CREATED
+from app.utils.provisioning import provisioner
+from cryptography.fernet import Fernet
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+cipher = Fernet(SECRET_KEY_USER)
+
+CSV_COLUMNS = ("username", "password", "firstname", "lastname")
+
+
+def parse_pupils_csv(content: str) -> tuple[List[schemas.PupilCreate], List[schemas.PupilImportEvent]]:
+    """
+    Reads username,password,firstname,lastname rows (a header row with these
+    names is optional). Returns the valid rows and a rejection per bad one.
+    """
+    rows = list(csv.reader(io.StringIO(content)))
+    first_line = 1
+    if rows and [cell.strip().lower() for cell in rows[0]] == list(CSV_COLUMNS):
+        rows = rows[1:]
+        first_line = 2
+
+    pupils, rejected = [], []
+    for number, row in enumerate(rows, start=first_line):
+        if not any(cell.strip() for cell in row):
+            continue
+        username = row[0].strip() if row else ""
+        try:
+            if len(row) != len(CSV_COLUMNS):
+                raise ValueError(f"expected {len(CSV_COLUMNS)} columns, got {len(row)}")
+            pupils.append(
+                schemas.PupilCreate(**dict(zip(CSV_COLUMNS, (cell.strip() for cell in row))))
+            )
+        except (ValueError, ValidationError) as e:
+            rejected.append(
+                schemas.PupilImportEvent(
+                    username=username, status="rejected", detail=f"Line {number}: {e}"
+                )
+            )
+    return pupils, rejected
+
+
+def _line(event: schemas.PupilImportEvent) -> str:
+    return event.model_dump_json(exclude_none=True) + "\n"
+
+
+async def _provision(pupil: Pupil, teacher: Teacher) -> schemas.PupilImportEvent:
+    # the provisioner's retries and resume-on-restart apply to imports as well;
+    # shielded, so a client that stops reading does not cancel the launch
+    ip = await asyncio.shield(
+        provisioner.submit(pupil.username, teacher_id=str(teacher.id), priority=PRIORITY_BULK)
+    )
+    if not ip:
+        failed = await Pupil.find_one(Pupil.username == pupil.username)
+        return schemas.PupilImportEvent(
+            username=pupil.username,
+            status="failed",
+            id=str(pupil.id),
+            detail=(failed and failed.provision_error) or "Codespace was not started.",
+        )
+    return schemas.PupilImportEvent(
+        username=pupil.username, status="ready", id=str(pupil.id), ip=ip
+    )
+
+
+async def import_pupils(
+    requests: List[schemas.PupilCreate],
+    teacher: Teacher,
+    rejected: Iterable[schemas.PupilImportEvent] = (),
+) -> AsyncIterator[str]:
+    """
+    Creates all pupils with one insert and one teacher update, then launches
+    their codespaces on the provisioner. Yields one NDJSON progress line per event:
+    rejected / created for every row, then ready or failed per codespace as
+    launches finish.
+    """
+    for event in rejected:
+        yield _line(event)
+
+    unique = {}
+    for request in requests:
+        if request.username in unique:
+            yield _line(
+                schemas.PupilImportEvent(
+                    username=request.username,
+                    status="rejected",
+                    detail="Duplicate username in import.",
+                )
+            )
+            continue
+        unique[request.username] = request
+
+    existing = await Pupil.find({"username": {"$in": list(unique)}}).to_list()
+    for pupil in existing:
+        unique.pop(pupil.username)
+        yield _line(
+            schemas.PupilImportEvent(
+                username=pupil.username, status="rejected", detail="Login already exists."
+            )
+        )
+
+    pupils = [
+        Pupil(
+            username=request.username,
+            firstname=request.firstname,
+            lastname=request.lastname,
+            hashed_password=cipher.encrypt(request.password.encode("utf-8")).decode("utf-8"),
+            container_status=PROVISIONING,
+            provision_state=CREATED,
+        )
+        for request in unique.values()
+    ]
+    if not pupils:
+        return
+
+    await Pupil.insert_many(pupils)
+    if teacher.pupils is None:
+        teacher.pupils = []
+    teacher.pupils.extend(pupils)
+    await teacher.save()
+
+    for pupil in pupils:
+        yield _line(
+            schemas.PupilImportEvent(username=pupil.username, status="created", id=str(pupil.id))
+        )
+
+    for finished in asyncio.as_completed([_provision(pupil, teacher) for pupil in pupils]):
+        yield _line(await finished)
@@ -0,0 +1,180 @@
+"""
+Trigram index that narrows FileManager.search_in_files down to the files
+that can contain a match, before the exact line-by-line regex scan.
+
+Each project keeps a posting set per trigram (of the file's text as
+search_in_files reads it), updated from the FileIndex's mtimes and sizes:
+only new or changed files are read again. A query needs every trigram of
+the literals the pattern cannot match without; the scan then runs on the
+files that have them all, plus files too large (or unreadable) to index.
+
+The index only ever errs towards too many candidates, so the results are
+the ones a full scan gives:
+
+- text and literals are folded the way re.IGNORECASE compares them
+  (lowercase, with the four non-ASCII letters that match ASCII ones), so
+  case-sensitive and insensitive queries share one index;
+- only ASCII trigrams of literals are required, non-ASCII characters of the
+  text become "?";
+- trigrams of a changed file's old content stay behind until the project is
+  reindexed, they only add candidates.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from app import SEARCH_INDEX_MAX_FILE_KB, SEARCH_INDEX_MAX_PROJECTS
+from app.utils.file_index import FileEntry
+
+try:  # Python 3.11+
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:
+    import sre_constants
+    import sre_parse
+
+# non-ASCII letters re.IGNORECASE matches with ASCII ones
+_FOLD = str.maketrans({"İ": "i", "ı": "i", "ſ": "s", "K": "k"})
+_NON_ASCII = re.compile(r"[^\x00-\x7f]+")
+
+_REPEATS = {
+    sre_constants.MAX_REPEAT,
+    sre_constants.MIN_REPEAT,
+    getattr(sre_constants, "POSSESSIVE_REPEAT", sre_constants.MAX_REPEAT),
+}
+_ATOMIC_GROUP = getattr(sre_constants, "ATOMIC_GROUP", None)
+
+
+def fold(text: str) -> str:
+    return text.translate(_FOLD).lower()
+
+
+def trigrams(data: bytes) -> set[bytes]:
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+
+def _literals(items) -> list[str]:
+    """Runs of literal characters every match of the parsed pattern contains."""
+    runs: list[str] = []
+    run: list[str] = []
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            runs.append("".join(run))
+            run = []
+        if op is sre_constants.SUBPATTERN:
+            runs.extend(_literals(av[-1]))
+        elif op is _ATOMIC_GROUP:
+            runs.extend(_literals(av))
+        elif op in _REPEATS and av[0] >= 1:
+            runs.extend(_literals(av[2]))
+    if run:
+        runs.append("".join(run))
+    return runs
+
+
+def required_trigrams(pattern: re.Pattern) -> set[bytes]:
+    """Trigrams any line matching the pattern contains; empty if nothing is certain."""
+    if not isinstance(pattern.pattern, str):
+        return set()
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (re.error, RecursionError):
+        return set()
+    required: set[bytes] = set()
+    for run in _literals(parsed):
+        for piece in _NON_ASCII.split(fold(run)):
+            required |= trigrams(piece.encode("ascii"))
+    return required
+
+
+class TrigramIndex:
+    def __init__(self, max_file_bytes: int = SEARCH_INDEX_MAX_FILE_KB * 1024):
+        self.max_file_bytes = max_file_bytes
+        self._postings: dict[bytes, set[str]] = {}
+        self._files: dict[str, tuple[int, int]] = {}  # relative path → indexed (mtime, size)
+        self._unindexed: set[str] = set()  # too large or unreadable: always candidates
+        self._stale = 0  # files changed or removed since the postings were built
+        self._synced: Optional[list[FileEntry]] = None
+        self._lock = threading.Lock()
+
+    def filter(self, entries: list[FileEntry], pattern: re.Pattern) -> list[FileEntry]:
+        """The entries, in order, that may hold a line matching the pattern."""
+        required = required_trigrams(pattern)
+        with self._lock:
+            self._sync(entries)
+            if not required:
+                return entries
+            candidates = self._candidates(required)
+        return [entry for entry in entries if entry.relative_path in candidates]
+
+    def _candidates(self, required: Iterable[bytes]) -> set[str]:
+        postings = sorted((self._postings.get(t, set()) for t in required), key=len)
+        return postings[0].intersection(*postings[1:]) | self._unindexed
+
+    def _sync(self, entries: list[FileEntry]) -> None:
+        # FileIndex hands out the same list until something changes
+        if entries is self._synced:
+            return
+        present = set()
+        for entry in entries:
+            present.add(entry.relative_path)
+            indexed = self._files.get(entry.relative_path)
+            if indexed == (entry.mtime_ns, entry.size):
+                continue
+            if indexed is not None:
+                self._stale += 1
+            self._add(entry)
+        for rel in self._files.keys() - present:
+            del self._files[rel]
+            self._unindexed.discard(rel)
+            self._stale += 1
+
+        if self._stale > max(len(self._files), 64):
+            # drop what old contents left behind
+            self._postings.clear()
+            self._files.clear()
+            self._unindexed.clear()
+            self._stale = 0
+            for entry in entries:
+                self._add(entry)
+        self._synced = entries
+
+    def _add(self, entry: FileEntry) -> None:
+        rel = entry.relative_path
+        self._files[rel] = (entry.mtime_ns, entry.size)
+        if entry.size > self.max_file_bytes:
+            self._unindexed.add(rel)
+            return
+        try:
+            # read as search_in_files reads it, newlines translated
+            with open(entry.path, "r", encoding="utf-8", errors="ignore") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError):
+            self._unindexed.add(rel)
+            return
+        self._unindexed.discard(rel)
+        for trigram in trigrams(fold(text).encode("ascii", "replace")):
+            posting = self._postings.get(trigram)
+            if posting is None:
+                posting = self._postings[trigram] = set()
+            posting.add(rel)
+
+
+_indexes: "OrderedDict[str, TrigramIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def search_index(root: str) -> TrigramIndex:
+    """The shared trigram index of a project root; the least recently used ones are dropped."""
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = TrigramIndex()
+        _indexes.move_to_end(root)
+        while len(_indexes) > SEARCH_INDEX_MAX_PROJECTS:
+            _indexes.popitem(last=False)
+        return index
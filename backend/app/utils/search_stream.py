@@ -0,0 +1,63 @@
+import json
+import re
+from typing import Iterator, Optional
+
+from app.data.schemas import SearchResult
+from app.utils.error import Error
+from app.utils.file_manager import FileManager
+
+NDJSON = "ndjson"
+SSE = "sse"
+MEDIA_TYPES = {NDJSON: "application/x-ndjson", SSE: "text/event-stream"}
+
+
+def check_pattern(text: str, is_regex: bool) -> None:
+    """Rejects a bad regex before a stream starts, while an error status can still be sent."""
+    if is_regex:
+        try:
+            re.compile(text)
+        except re.error:
+            raise Error.INVALID_SEARCH_PATTERN
+
+
+def _ndjson(result: SearchResult) -> str:
+    return result.model_dump_json(exclude_none=True) + "\n"
+
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def stream_search(
+    fm: FileManager,
+    text: str,
+    *,
+    is_regex: bool = False,
+    case_sensitive: bool = False,
+    file_pattern: Optional[str] = None,
+    max_results: int,
+    context: int = 0,
+    fmt: str = NDJSON,
+) -> Iterator[str]:
+    """
+    Search results as NDJSON lines or SSE "match" events, one per match as
+    it is found. SSE ends with a "done" event carrying the count and whether
+    max_results cut the search short. Blocking: StreamingResponse runs each
+    step on its thread pool, and stops it when the client goes away.
+    """
+    found = 0
+    for result in fm.iter_search(
+        text,
+        is_regex=is_regex,
+        case_sensitive=case_sensitive,
+        file_pattern=file_pattern,
+        max_results=max_results,
+        context=context,
+    ):
+        found += 1
+        if fmt == SSE:
+            yield _sse("match", result.model_dump_json(exclude_none=True))
+        else:
+            yield _ndjson(result)
+    if fmt == SSE:
+        yield _sse("done", json.dumps({"count": found, "limited": found >= max_results}))
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+from app import STATUS_BATCH_INTERVAL, STATUS_RECONCILE_INTERVAL
+from app.data.models import Pupil, UserIp, WarmContainer
+from app.utils.admission import admission
+from app.utils.codespaces import (
+    LABEL_CODESPACE,
+    LABEL_PUPIL,
+    codespace_statuses,
+    codespace_statuses_by_host,
+)
+from app.utils.docker_client import docker_client
+from app.utils.placement import DockerHost, PlacementRegistry, placement
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Docker event → Pupil.container_status
+EVENT_STATUS = {
+    "start": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "stop": "exited",
+    "die": "exited",
+    "oom": "exited",
+    "destroy": "removed",
+}
+
+# statuses the proxy's idle reaper leaves behind as "suspended"
+SUSPENDED_AS = ("exited", "paused")
+
+# statuses that hold host memory/CPU
+OCCUPYING = ("running", "paused")
+
+
+def status_update(username: str, status: str) -> UpdateOne:
+    query = {"username": username, "container_status": {"$ne": status}}
+    if status in SUSPENDED_AS:
+        query["container_status"] = {"$nin": [status, "suspended"]}
+    return UpdateOne(query, {"$set": {"container_status": status}})
+
+
+class StatusReconciler:
+    """
+    Keeps Pupil.container_status in line with Docker.
+
+    A thread per Docker host follows its events stream for container state
+    changes; the changes are coalesced per pupil and written with one
+    bulk_write per batch. A periodic full reconcile (one labelled container
+    list per host, one UserIp query) catches whatever was missed while a
+    stream was down. A restarted container may come back with another IP
+    (or published port), so "start" events also refresh its UserIp.
+    """
+
+    def __init__(
+        self,
+        placements: PlacementRegistry = placement,
+        interval: float = STATUS_RECONCILE_INTERVAL,
+        batch_interval: float = STATUS_BATCH_INTERVAL,
+    ):
+        self.placements = placements
+        self.interval = interval
+        self.batch_interval = batch_interval
+        self._usernames: dict[str, str] = {}  # container id → username
+        self._queue: Optional[asyncio.Queue] = None
+        self._stop = threading.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._stop.clear()
+        for host in self.placements.hosts.values():
+            threading.Thread(
+                target=self._follow_events, args=(loop, host), daemon=True
+            ).start()
+        self._tasks = [
+            loop.create_task(self._apply_events()),
+            loop.create_task(self._reconcile_loop()),
+        ]
+
+    def stop(self) -> None:
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def _follow_events(self, loop: asyncio.AbstractEventLoop, host: DockerHost) -> None:
+        # codespaces and warm containers only, not the backend, proxy or database
+        filters = {
+            "type": "container",
+            "event": list(EVENT_STATUS),
+            "label": [f"{LABEL_CODESPACE}=1"],
+        }
+        while not self._stop.is_set():
+            try:
+                for event in host.docker.get_client().events(decode=True, filters=filters):
+                    if self._stop.is_set():
+                        return
+                    loop.call_soon_threadsafe(self._queue.put_nowait, (host, event))
+            except Exception as e:
+                logger.error(f"Docker events stream error on {host.name}: {e}")
+            self._stop.wait(5)
+
+    async def _apply_events(self) -> None:
+        while True:
+            pending = {}  # username → latest status
+            started = {}  # username → (host, container id) started in this batch
+            host, event = await self._queue.get()
+            deadline = asyncio.get_running_loop().time() + self.batch_interval
+            while True:
+                await self._collect(event, pending, host, started)
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    host, event = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.write(pending)
+                await self.refresh_addresses(started)
+            except Exception as e:
+                logger.error(f"MongoDB Error: {e}")
+
+    async def _collect(
+        self,
+        event: dict,
+        pending: dict[str, str],
+        host: Optional[DockerHost] = None,
+        started: Optional[dict[str, tuple[DockerHost, str]]] = None,
+    ) -> None:
+        action = event.get("Action") or event.get("status")
+        status = EVENT_STATUS.get(action)
+        container_id = event.get("id") or event.get("Actor", {}).get("ID")
+        if not status or not container_id:
+            return
+        attributes = event.get("Actor", {}).get("Attributes", {})
+        if attributes.get(LABEL_CODESPACE) != "1":
+            return  # not a codespace, no need to ask the database
+        username = attributes.get(LABEL_PUPIL) or self._usernames.get(container_id)
+        if username is None:
+            userip = await UserIp.find_one(UserIp.container_id == container_id)
+            if userip is None:
+                return  # not a codespace
+            username = self._usernames[container_id] = userip.username
+        pending[username] = status
+        if action == "start" and host is not None and started is not None:
+            started[username] = (host, container_id)
+        if status in OCCUPYING:
+            admission.started(username, host.name if host is not None else None)
+        else:
+            admission.release(username)
+
+    async def write(self, statuses: dict[str, str]) -> None:
+        if not statuses:
+            return
+        await Pupil.get_motor_collection().bulk_write(
+            [status_update(username, status) for username, status in statuses.items()],
+            ordered=False,
+        )
+
+    async def refresh_addresses(self, started: dict[str, tuple[DockerHost, str]]) -> None:
+        """Points the UserIp of each started container at its current address."""
+        collection = UserIp.get_motor_collection()
+        for username, (host, container_id) in started.items():
+            try:
+                ip, port = await self.placements.address(host, container_id)
+            except Exception as e:
+                logger.error(f"Could not inspect codespace of {username} on {host.name}: {e}")
+                continue
+            if not ip:
+                continue
+            result = await collection.update_one(
+                {
+                    "username": username,
+                    "container_id": container_id,
+                    "$or": [{"ip": {"$ne": ip}}, {"port": {"$ne": port}}],
+                },
+                {"$set": {"ip": ip, "port": port}},
+            )
+            if result.modified_count:
+                logger.info("Codespace of %s moved to %s:%s", username, ip, port)
+
+    async def reconcile(self) -> None:
+        # launch placeholders have no container yet
+        userips = await UserIp.find(UserIp.container_id != "").to_list()
+        warm = await WarmContainer.find_all().to_list()
+        statuses = await codespace_statuses_by_host(userips, self.placements)
+        if warm:
+            # the warm pool lives on the local daemon
+            statuses.update(
+                await codespace_statuses([c.container_id for c in warm], docker_client)
+            )
+        self._usernames = {userip.container_id: userip.username for userip in userips}
+        running: dict[Optional[str], list[str]] = {}
+        for userip in userips:
+            if statuses[userip.container_id] in OCCUPYING:
+                running.setdefault(userip.host, []).append(userip.username)
+        # the warm pool lives on the default host
+        running.setdefault(None, []).extend(
+            f"warm:{c.slot}" for c in warm if statuses[c.container_id] in OCCUPYING
+        )
+        admission.sync(running)
+        await self.write(
+            {userip.username: statuses[userip.container_id] for userip in userips}
+        )
+
+    async def _reconcile_loop(self) -> None:
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Container status reconcile failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+status_reconciler = StatusReconciler()
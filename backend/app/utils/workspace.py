@@ -0,0 +1,150 @@
+"""
+Filling a pupil's user-<name>-config / user-<name>-prj directories from the
+babirusa/baseconfig and babirusa/baseprj templates without copying their
+content.
+
+reflink — every file is a copy-on-write clone (FICLONE) of the template
+          file: no data is written and the clone separates on the first
+          write. Filesystems without clones (ext4, overlayfs) get a plain
+          copy, file by file.
+copy    — a full copy, what distutils' copy_tree used to do.
+
+Hard links are not an option: code-server runs as root and rewrites files in
+place through its bind mount, so a linked file would carry one pupil's edit
+to the template and every classmate. unshare() separates workspaces filled
+by the former hardlink mode.
+"""
+
+import errno
+import logging
+import os
+import shutil
+from typing import Iterable, NamedTuple
+
+from app import WORKSPACE_MODE
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no clones, plain copies
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MODES = ("reflink", "copy")
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+
+# errors meaning "this filesystem can't clone the file", not a real failure
+_UNSHARED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS,
+             errno.EPERM}
+
+
+class WorkspaceStats(NamedTuple):
+    files: int
+    shared: int  # cloned, no data written
+    copied_bytes: int
+
+
+def clone_file(src: str, dst: str) -> bool:
+    """Reflinks src to dst; copies it where the filesystem can't. True if cloned."""
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        cloned = False
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+                cloned = True
+            except OSError as e:
+                if e.errno not in _UNSHARED:
+                    raise
+        if not cloned:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    shutil.copystat(src, dst)
+    return cloned
+
+
+def _files(root: str) -> Iterable[os.DirEntry]:
+    pending = [root]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def unshare(templates: Iterable[str], roots: Iterable[str]) -> int:
+    """
+    Gives every file under roots that shares its inode with a template file
+    its own copy; returns how many were separated. Costs one walk of the
+    templates when none of their files has another link.
+    """
+    linked = set()
+    for template in templates:
+        for entry in _files(template):
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_nlink > 1:
+                linked.add((stat.st_dev, stat.st_ino))
+    if not linked:
+        return 0
+
+    separated = 0
+    for root in roots:
+        for entry in _files(root):
+            stat = entry.stat(follow_symlinks=False)
+            if (stat.st_dev, stat.st_ino) not in linked:
+                continue
+            private = f"{entry.path}.unshare-{os.getpid()}"
+            shutil.copy2(entry.path, private)
+            os.replace(private, entry.path)
+            separated += 1
+    return separated
+
+
+def populate(
+    src: str,
+    dst: str,
+    mode: str = WORKSPACE_MODE,
+    skip: Iterable[str] = (),
+) -> WorkspaceStats:
+    """
+    Recreates the template tree src under dst, leaving out the `skip`
+    subdirectories (relative to src). Files that already exist in dst are
+    left as they are. Symlinks are followed, as copy_tree did.
+    """
+    if mode == "hardlink":
+        logger.warning("WORKSPACE_MODE=hardlink is no longer supported, using reflink")
+        mode = "reflink"
+    if mode not in MODES:
+        raise ValueError(f"Unknown workspace mode: {mode!r}")
+
+    skipped = {os.path.normpath(os.path.join(src, path)) for path in skip}
+    files = shared = copied = 0
+    pending = [(src, dst)]
+    while pending:
+        src_dir, dst_dir = pending.pop()
+        os.makedirs(dst_dir, exist_ok=True)
+        with os.scandir(src_dir) as entries:
+            for entry in entries:
+                target = os.path.join(dst_dir, entry.name)
+                if entry.is_dir():
+                    if os.path.normpath(entry.path) not in skipped:
+                        pending.append((entry.path, target))
+                    continue
+                if not entry.is_file() or os.path.lexists(target):
+                    continue
+                size = entry.stat().st_size
+                files += 1
+                if mode == "reflink":
+                    done = clone_file(entry.path, target)
+                else:
+                    shutil.copy2(entry.path, target)
+                    done = False
+                if done:
+                    shared += 1
+                else:
+                    copied += size
+    return WorkspaceStats(files, shared, copied)
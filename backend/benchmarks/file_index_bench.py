@@ -0,0 +1,115 @@
+"""
+FileManager listing benchmark: os.walk per query vs the shared file index.
+
+Builds a synthetic pupil project (10k files by default, spread over nested
+directories like a project with a virtualenv), then times repeated
+list_all_files-style queries:
+
+walk          — the former implementation: os.walk, then os.stat per file
+index cold    — first query, the index is built with os.scandir
+index poll    — unchanged project, polling with FILE_INDEX_POLL_INTERVAL=0
+                (every query rechecks directory mtimes and file stats)
+index inotify — unchanged project, inotify watches (Linux)
+list_all_files — FileManager.list_all_files on a warm index (its FileInfo
+                 list is reused until the project changes)
+
+    python benchmarks/file_index_bench.py
+    python benchmarks/file_index_bench.py --files 50000 --per-dir 100 --repeat 50
+
+Run from the backend directory.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet  # noqa: E402
+
+os.environ.setdefault("SECRET_KEY_USER", Fernet.generate_key().decode())
+
+from app.data.schemas import FileInfo  # noqa: E402
+from app.utils import file_manager  # noqa: E402
+from app.utils.file_index import FileIndex  # noqa: E402
+
+
+def make_project(root: str, files: int, per_dir: int) -> None:
+    for n in range(files):
+        directory = os.path.join(root, f"pkg{n // (per_dir * 10)}", f"mod{n // per_dir}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file{n}.py"), "w") as f:
+            f.write(f"# file {n}\n")
+
+
+def walk_listing(root: str) -> list[FileInfo]:
+    rels = sorted(
+        os.path.relpath(os.path.join(base, name), root)
+        for base, _dirs, names in os.walk(root)
+        for name in names
+    )
+    entries = []
+    for rel in rels:
+        stat = os.stat(os.path.join(root, rel))
+        entries.append(
+            FileInfo(name=os.path.basename(rel), relative_path=rel, size=stat.st_size, is_directory=False)
+        )
+    return entries
+
+
+def timed(query, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        query()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=None, help="scratch directory (default: system temp)")
+    parser.add_argument("--files", type=int, default=10_000)
+    parser.add_argument("--per-dir", type=int, default=50, help="files per directory")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(prefix="file-index-bench-", dir=args.dir)
+    try:
+        root = os.path.join(base, "user-bench-prj")
+        make_project(root, args.files, args.per_dir)
+        print(f"project: {args.files} files, {args.per_dir} per directory, median of {args.repeat}")
+
+        results = [("walk", timed(lambda: walk_listing(root), args.repeat))]
+
+        started = time.perf_counter()
+        polling = FileIndex(root, use_inotify=False, poll_interval=0)
+        polling.entries()
+        results.append(("index cold", time.perf_counter() - started))
+        results.append(("index poll", timed(polling.entries, args.repeat)))
+
+        watching = FileIndex(root, use_inotify=True)
+        watching.entries()
+        if watching.watching:
+            results.append(("index inotify", timed(watching.entries, args.repeat)))
+        else:
+            print("inotify unavailable, skipped")
+        watching.close()
+
+        file_manager.BABIRUSA_HOME = base
+        fm = file_manager.FileManager("bench")
+        fm.list_all_files()
+        results.append(("list_all_files", timed(fm.list_all_files, args.repeat)))
+
+        for name, seconds in results:
+            print(f"{name:<16}{seconds * 1000:>10.2f}ms")
+    finally:
+        shutil.rmtree(base)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Throughput/latency benchmark: native asyncio proxy vs the mitmproxy addon.
+
+Starts one dummy code-server per simulated pupil on 127.0.0.<n>:8080, puts the
+chosen proxy in front of them with a static routing table and hammers it with
+keep-alive HTTP clients using <pupil>.babirusa.space Host headers.
+
+    python benchmarks/proxy_bench.py --target native
+    python benchmarks/proxy_bench.py --target mitm
+
+Run from the backend directory. Binding 127.0.0.x works out of the box on Linux.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+UPSTREAM_PORT = 8080
+
+
+async def start_upstreams(pupils: int, body_size: int) -> list:
+    body = b"x" * body_size
+    response = (
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n"
+        + f"Content-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if not head:
+                    break
+                writer.write(response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    servers = []
+    for n in range(pupils):
+        servers.append(await asyncio.start_server(handle, f"127.0.0.{n + 2}", UPSTREAM_PORT))
+    return servers
+
+
+def static_routes(pupils: int) -> str:
+    return ",".join(f"pupil{n}=127.0.0.{n + 2}" for n in range(pupils))
+
+
+async def start_native(port: int, pupils: int):
+    os.environ["ROUTING_STATIC_ROUTES"] = static_routes(pupils)
+    from proxy.routing import make_routing_table
+    from proxy.server import ReverseProxy
+
+    proxy = ReverseProxy(make_routing_table())
+    await proxy.start("127.0.0.1", port)
+    return proxy
+
+
+async def start_mitm(port: int, pupils: int):
+    env = dict(os.environ, ROUTING_STATIC_ROUTES=static_routes(pupils), MITM_MODE="SUBDOMAIN")
+    process = subprocess.Popen(
+        [
+            "mitmdump", "-q", "-s", "mitm.py",
+            "--listen-host", "127.0.0.1", "-p", str(port),
+            "--set", "keep_host_header=true",
+        ],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return process
+        except OSError:
+            await asyncio.sleep(0.1)
+    process.kill()
+    raise RuntimeError("mitmdump did not start")
+
+
+async def client(port: int, host: str, deadline: float, latencies: list) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    request = f"GET /static/app.js HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+async def run(args) -> None:
+    upstreams = await start_upstreams(args.pupils, args.body_size)
+    if args.target == "native":
+        proxy = await start_native(args.port, args.pupils)
+    else:
+        proxy = await start_mitm(args.port, args.pupils)
+
+    latencies: list[float] = []
+    deadline = time.perf_counter() + args.duration
+    try:
+        await asyncio.gather(*(
+            client(args.port, f"pupil{n % args.pupils}.babirusa.space", deadline, latencies)
+            for n in range(args.connections)
+        ))
+    finally:
+        if args.target == "native":
+            await proxy.close()
+        else:
+            proxy.terminate()
+            proxy.wait()
+        for server in upstreams:
+            server.close()
+
+    latencies.sort()
+    print(f"target:       {args.target}")
+    print(f"requests:     {len(latencies)}")
+    print(f"rps:          {len(latencies) / args.duration:.0f}")
+    print(f"p50 latency:  {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"p99 latency:  {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["native", "mitm"], default="native")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--pupils", type=int, default=30)
+    parser.add_argument("--connections", type=int, default=60)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--body-size", type=int, default=16 * 1024)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
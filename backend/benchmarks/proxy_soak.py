@@ -0,0 +1,158 @@
+"""
+Memory soak test for the codespace proxy.
+
+Simulated pupils keep downloading large "extension bundles" and exchanging
+websocket messages through the proxy while its RSS is sampled. With streaming
+enabled the RSS curve should flatten after warm-up instead of growing with
+traffic volume.
+
+    python benchmarks/proxy_soak.py --target mitm --duration 120
+    python benchmarks/proxy_soak.py --target native --duration 120
+
+Run from the backend directory.
+"""
+
+import argparse
+import asyncio
+import http
+import os
+import subprocess
+import sys
+import time
+
+import websockets
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPSTREAM_PORT = 8080
+
+
+async def start_upstreams(pupils: int, bundle_size: int) -> list:
+    bundle = os.urandom(bundle_size)
+
+    async def process_request(path, request_headers):
+        if path.startswith("/static/"):
+            return http.HTTPStatus.OK, [("Content-Type", "application/javascript")], bundle
+        return None
+
+    async def echo(websocket):
+        async for message in websocket:
+            await websocket.send(message)
+
+    servers = []
+    for n in range(pupils):
+        servers.append(
+            await websockets.serve(
+                echo, f"127.0.0.{n + 2}", UPSTREAM_PORT,
+                process_request=process_request, max_size=None,
+            )
+        )
+    return servers
+
+
+def spawn_proxy(target: str, port: int, pupils: int) -> subprocess.Popen:
+    routes = ",".join(f"pupil{n}=127.0.0.{n + 2}" for n in range(pupils))
+    env = dict(os.environ, ROUTING_STATIC_ROUTES=routes, MITM_MODE="SUBDOMAIN")
+    if target == "mitm":
+        command = [
+            "mitmdump", "-q", "-s", "mitm.py",
+            "--listen-host", "127.0.0.1", "-p", str(port),
+            "--set", "keep_host_header=true",
+            "--set", "stream_large_bodies=1m",
+        ]
+    else:
+        command = [sys.executable, "-m", "proxy.server", "--host", "127.0.0.1", "--port", str(port)]
+    return subprocess.Popen(command, env=env, cwd=BACKEND_DIR)
+
+
+async def wait_for_port(port: int) -> None:
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("proxy did not start")
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def downloader(port: int, host: str, deadline: float, stats: dict) -> None:
+    request = f"GET /static/extension.js HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode()
+    while time.monotonic() < deadline:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            writer.write(request)
+            while True:
+                chunk = await reader.read(64 * 1024)
+                if not chunk:
+                    break
+                stats["bytes"] += len(chunk)
+        finally:
+            writer.close()
+
+
+async def editor_socket(port: int, host: str, deadline: float, stats: dict) -> None:
+    payload = os.urandom(4096)
+    async with websockets.connect(f"ws://{host}/", host="127.0.0.1", port=port, max_size=None) as ws:
+        while time.monotonic() < deadline:
+            await ws.send(payload)
+            await ws.recv()
+            stats["messages"] += 1
+
+
+async def sampler(pid: int, deadline: float, interval: float, samples: list) -> None:
+    started = time.monotonic()
+    while time.monotonic() < deadline:
+        samples.append((time.monotonic() - started, rss_mb(pid)))
+        await asyncio.sleep(interval)
+
+
+async def run(args) -> None:
+    upstreams = await start_upstreams(args.pupils, args.bundle_size)
+    proxy = spawn_proxy(args.target, args.port, args.pupils)
+    stats = {"bytes": 0, "messages": 0}
+    samples: list[tuple[float, float]] = []
+    try:
+        await wait_for_port(args.port)
+        deadline = time.monotonic() + args.duration
+        hosts = [f"pupil{n}.babirusa.space" for n in range(args.pupils)]
+        await asyncio.gather(
+            sampler(proxy.pid, deadline, args.interval, samples),
+            *(downloader(args.port, host, deadline, stats) for host in hosts),
+            *(editor_socket(args.port, host, deadline, stats) for host in hosts),
+        )
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        for server in upstreams:
+            server.close()
+
+    print(f"target: {args.target}, pupils: {args.pupils}")
+    print(f"transferred: {stats['bytes'] / 2**20:.0f} MiB, websocket round-trips: {stats['messages']}")
+    for elapsed, rss in samples:
+        print(f"  t={elapsed:6.1f}s  rss={rss:7.1f} MiB")
+    warm = [rss for elapsed, rss in samples if elapsed >= args.duration / 4]
+    if warm:
+        print(f"RSS growth after warm-up: {max(warm) - warm[0]:+.1f} MiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["native", "mitm"], default="mitm")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--pupils", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--interval", type=float, default=5.0)
+    parser.add_argument("--bundle-size", type=int, default=8 * 2**20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Workspace provisioning benchmark: copy vs reflink.
+
+Builds a synthetic template (many small files plus a few large ones, like a
+baseconfig with extensions), then provisions it for N pupils in each mode and
+reports the time per pupil and the disk space the pupils' directories add.
+
+    python benchmarks/workspace_bench.py --dir /var/lib/babirusa-bench
+    python benchmarks/workspace_bench.py --small 5000 --large 20 --large-mb 8
+
+Run from the backend directory. Reflinks need a filesystem with clones
+(btrfs, XFS with reflink=1, bcachefs); elsewhere reflink mode falls back to
+copies and measures the same as copy. The disk figure comes from statvfs, so
+keep other writers off that filesystem while it runs.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SECRET_KEY_USER", "bench")
+
+from app.utils.workspace import MODES, populate  # noqa: E402
+
+
+def make_template(root: str, small: int, large: int, large_mb: int) -> int:
+    chunk = os.urandom(1024 * 1024)
+    total = 0
+    for n in range(small):
+        path = os.path.join(root, "extensions", f"ext{n % 50}", f"file{n}.js")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = chunk[: 2048 + n % 4096]
+        with open(path, "wb") as f:
+            f.write(data)
+        total += len(data)
+    for n in range(large):
+        path = os.path.join(root, "extensions", f"ext{n % 50}", f"bundle{n}.node")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            for _ in range(large_mb):
+                f.write(chunk)
+        total += large_mb * len(chunk)
+    return total
+
+
+def used_bytes(path: str) -> int:
+    os.sync()
+    stat = os.statvfs(path)
+    return (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+
+
+def run(base: str, template: str, mode: str, pupils: int) -> tuple[float, int]:
+    before = used_bytes(base)
+    timings = []
+    for n in range(pupils):
+        target = os.path.join(base, f"{mode}-user-{n}-config")
+        started = time.perf_counter()
+        populate(template, target, mode=mode)
+        timings.append(time.perf_counter() - started)
+    added = used_bytes(base) - before
+    for n in range(pupils):
+        shutil.rmtree(os.path.join(base, f"{mode}-user-{n}-config"))
+    return statistics.median(timings), added
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=None, help="scratch directory (default: system temp)")
+    parser.add_argument("--pupils", type=int, default=10)
+    parser.add_argument("--small", type=int, default=2000, help="small template files")
+    parser.add_argument("--large", type=int, default=10, help="large template files")
+    parser.add_argument("--large-mb", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(prefix="workspace-bench-", dir=args.dir)
+    try:
+        template = os.path.join(base, "baseconfig")
+        size = make_template(template, args.small, args.large, args.large_mb)
+        print(f"template: {args.small + args.large} files, {size / 2**20:.1f} MiB, {args.pupils} pupils")
+        print(f"{'mode':<10}{'per pupil':>12}{'disk added':>14}{'per pupil':>12}")
+        for mode in args.modes:
+            median, added = run(base, template, mode, args.pupils)
+            print(
+                f"{mode:<10}{median * 1000:>10.1f}ms"
+                f"{added / 2**20:>12.1f}MiB{added / args.pupils / 2**20:>10.2f}MiB"
+            )
+    finally:
+        shutil.rmtree(base)
+
+
+if __name__ == "__main__":
+    main()
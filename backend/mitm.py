@@ -1,61 +1,191 @@
-from pymongo import MongoClient
-from os import getenv
-from dotenv import load_dotenv
-from mitmproxy import http, ctx
+from mitmproxy import http
+import asyncio
 import logging
+import time
 
-load_dotenv()
+from proxy import PROXY_STATIC_CACHE, PROXY_WAKE_ON_REQUEST
+from proxy.idle import ActivityTracker, IdleReaper
+from proxy.metrics import ProxyMetrics
+from proxy.routing import make_routing_table, resolve_route
+from proxy.static_cache import StaticAssetCache, cache_key, is_cacheable_response
+from proxy.wake import CodespaceWaker, WakeError
 
 logging.basicConfig(level=logging.ERROR)
 
-MONGO_DSN = getenv("MONGO_DSN")
-MITM_MODE = getenv("MITM_MODE")
-IP_ADDRESS = getenv("IP_ADDRESS")
-
-# Создаем клиент один раз
-client = MongoClient(MONGO_DSN, serverSelectionTimeoutMS=2000)
-db = client.get_default_database()
-
-def request(flow: http.HTTPFlow) -> None:
-    host = flow.request.pretty_host
-
-    if "babirusa.space" not in host:
-        flow.kill()
-        return
-
-    try:
-        userports = list(db["UserIp"].find({}, {"username": 1, "ip": 1}))
-        SUBDOMAIN_TO_PORT = {u["username"]: u["ip"] for u in userports}
-    except Exception as e:
-        ctx.log.error(f"MongoDB Error: {e}")
-        flow.response = http.Response.make(503, b"Database Error")
-        return
-
-    if MITM_MODE == "PATH":
-        parts = flow.request.path.split("/")
-        path = parts[1] if len(parts) > 1 else ""
-        
-        if path in SUBDOMAIN_TO_PORT:
-            new_ip = SUBDOMAIN_TO_PORT[path]
-            flow.request.headers["Host"] = f"babirusa.space"
-            flow.request.headers["X-Forwarded-Host"] = f"babirusa.space/{path}"
-            flow.request.headers["X-Forwarded-Proto"] = "https"
-            flow.websocket_proxy = True
-            flow.request.host = new_ip
-            flow.request.port = 8080
-        else:
-            flow.request.host = IP_ADDRESS
-            flow.request.port = 5000 if path == "api" else 1000
-    else:
-        subdomain = host.split(".")[0]
-        if subdomain in SUBDOMAIN_TO_PORT:
-            new_ip = SUBDOMAIN_TO_PORT[subdomain]
-            flow.request.headers["Host"] = f"{subdomain}.babirusa.space"
-            flow.request.headers["X-Forwarded-Host"] = f"{subdomain}.babirusa.space"
-            flow.request.headers["X-Forwarded-Proto"] = "https"
+
+class CodespaceRouter:
+    def __init__(self):
+        self.routes = make_routing_table()
+        self.static = StaticAssetCache() if PROXY_STATIC_CACHE else None
+        self.waker = CodespaceWaker(self.routes) if PROXY_WAKE_ON_REQUEST else None
+        self.activity = ActivityTracker()
+        # suspending is only safe when the next request can wake it up again
+        self.reaper = IdleReaper(self.activity, self.waker) if self.waker else None
+        self.metrics = ProxyMetrics()
+        self.metrics_server = None
+
+    async def running(self) -> None:
+        self.routes.start()
+        if self.reaper is not None:
+            self.reaper.start()
+        self.metrics_server = await self.metrics.serve()
+
+    def done(self) -> None:
+        self.routes.stop()
+        if self.reaper is not None:
+            self.reaper.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+
+    async def requestheaders(self, flow: http.HTTPFlow) -> None:
+        # Routing happens on headers so that codespace bodies can be streamed
+        # straight to the container instead of being buffered first.
+        started = time.perf_counter()
+        route = resolve_route(flow.request.pretty_host, flow.request.path, self.routes)
+        self.metrics.unknown_host(route)
+        if route is None:
+            flow.kill()
+            return
+        self.metrics.observe("routing", route.kind, time.perf_counter() - started)
+
+        if not self.routes.ready:
+            flow.response = http.Response.make(503, b"Database Error")
+            return
+
+        for name, value in route.headers.items():
+            flow.request.headers[name] = value
+        flow.request.host = route.host
+        flow.request.port = route.port
+        flow.metadata["route"] = route.kind
+
+        if route.kind == "codespace":
             flow.websocket_proxy = True
-            flow.request.host = new_ip
-            flow.request.port = 8080
-        else:
-            flow.request.host = IP_ADDRESS
-            flow.request.port = 5000 if subdomain == "api" else 1000
\ No newline at end of file
+            flow.metadata["codespace"] = route.name
+            self.activity.touch(route.name)
+            if await self.serve_static(flow):
+                return
+            if self.waker is not None:
+                try:
+                    flow.request.host, flow.request.port = await self.waker.ensure_awake(
+                        route.name, route.host, route.port
+                    )
+                except WakeError as e:
+                    logging.error(str(e))
+                    flow.response = http.Response.make(503, b"Codespace is not available")
+                    flow.metadata["local"] = True
+                    return
+            flow.request.stream = self.counting_stream(flow, "request_bytes")
+
+    @staticmethod
+    def counting_stream(flow: http.HTTPFlow, key: str):
+        """Streams a body through unchanged, adding its size to flow.metadata[key]."""
+        flow.metadata[key] = 0
+
+        def count(chunk: bytes) -> bytes:
+            flow.metadata[key] += len(chunk)
+            return chunk
+
+        return count
+
+    async def serve_static(self, flow: http.HTTPFlow) -> bool:
+        if self.static is None or flow.request.method != "GET":
+            return False
+        key = cache_key(flow.request.path)
+        if key is None:
+            return False
+
+        asset = await self.static.get(key)
+        if asset is None:
+            flow.metadata["static_key"] = key
+            return False
+
+        headers, body = self.static.response_parts(
+            asset, flow.request.headers.get("Accept-Encoding", "")
+        )
+        etag = asset.headers.get("etag")
+        if etag and flow.request.headers.get("If-None-Match") == etag:
+            flow.response = http.Response.make(
+                304, b"", {"ETag": etag, "Cache-Control": headers["Cache-Control"]}
+            )
+            flow.metadata["local"] = True
+            return True
+
+        # raw_content: the body is already encoded, mitmproxy must not touch it
+        flow.response = http.Response.make(200, b"", headers)
+        flow.response.raw_content = body
+        flow.response.headers["Content-Length"] = str(len(body))
+        flow.metadata["local"] = True
+        return True
+
+    def responseheaders(self, flow: http.HTTPFlow) -> None:
+        kind = flow.metadata.get("route")
+        if kind is None or flow.metadata.get("local"):
+            return
+        self.observe_upstream(flow, kind)
+        if kind != "codespace":
+            return
+        if self.waker is not None:
+            self.waker.mark_alive(flow.metadata["codespace"])
+        if flow.metadata.get("static_key") and self.fits_static(flow.response):
+            return
+        flow.response.stream = self.counting_stream(flow, "response_bytes")
+
+    def observe_upstream(self, flow: http.HTTPFlow, kind: str) -> None:
+        server = flow.server_conn
+        connect = 0.0
+        # a connection opened for an earlier flow was reused, nothing to wait for
+        if server.timestamp_tcp_setup and server.timestamp_start >= flow.request.timestamp_start:
+            connect = server.timestamp_tcp_setup - server.timestamp_start
+        self.metrics.observe("connect", kind, connect)
+        self.metrics.observe(
+            "ttfb", kind, flow.response.timestamp_start - flow.request.timestamp_start
+        )
+
+    def fits_static(self, response: http.Response) -> bool:
+        length = response.headers.get("Content-Length")
+        return (
+            is_cacheable_response(response.status_code, response.headers)
+            and length is not None
+            and length.isdigit()
+            and int(length) <= self.static.max_entry
+        )
+
+    def response(self, flow: http.HTTPFlow) -> None:
+        kind = flow.metadata.get("route")
+        if kind is not None:
+            self.metrics.request_done(
+                kind,
+                flow.metadata.get("request_bytes", len(flow.request.raw_content or b"")),
+                flow.metadata.get("response_bytes", len(flow.response.raw_content or b"")),
+            )
+
+        key = flow.metadata.get("static_key")
+        if not key or flow.response.stream or not self.fits_static(flow.response):
+            return
+        try:
+            content = flow.response.content
+        except ValueError:
+            return
+        # compression runs off the event loop; this response is not delayed
+        asyncio.get_running_loop().run_in_executor(
+            None, self.static.put, key, content, dict(flow.response.headers)
+        )
+
+    def websocket_start(self, flow: http.HTTPFlow) -> None:
+        self.metrics.websocket_opened(flow.metadata.get("route", "frontend"))
+
+    def websocket_end(self, flow: http.HTTPFlow) -> None:
+        self.metrics.websocket_closed(flow.metadata.get("route", "frontend"))
+
+    def websocket_message(self, flow: http.HTTPFlow) -> None:
+        # mitmproxy appends every frame to the flow; code-server sockets live
+        # for hours, so only the message being relayed right now is kept.
+        del flow.websocket.messages[:-1]
+        message = flow.websocket.messages[-1]
+        kind = flow.metadata.get("route", "frontend")
+        self.metrics.add_bytes(kind, "request" if message.from_client else "response", len(message.content))
+        if message.from_client and "codespace" in flow.metadata:
+            self.activity.touch(flow.metadata["codespace"])
+
+
+addons = [CodespaceRouter()]
@@ -0,0 +1,44 @@
+from os import getenv
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_DSN = getenv("MONGO_DSN")
+MITM_MODE = getenv("MITM_MODE")
+IP_ADDRESS = getenv("IP_ADDRESS")
+
+ROUTING_RESYNC_INTERVAL = float(getenv("ROUTING_RESYNC_INTERVAL", "60"))
+# "alice=172.17.0.2,bob=172.17.0.3" — fixed table without Mongo (local runs, benchmarks)
+ROUTING_STATIC_ROUTES = getenv("ROUTING_STATIC_ROUTES")
+
+PROXY_HOST = getenv("PROXY_HOST", "0.0.0.0")
+PROXY_PORT = int(getenv("PROXY_PORT", "8080"))
+PROXY_POOL_SIZE = int(getenv("PROXY_POOL_SIZE", "32"))
+PROXY_POOL_IDLE_TIMEOUT = float(getenv("PROXY_POOL_IDLE_TIMEOUT", "30"))
+PROXY_CONNECT_TIMEOUT = float(getenv("PROXY_CONNECT_TIMEOUT", "5"))
+
+# Shared cache of code-server's versioned static assets; empty dir = memory only
+PROXY_STATIC_CACHE = getenv("PROXY_STATIC_CACHE", "true").lower() == "true"
+PROXY_STATIC_CACHE_DIR = getenv("PROXY_STATIC_CACHE_DIR", "/tmp/babirusa-static-cache")
+PROXY_STATIC_CACHE_MEMORY_MB = int(getenv("PROXY_STATIC_CACHE_MEMORY_MB", "256"))
+PROXY_STATIC_CACHE_MAX_ENTRY_MB = int(getenv("PROXY_STATIC_CACHE_MAX_ENTRY_MB", "32"))
+
+# Start stopped codespaces when a request for them arrives
+PROXY_WAKE_ON_REQUEST = getenv("PROXY_WAKE_ON_REQUEST", "true").lower() == "true"
+PROXY_WAKE_TIMEOUT = float(getenv("PROXY_WAKE_TIMEOUT", "60"))
+PROXY_ALIVE_TTL = float(getenv("PROXY_ALIVE_TTL", "30"))
+# Route local codespaces by container name (codespace-<username>): needs the proxy
+# on the backend's CODESPACE_NETWORK, Docker's DNS then follows restarts
+PROXY_ROUTE_BY_NAME = getenv("PROXY_ROUTE_BY_NAME", "false").lower() == "true"
+# Docker daemons codespaces run on, same format as the backend's DOCKER_HOSTS
+DOCKER_HOSTS = getenv("DOCKER_HOSTS")
+
+# Suspend codespaces nobody has used for this many seconds (0 = never)
+PROXY_IDLE_TIMEOUT = float(getenv("PROXY_IDLE_TIMEOUT", "1800"))
+PROXY_IDLE_ACTION = getenv("PROXY_IDLE_ACTION", "stop")  # stop, pause
+PROXY_IDLE_CHECK_INTERVAL = float(getenv("PROXY_IDLE_CHECK_INTERVAL", "60"))
+
+# Prometheus-style metrics endpoint, local only by default (0 = disabled)
+PROXY_METRICS_HOST = getenv("PROXY_METRICS_HOST", "127.0.0.1")
+PROXY_METRICS_PORT = int(getenv("PROXY_METRICS_PORT", "9091"))
@@ -0,0 +1,113 @@
+"""
+Idle codespace auto-suspend.
+
+The proxy sees every request and websocket message per pupil. Containers
+nobody has touched for PROXY_IDLE_TIMEOUT seconds are stopped (or paused) and
+marked "suspended" on the Pupil document; the waker brings them back on the
+next request.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import docker
+
+from proxy import PROXY_IDLE_ACTION, PROXY_IDLE_CHECK_INTERVAL, PROXY_IDLE_TIMEOUT
+from proxy.wake import CodespaceWaker
+
+logger = logging.getLogger(__name__)
+
+SUSPENDED = "suspended"
+
+
+class ActivityTracker:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._last_seen: dict[str, float] = {}
+
+    def touch(self, username: str) -> None:
+        self._last_seen[username] = time.monotonic()
+
+    def last_seen(self, username: str) -> float:
+        # codespaces not visited since the proxy started count from startup
+        return self._last_seen.get(username, self.started_at)
+
+    def idle_for(self, username: str) -> float:
+        return time.monotonic() - self.last_seen(username)
+
+
+class IdleReaper:
+    def __init__(
+        self,
+        activity: ActivityTracker,
+        waker: CodespaceWaker,
+        idle_timeout: float = PROXY_IDLE_TIMEOUT,
+        action: str = PROXY_IDLE_ACTION,
+        interval: float = PROXY_IDLE_CHECK_INTERVAL,
+    ):
+        self.activity = activity
+        self.waker = waker
+        self.idle_timeout = idle_timeout
+        self.action = action
+        self.interval = interval
+        self._suspended_at: dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.idle_timeout > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap()
+            except Exception:
+                logger.exception("Idle reaper failed")
+
+    async def reap(self) -> list[str]:
+        suspended = []
+        for username in self.waker.routes.usernames():
+            if self.activity.idle_for(username) < self.idle_timeout:
+                continue
+            # already suspended and untouched since
+            if self._suspended_at.get(username, -1) >= self.activity.last_seen(username):
+                continue
+            if await self.suspend(username):
+                suspended.append(username)
+        return suspended
+
+    async def suspend(self, username: str) -> bool:
+        container_id = self.waker.routes.container_id(username)
+        if not container_id:
+            return False
+        try:
+            client = self.waker.docker_for(username)
+            container = await asyncio.to_thread(client.containers.get, container_id)
+            if container.status != "running":
+                # stopped by someone else (or paused before a proxy restart);
+                # the waker's probe only notices stopped ones
+                self._suspended_at[username] = time.monotonic()
+                if container.status == "paused":
+                    self.waker.mark_suspended(username)
+                return False
+            logger.info("Suspending idle codespace of %s", username)
+            if self.action == "pause":
+                await asyncio.to_thread(container.pause)
+            else:
+                await asyncio.to_thread(container.stop)
+        except docker.errors.DockerException as e:
+            logger.error(f"Could not suspend codespace of {username}: {e}")
+            return False
+
+        self._suspended_at[username] = time.monotonic()
+        self.waker.mark_suspended(username)
+        await asyncio.to_thread(self.waker.set_status, username, SUSPENDED)
+        return True
@@ -0,0 +1,199 @@
+"""
+Latency and throughput metrics for the codespace proxy.
+
+Per request the proxies record how long routing took, how long opening the
+upstream connection took (0 when a kept-alive one was reused), the time to
+the first response byte and the bytes moved in each direction. Everything is
+aggregated per route kind (api, frontend, codespace) and served in the
+Prometheus text format on a local port:
+
+    curl http://127.0.0.1:9091/metrics
+"""
+
+import asyncio
+import bisect
+import logging
+import threading
+from collections import defaultdict
+from typing import Optional
+
+from proxy import PROXY_METRICS_HOST, PROXY_METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+ROUTE_KINDS = ("api", "frontend", "codespace")
+
+LATENCY_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+SIZE_BUCKETS = tuple(4**n for n in range(4, 14))  # 256 B … 64 MiB
+
+PHASES = {
+    "routing": "Time spent resolving the upstream of a request",
+    "connect": "Time spent opening the upstream connection",
+    "ttfb": "Time from receiving the request head to the first upstream response byte",
+}
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:g}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class ProxyMetrics:
+    """Thread-safe: mitmproxy may call hooks from the event loop and workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {
+            phase: {kind: Histogram(LATENCY_BUCKETS) for kind in ROUTE_KINDS}
+            for phase in PHASES
+        }
+        self._sizes = {
+            direction: {kind: Histogram(SIZE_BUCKETS) for kind in ROUTE_KINDS}
+            for direction in ("request", "response")
+        }
+        self._bytes: dict[tuple[str, str], int] = defaultdict(int)
+        self._requests: dict[str, int] = defaultdict(int)
+        self._websockets_open: dict[str, int] = defaultdict(int)
+        self._websockets_total: dict[str, int] = defaultdict(int)
+        self.unknown_subdomains = 0
+        self.rejected_hosts = 0
+
+    def observe(self, phase: str, kind: str, seconds: float) -> None:
+        with self._lock:
+            self._latency[phase][kind].observe(seconds)
+
+    def request_done(self, kind: str, request_bytes: int, response_bytes: int) -> None:
+        with self._lock:
+            self._requests[kind] += 1
+            self._sizes["request"][kind].observe(request_bytes)
+            self._sizes["response"][kind].observe(response_bytes)
+            self._bytes[(kind, "request")] += request_bytes
+            self._bytes[(kind, "response")] += response_bytes
+
+    def add_bytes(self, kind: str, direction: str, count: int) -> None:
+        """Bytes that are not part of a request/response pair (websocket frames)."""
+        with self._lock:
+            self._bytes[(kind, direction)] += count
+
+    def websocket_opened(self, kind: str) -> None:
+        with self._lock:
+            self._websockets_open[kind] += 1
+            self._websockets_total[kind] += 1
+
+    def websocket_closed(self, kind: str) -> None:
+        with self._lock:
+            self._websockets_open[kind] -= 1
+
+    def unknown_host(self, route) -> None:
+        """
+        Counts requests that did not reach a codespace although they look
+        addressed to one: foreign hosts (dropped) and pupil names, subdomains
+        or path prefixes, that the routing table does not know (sent to the
+        frontend).
+        """
+        with self._lock:
+            if route is None:
+                self.rejected_hosts += 1
+            elif route.unknown:
+                self.unknown_subdomains += 1
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for phase, description in PHASES.items():
+                name = f"babirusa_proxy_{phase}_seconds"
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+                for kind, histogram in self._latency[phase].items():
+                    lines += histogram.render(name, f'route="{kind}"')
+
+            for direction, histograms in self._sizes.items():
+                name = f"babirusa_proxy_{direction}_size_bytes"
+                lines += [f"# HELP {name} Body size per {direction}", f"# TYPE {name} histogram"]
+                for kind, histogram in histograms.items():
+                    lines += histogram.render(name, f'route="{kind}"')
+
+            name = "babirusa_proxy_requests_total"
+            lines += [f"# HELP {name} Completed requests", f"# TYPE {name} counter"]
+            lines += [f'{name}{{route="{kind}"}} {self._requests[kind]}' for kind in ROUTE_KINDS]
+
+            name = "babirusa_proxy_bytes_total"
+            lines += [f"# HELP {name} Bytes relayed, websocket frames included", f"# TYPE {name} counter"]
+            for kind in ROUTE_KINDS:
+                for direction in ("request", "response"):
+                    lines.append(
+                        f'{name}{{route="{kind}",direction="{direction}"}} {self._bytes[(kind, direction)]}'
+                    )
+
+            name = "babirusa_proxy_websockets_open"
+            lines += [f"# HELP {name} Websocket connections open now", f"# TYPE {name} gauge"]
+            lines += [f'{name}{{route="{kind}"}} {self._websockets_open[kind]}' for kind in ROUTE_KINDS]
+
+            name = "babirusa_proxy_websockets_total"
+            lines += [f"# HELP {name} Websocket connections opened", f"# TYPE {name} counter"]
+            lines += [f'{name}{{route="{kind}"}} {self._websockets_total[kind]}' for kind in ROUTE_KINDS]
+
+            lines += [
+                "# HELP babirusa_proxy_unknown_subdomains_total Subdomains or path prefixes that match no pupil",
+                "# TYPE babirusa_proxy_unknown_subdomains_total counter",
+                f"babirusa_proxy_unknown_subdomains_total {self.unknown_subdomains}",
+                "# HELP babirusa_proxy_rejected_hosts_total Requests for hosts other than babirusa.space",
+                "# TYPE babirusa_proxy_rejected_hosts_total counter",
+                f"babirusa_proxy_rejected_hosts_total {self.rejected_hosts}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    async def handle_scrape(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            if request_line.split(b" ")[1:2] == [b"/metrics"]:
+                body = self.render().encode()
+                status = "200 OK"
+            else:
+                body = b"Not Found"
+                status = "404 Not Found"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(
+        self, host: str = PROXY_METRICS_HOST, port: int = PROXY_METRICS_PORT
+    ) -> Optional[asyncio.AbstractServer]:
+        if not port:
+            return None
+        try:
+            return await asyncio.start_server(self.handle_scrape, host, port)
+        except OSError as e:
+            logger.error(f"Metrics endpoint unavailable on {host}:{port}: {e}")
+            return None
@@ -0,0 +1,289 @@
+import logging
+import threading
+from typing import NamedTuple, Optional
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+
+from proxy import (
+    IP_ADDRESS,
+    MITM_MODE,
+    MONGO_DSN,
+    PROXY_ROUTE_BY_NAME,
+    ROUTING_RESYNC_INTERVAL,
+    ROUTING_STATIC_ROUTES,
+)
+
+logger = logging.getLogger(__name__)
+
+CODESPACE_PORT = 8080
+API_PORT = 5000
+FRONTEND_PORT = 1000
+
+# First path segments (PATH mode) and subdomains that belong to the site itself
+# rather than to a pupil: the frontend's pages and the bare domain.
+SITE_NAMES = frozenset(
+    {"", "www", "babirusa", "admin", "workspace", "qr", "my", "assets", "robots.txt", "favicon.ico"}
+)
+
+
+class RoutingTable:
+    """
+    In-memory copy of the UserIp collection: username → container IP (and,
+    for codespaces on other Docker hosts, the host name and published port).
+
+    The table is loaded once, then kept fresh by a change stream on UserIp
+    and a periodic full resync (the only source of updates when Mongo is not
+    a replica set and change streams are unavailable). Lookups never touch
+    Mongo; if Mongo goes away the last good table keeps serving.
+    """
+
+    def __init__(self, collection, resync_interval: float = ROUTING_RESYNC_INTERVAL):
+        self._collection = collection
+        self._resync_interval = resync_interval
+        self._routes: dict[str, str] = {}
+        self._containers: dict[str, str] = {}  # username → container id
+        self._hosts: dict[str, str] = {}  # username → Docker host name
+        self._ports: dict[str, int] = {}  # username → published port
+        self._usernames: dict = {}  # UserIp _id → username, to apply deletes
+        # changes received while a resync loads its snapshot, applied again after it
+        self._missed: Optional[list[dict]] = None
+        self._lock = threading.Lock()
+        self._resync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self.ready = False
+
+    @classmethod
+    def static(cls, routes: dict[str, str]) -> "RoutingTable":
+        table = cls(collection=None)
+        table._routes = dict(routes)
+        table.ready = True
+        return table
+
+    @property
+    def database(self):
+        return self._collection.database if self._collection is not None else None
+
+    def get(self, username: str) -> Optional[str]:
+        return self._routes.get(username)
+
+    def container_id(self, username: str) -> Optional[str]:
+        return self._containers.get(username)
+
+    def docker_host(self, username: str) -> Optional[str]:
+        return self._hosts.get(username)
+
+    def port(self, username: str) -> Optional[int]:
+        return self._ports.get(username)
+
+    def usernames(self) -> list[str]:
+        return list(self._routes)
+
+    def set_ip(self, username: str, ip: str, port: Optional[int] = None) -> None:
+        """Records a new container IP (and published port), locally and in UserIp."""
+        update = {"ip": ip}
+        with self._lock:
+            self._routes[username] = ip
+            if port is not None:
+                self._ports[username] = update["port"] = port
+        if self._collection is None:
+            return
+        try:
+            self._collection.update_one({"username": username}, {"$set": update})
+        except PyMongoError as e:
+            logger.error(f"MongoDB Error: {e}")
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._routes
+
+    def resync(self) -> bool:
+        with self._resync_lock:
+            return self._resync()
+
+    def _resync(self) -> bool:
+        with self._lock:
+            self._missed = []
+        try:
+            docs = list(
+                self._collection.find(
+                    {}, {"username": 1, "ip": 1, "container_id": 1, "host": 1, "port": 1}
+                )
+            )
+        except PyMongoError as e:
+            logger.error(f"MongoDB Error: {e}")
+            with self._lock:
+                self._missed = None
+            return False
+
+        routes = {d["username"]: d["ip"] for d in docs if d.get("ip")}
+        containers = {d["username"]: d["container_id"] for d in docs if d.get("container_id")}
+        hosts = {d["username"]: d["host"] for d in docs if d.get("host")}
+        ports = {d["username"]: d["port"] for d in docs if d.get("port")}
+        usernames = {d["_id"]: d["username"] for d in docs}
+        with self._lock:
+            self._routes = routes
+            self._containers = containers
+            self._hosts = hosts
+            self._ports = ports
+            self._usernames = usernames
+            # the snapshot may predate changes the stream already delivered
+            for change in self._missed:
+                self._apply(change)
+            self._missed = None
+            self.ready = True
+        return True
+
+    def apply_change(self, change: dict) -> None:
+        with self._lock:
+            if self._missed is not None:
+                self._missed.append(change)
+            self._apply(change)
+
+    def _apply(self, change: dict) -> None:
+        op = change.get("operationType")
+        doc_id = change.get("documentKey", {}).get("_id")
+
+        if op in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if not doc:
+                return
+            old_username = self._usernames.get(doc_id)
+            if old_username and old_username != doc["username"]:
+                self._forget(old_username)
+            self._usernames[doc_id] = doc["username"]
+            for table, field in (
+                (self._routes, "ip"),
+                (self._containers, "container_id"),
+                (self._hosts, "host"),
+                (self._ports, "port"),
+            ):
+                if doc.get(field):
+                    table[doc["username"]] = doc[field]
+                else:
+                    table.pop(doc["username"], None)
+        elif op == "delete":
+            username = self._usernames.pop(doc_id, None)
+            if username:
+                self._forget(username)
+
+    def _forget(self, username: str) -> None:
+        for table in (self._routes, self._containers, self._hosts, self._ports):
+            table.pop(username, None)
+
+    def start(self) -> None:
+        if self._collection is None:
+            return
+        self.resync()
+        for target in (self._watch_loop, self._resync_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _resync_loop(self) -> None:
+        while not self._stop.wait(self._resync_interval):
+            self.resync()
+
+    def _watch_loop(self) -> None:
+        resume_token = None
+        while not self._stop.is_set():
+            try:
+                with self._collection.watch(
+                    full_document="updateLookup",
+                    resume_after=resume_token,
+                    max_await_time_ms=1000,
+                ) as stream:
+                    # Changes made while the stream was down are only seen by
+                    # a full reload.
+                    if resume_token is None:
+                        self.resync()
+                    while not self._stop.is_set() and stream.alive:
+                        change = stream.try_next()
+                        if change is not None:
+                            self.apply_change(change)
+                        resume_token = stream.resume_token
+            except OperationFailure as e:
+                if e.code == 40573:
+                    # Standalone server: no change streams, rely on resync.
+                    logger.error("UserIp change stream unavailable, using periodic resync only")
+                    return
+                logger.error(f"UserIp change stream error: {e}")
+                resume_token = None
+            except PyMongoError as e:
+                logger.error(f"UserIp change stream error: {e}")
+                resume_token = None
+            self._stop.wait(self._resync_interval / 10)
+
+
+def make_routing_table() -> RoutingTable:
+    if ROUTING_STATIC_ROUTES:
+        routes = dict(
+            item.strip().split("=", 1)
+            for item in ROUTING_STATIC_ROUTES.split(",")
+            if item.strip()
+        )
+        return RoutingTable.static(routes)
+
+    client = MongoClient(MONGO_DSN, serverSelectionTimeoutMS=2000)
+    return RoutingTable(client.get_default_database()["UserIp"])
+
+
+class Route(NamedTuple):
+    kind: str  # codespace, api, frontend
+    name: str  # username for codespace routes
+    host: str
+    port: int
+    headers: dict[str, str]
+    unknown: bool = False  # looks addressed to a pupil the routing table does not know
+
+
+def resolve_route(
+    host: str,
+    path: str,
+    routes: RoutingTable,
+    mode: Optional[str] = MITM_MODE,
+    ip_address: Optional[str] = IP_ADDRESS,
+    by_name: bool = PROXY_ROUTE_BY_NAME,
+) -> Optional[Route]:
+    """
+    Maps a request to its upstream. Returns None for hosts that are not ours,
+    those connections are dropped.
+    """
+    if "babirusa.space" not in host:
+        return None
+
+    if mode == "PATH":
+        parts = path.split("/")
+        name = parts[1] if len(parts) > 1 else ""
+        forwarded_host = f"babirusa.space/{name}"
+        host_header = "babirusa.space"
+    else:
+        name = host.split(".")[0]
+        forwarded_host = f"{name}.babirusa.space"
+        host_header = forwarded_host
+
+    new_ip = routes.get(name)
+    if new_ip:
+        port = routes.port(name)
+        if by_name and port is None:
+            # local codespace: the network's DNS knows its current IP
+            new_ip = f"codespace-{name}"
+        return Route(
+            kind="codespace",
+            name=name,
+            host=new_ip,
+            port=port or CODESPACE_PORT,
+            headers={
+                "Host": host_header,
+                "X-Forwarded-Host": forwarded_host,
+                "X-Forwarded-Proto": "https",
+            },
+        )
+
+    if name == "api":
+        return Route("api", name, ip_address, API_PORT, {})
+    unknown = routes.ready and name not in SITE_NAMES
+    return Route("frontend", name, ip_address, FRONTEND_PORT, {}, unknown)
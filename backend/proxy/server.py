@@ -0,0 +1,588 @@
+"""
+Native asyncio reverse proxy for codespace routing.
+
+Applies the same routing as mitm.py (see proxy.routing) but only speaks plain
+HTTP/1.1 towards nginx, keeps idle upstream connections per container and
+relays websockets byte-for-byte. Run with:
+
+    python -m proxy.server --port 8080
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Optional
+
+from proxy import (
+    PROXY_CONNECT_TIMEOUT,
+    PROXY_HOST,
+    PROXY_POOL_IDLE_TIMEOUT,
+    PROXY_POOL_SIZE,
+    PROXY_PORT,
+    PROXY_STATIC_CACHE,
+    PROXY_WAKE_ON_REQUEST,
+)
+from proxy.idle import ActivityTracker, IdleReaper
+from proxy.metrics import ProxyMetrics
+from proxy.routing import RoutingTable, make_routing_table, resolve_route
+from proxy.static_cache import (
+    CachedAsset,
+    StaticAssetCache,
+    cache_key,
+    is_cacheable_response,
+)
+from proxy.wake import CodespaceWaker, WakeError
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+HEAD_LIMIT = 64 * 1024
+
+# Connection-scoped headers, never forwarded as-is (RFC 9110 §7.6.1).
+HOP_BY_HOP = {
+    "connection",
+    "keep-alive",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+class ProxyError(Exception):
+    def __init__(self, status: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+class Message:
+    """Start line and headers of an HTTP/1.1 request or response."""
+
+    def __init__(self, start_line: str, headers: list[tuple[str, str]]):
+        self.start_line = start_line
+        self.headers = headers
+
+    @classmethod
+    def parse(cls, head: bytes) -> "Message":
+        lines = head.decode("latin-1").split("\r\n")
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise ProxyError(400, "Bad Request")
+            headers.append((name.strip(), value.strip()))
+        return cls(lines[0], headers)
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def set_header(self, name: str, value: str) -> None:
+        self.remove_header(name)
+        self.headers.append((name, value))
+
+    def remove_header(self, name: str) -> None:
+        name = name.lower()
+        self.headers = [(k, v) for k, v in self.headers if k.lower() != name]
+
+    def tokens(self, name: str) -> set[str]:
+        value = self.get(name, "")
+        return {t.strip().lower() for t in value.split(",") if t.strip()}
+
+    def serialize(self) -> bytes:
+        lines = [self.start_line] + [f"{k}: {v}" for k, v in self.headers]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    @property
+    def is_chunked(self) -> bool:
+        return "chunked" in self.tokens("Transfer-Encoding")
+
+    @property
+    def content_length(self) -> Optional[int]:
+        value = self.get("Content-Length")
+        if value is None:
+            return None
+        # 1*DIGIT (RFC 9110 §8.6): int() would also take "-1", "+5" or "1_0"
+        if not (value.isascii() and value.isdigit()):
+            raise ProxyError(400, "Bad Request")
+        return int(value)
+
+    @property
+    def is_websocket(self) -> bool:
+        return "websocket" in self.tokens("Upgrade") and "upgrade" in self.tokens("Connection")
+
+
+async def read_head(reader: asyncio.StreamReader) -> Optional[bytes]:
+    try:
+        return await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise ProxyError(400, "Bad Request")
+    except asyncio.LimitOverrunError:
+        raise ProxyError(431, "Request Header Fields Too Large")
+
+
+async def copy_exactly(reader, writer, length: int) -> int:
+    total = length
+    while length > 0:
+        chunk = await reader.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            raise asyncio.IncompleteReadError(b"", length)
+        writer.write(chunk)
+        await writer.drain()
+        length -= len(chunk)
+    return total
+
+
+async def copy_chunked(reader, writer) -> int:
+    """Relays a chunked body; returns the payload size (framing excluded)."""
+    total = 0
+    while True:
+        size_line = await reader.readuntil(b"\r\n")
+        writer.write(size_line)
+        size = int(size_line.split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            # trailers, terminated by an empty line
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                writer.write(line)
+                if line == b"\r\n":
+                    break
+            await writer.drain()
+            return total
+        await copy_exactly(reader, writer, size + 2)
+        total += size
+
+
+async def copy_until_eof(reader, writer) -> int:
+    total = 0
+    while True:
+        chunk = await reader.read(CHUNK_SIZE)
+        if not chunk:
+            return total
+        writer.write(chunk)
+        await writer.drain()
+        total += len(chunk)
+
+
+def close_writer(writer: asyncio.StreamWriter) -> None:
+    if not writer.is_closing():
+        writer.close()
+
+
+async def discard_writer(writer: asyncio.StreamWriter) -> None:
+    """Closes a connection that cannot be reused and waits until it is gone."""
+    close_writer(writer)
+    try:
+        await writer.wait_closed()
+    except (ConnectionError, OSError):
+        pass
+
+
+class UpstreamPool:
+    """Idle keep-alive connections, per container (host, port)."""
+
+    def __init__(
+        self,
+        max_idle: int = PROXY_POOL_SIZE,
+        idle_timeout: float = PROXY_POOL_IDLE_TIMEOUT,
+        connect_timeout: float = PROXY_CONNECT_TIMEOUT,
+    ):
+        self._max_idle = max_idle
+        self._idle_timeout = idle_timeout
+        self._connect_timeout = connect_timeout
+        self._idle: dict[tuple[str, int], deque] = defaultdict(deque)
+
+    async def acquire(self, host: str, port: int) -> tuple:
+        """Returns (reader, writer, reused)."""
+        idle = self._idle[(host, port)]
+        now = time.monotonic()
+        while idle:
+            reader, writer, since = idle.pop()
+            if now - since < self._idle_timeout and not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            close_writer(writer)
+        reader, writer = await self.connect(host, port)
+        return reader, writer, False
+
+    async def connect(self, host: str, port: int) -> tuple:
+        try:
+            return await asyncio.wait_for(
+                asyncio.open_connection(host, port, limit=HEAD_LIMIT),
+                self._connect_timeout,
+            )
+        except (OSError, asyncio.TimeoutError):
+            raise ProxyError(502, "Bad Gateway")
+
+    def release(self, host: str, port: int, reader, writer) -> None:
+        idle = self._idle[(host, port)]
+        if len(idle) >= self._max_idle or reader.at_eof() or writer.is_closing():
+            close_writer(writer)
+            return
+        idle.append((reader, writer, time.monotonic()))
+
+    def close(self) -> None:
+        for idle in self._idle.values():
+            while idle:
+                close_writer(idle.pop()[1])
+        self._idle.clear()
+
+
+class ReverseProxy:
+    def __init__(
+        self,
+        routes: RoutingTable,
+        pool: Optional[UpstreamPool] = None,
+        static: Optional[StaticAssetCache] = None,
+        waker: Optional[CodespaceWaker] = None,
+        reaper: Optional[IdleReaper] = None,
+        metrics: Optional[ProxyMetrics] = None,
+    ):
+        self.routes = routes
+        self.pool = pool or UpstreamPool()
+        self.static = static
+        self.waker = waker
+        self.reaper = reaper
+        self.activity = reaper.activity if reaper else ActivityTracker()
+        self.metrics = metrics or ProxyMetrics()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._metrics_server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = PROXY_HOST, port: int = PROXY_PORT) -> None:
+        self.routes.start()
+        if self.reaper is not None:
+            self.reaper.start()
+        self._server = await asyncio.start_server(self.handle_client, host, port, limit=HEAD_LIMIT)
+        self._metrics_server = await self.metrics.serve()
+
+    async def serve_forever(self) -> None:
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        self.routes.stop()
+        if self.reaper is not None:
+            self.reaper.stop()
+        self.pool.close()
+        if self._metrics_server:
+            self._metrics_server.close()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            keep_alive = True
+            while keep_alive:
+                head = await read_head(reader)
+                if head is None:
+                    break
+                request = Message.parse(head)
+                try:
+                    keep_alive = await self.handle_request(request, reader, writer)
+                except ProxyError as e:
+                    await self.send_error(writer, e)
+                    break
+        except ProxyError as e:
+            await self.send_error(writer, e)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except Exception:
+            logger.exception("Unhandled proxy error")
+        finally:
+            close_writer(writer)
+
+    async def send_error(self, writer: asyncio.StreamWriter, error: ProxyError) -> None:
+        body = error.reason.encode()
+        writer.write(
+            f"HTTP/1.1 {error.status} {error.reason}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def handle_request(self, request: Message, reader, writer) -> bool:
+        """Forwards one request; returns whether the client connection stays open."""
+        started = time.perf_counter()
+        method, target, version = request.start_line.split(" ", 2)
+        host = request.get("Host", "").split(":")[0]
+        route = resolve_route(host, target, self.routes)
+        self.metrics.unknown_host(route)
+        if route is None:
+            return False
+        kind = route.kind
+        self.metrics.observe("routing", kind, time.perf_counter() - started)
+        if not self.routes.ready:
+            raise ProxyError(503, "Database Error")
+
+        client_keep_alive = "close" not in request.tokens("Connection") and (
+            version == "HTTP/1.1" or "keep-alive" in request.tokens("Connection")
+        )
+        websocket = request.is_websocket
+        chunked = request.is_chunked
+        length = request.content_length
+
+        if route.kind == "codespace":
+            self.activity.touch(route.name)
+
+        static_key = None
+        if route.kind == "codespace" and method == "GET" and self.static is not None:
+            static_key = cache_key(target)
+        if static_key:
+            asset = await self.static.get(static_key)
+            if asset is not None:
+                sent = await self.send_asset(request, asset, writer, client_keep_alive)
+                self.metrics.request_done(kind, 0, sent)
+                return client_keep_alive
+            # fill the cache with the plain body, variants are made locally
+            request.remove_header("Accept-Encoding")
+
+        if route.kind == "codespace" and self.waker is not None:
+            try:
+                host, port = await self.waker.ensure_awake(route.name, route.host, route.port)
+                route = route._replace(host=host, port=port)
+            except WakeError as e:
+                logger.error(str(e))
+                raise ProxyError(503, "Service Unavailable")
+
+        if "100-continue" in request.tokens("Expect"):
+            request.remove_header("Expect")
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        for name in list(request.tokens("Connection")) + list(HOP_BY_HOP):
+            request.remove_header(name)
+        for name, value in route.headers.items():
+            request.set_header(name, value)
+        request.start_line = f"{method} {target} HTTP/1.1"
+        if websocket:
+            request.set_header("Connection", "Upgrade")
+            request.set_header("Upgrade", "websocket")
+            return await self.relay_websocket(route, request, reader, writer, started)
+        if chunked:
+            # chunked framing wins over Content-Length (RFC 9112 §6.3)
+            request.remove_header("Content-Length")
+            request.set_header("Transfer-Encoding", "chunked")
+
+        # A pooled connection may have been closed by code-server meanwhile;
+        # requests without a body are retried once on a fresh connection.
+        up_writer = None
+        try:
+            for attempt in range(2):
+                connecting = time.perf_counter()
+                up_reader, up_writer, reused = await self.pool.acquire(route.host, route.port)
+                self.metrics.observe("connect", kind, time.perf_counter() - connecting)
+                try:
+                    up_writer.write(request.serialize())
+                    received = 0
+                    if chunked:
+                        received = await copy_chunked(reader, up_writer)
+                    elif length:
+                        received = await copy_exactly(reader, up_writer, length)
+                    await up_writer.drain()
+                    head = await read_head(up_reader)
+                    if head is None:
+                        raise ConnectionResetError
+                    break
+                except (ConnectionError, ProxyError):
+                    await discard_writer(up_writer)
+                    up_writer = None
+                    if reused and attempt == 0 and not chunked and not length:
+                        continue
+                    raise ProxyError(502, "Bad Gateway")
+
+            self.metrics.observe("ttfb", kind, time.perf_counter() - started)
+            response = Message.parse(head)
+            if route.kind == "codespace" and self.waker is not None:
+                self.waker.mark_alive(route.name)
+            upstream_keep_alive, sent = await self.relay_response(
+                method, response, up_reader, writer, client_keep_alive, static_key
+            )
+            self.metrics.request_done(kind, received, sent)
+            if upstream_keep_alive:
+                self.pool.release(route.host, route.port, up_reader, up_writer)
+                up_writer = None
+        finally:
+            # a client or upstream gone mid-body must not leak the upstream connection
+            if up_writer is not None:
+                await discard_writer(up_writer)
+        return client_keep_alive and upstream_keep_alive
+
+    async def relay_response(
+        self,
+        method: str,
+        response: Message,
+        up_reader,
+        writer,
+        client_keep_alive: bool,
+        static_key: Optional[str] = None,
+    ) -> tuple[bool, int]:
+        """
+        Streams the response to the client; returns whether upstream can be
+        reused and the body size.
+        """
+        status = int(response.start_line.split(" ", 2)[1])
+        upstream_keep_alive = "close" not in response.tokens("Connection")
+        chunked = response.is_chunked
+        length = response.content_length
+        bodyless = method == "HEAD" or status in (204, 304) or 100 <= status < 200
+
+        for name in list(response.tokens("Connection")) + list(HOP_BY_HOP):
+            response.remove_header(name)
+        if chunked:
+            response.remove_header("Content-Length")
+        if chunked and not bodyless:
+            response.set_header("Transfer-Encoding", "chunked")
+        if not bodyless and not chunked and length is None:
+            # delimited by upstream closing the connection
+            upstream_keep_alive = False
+            client_keep_alive = False
+        if not client_keep_alive:
+            response.set_header("Connection", "close")
+
+        writer.write(response.serialize())
+        sent = 0
+        if bodyless:
+            pass
+        elif (
+            static_key
+            and not chunked
+            and length is not None
+            and length <= self.static.max_entry
+            and is_cacheable_response(status, dict(response.headers))
+        ):
+            body = await up_reader.readexactly(length)
+            writer.write(body)
+            sent = length
+            asyncio.get_running_loop().run_in_executor(
+                None, self.static.put, static_key, body, dict(response.headers)
+            )
+        elif chunked:
+            sent = await copy_chunked(up_reader, writer)
+        elif length is not None:
+            sent = await copy_exactly(up_reader, writer, length)
+        else:
+            sent = await copy_until_eof(up_reader, writer)
+        await writer.drain()
+        return upstream_keep_alive, sent
+
+    async def send_asset(self, request: Message, asset: CachedAsset, writer, client_keep_alive: bool) -> int:
+        headers, body = self.static.response_parts(asset, request.get("Accept-Encoding", ""))
+        etag = asset.headers.get("etag")
+        if etag and request.get("If-None-Match") == etag:
+            response = Message("HTTP/1.1 304 Not Modified", [("ETag", etag), ("Cache-Control", headers["Cache-Control"])])
+            body = b""
+        else:
+            response = Message("HTTP/1.1 200 OK", list(headers.items()))
+        if not client_keep_alive:
+            response.set_header("Connection", "close")
+        writer.write(response.serialize() + body)
+        await writer.drain()
+        return len(body)
+
+    async def relay_websocket(self, route, request: Message, reader, writer, started: float) -> bool:
+        connecting = time.perf_counter()
+        up_reader, up_writer = await self.pool.connect(route.host, route.port)
+        self.metrics.observe("connect", route.kind, time.perf_counter() - connecting)
+        try:
+            up_writer.write(request.serialize())
+            await up_writer.drain()
+            head = await read_head(up_reader)
+            if head is None:
+                raise ProxyError(502, "Bad Gateway")
+            self.metrics.observe("ttfb", route.kind, time.perf_counter() - started)
+            response = Message.parse(head)
+            if not response.start_line.split(" ", 2)[1] == "101":
+                _, sent = await self.relay_response("GET", response, up_reader, writer, False)
+                self.metrics.request_done(route.kind, 0, sent)
+                return False
+
+            writer.write(head)
+            await writer.drain()
+
+            def client_data(count: int) -> None:
+                self.activity.touch(route.name)
+                self.metrics.add_bytes(route.kind, "request", count)
+
+            self.metrics.websocket_opened(route.kind)
+            try:
+                await self.pipe(
+                    reader, writer, up_reader, up_writer,
+                    on_client_data=client_data,
+                    on_upstream_data=lambda count: self.metrics.add_bytes(route.kind, "response", count),
+                )
+            finally:
+                self.metrics.websocket_closed(route.kind)
+            return False
+        finally:
+            close_writer(up_writer)
+
+    async def pipe(
+        self, reader, writer, up_reader, up_writer, on_client_data=None, on_upstream_data=None
+    ) -> None:
+        """Full-duplex relay until either side closes; callbacks get chunk sizes."""
+
+        async def one_way(src, dst, on_data=None):
+            try:
+                while True:
+                    chunk = await src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if on_data is not None:
+                        on_data(len(chunk))
+                    dst.write(chunk)
+                    await dst.drain()
+            except ConnectionError:
+                pass
+            finally:
+                close_writer(dst)
+
+        await asyncio.gather(
+            one_way(reader, up_writer, on_client_data), one_way(up_reader, writer, on_upstream_data)
+        )
+
+
+async def serve(host: str, port: int) -> None:
+    routes = make_routing_table()
+    waker = CodespaceWaker(routes) if PROXY_WAKE_ON_REQUEST else None
+    proxy = ReverseProxy(
+        routes,
+        static=StaticAssetCache() if PROXY_STATIC_CACHE else None,
+        waker=waker,
+        reaper=IdleReaper(ActivityTracker(), waker) if waker else None,
+    )
+    await proxy.start(host, port)
+    logger.info("Reverse proxy listening on %s:%s", host, port)
+    try:
+        await proxy.serve_forever()
+    finally:
+        await proxy.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Babirusa codespace reverse proxy")
+    parser.add_argument("--host", default=PROXY_HOST)
+    parser.add_argument("--port", type=int, default=PROXY_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
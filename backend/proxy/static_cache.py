@@ -0,0 +1,196 @@
+"""
+Shared cache for code-server's versioned static assets.
+
+Every codespace runs the same image, so /stable-<commit>/static/... is the
+same file in every container. The first pupil to request an asset fills the
+cache; everyone else is served from memory (or disk after a restart) with
+precompressed gzip/brotli variants.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from proxy import (
+    PROXY_STATIC_CACHE_DIR,
+    PROXY_STATIC_CACHE_MAX_ENTRY_MB,
+    PROXY_STATIC_CACHE_MEMORY_MB,
+)
+
+try:
+    import brotli
+except ImportError:  # brotli variants are optional outside the mitm image
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# In PATH mode the URL is prefixed with the pupil's username; the part from
+# the quality-commit segment on is identical for every pupil.
+STATIC_PATH = re.compile(r"^(?:/[^/?#]+)?(/(?:stable|insider)-[0-9a-f]{40}/static/[^?#]+)")
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/wasm",
+    "image/svg+xml",
+    "font/ttf",
+    "font/otf",
+)
+STORED_HEADERS = ("content-type", "etag", "last-modified")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class CachedAsset(NamedTuple):
+    headers: dict[str, str]
+    variants: dict[str, bytes]  # content-coding → body ("identity", "gzip", "br")
+
+    @property
+    def size(self) -> int:
+        return sum(len(body) for body in self.variants.values())
+
+
+def cache_key(path: str) -> Optional[str]:
+    match = STATIC_PATH.match(path)
+    return match.group(1) if match else None
+
+
+def is_cacheable_response(status: int, headers) -> bool:
+    return status == 200 and "set-cookie" not in {k.lower() for k in headers.keys()}
+
+
+def choose_encoding(accept_encoding: str, asset: CachedAsset) -> str:
+    accepted = {
+        token.split(";")[0].strip().lower()
+        for token in accept_encoding.split(",")
+    }
+    for coding in ("br", "gzip"):
+        if coding in accepted and coding in asset.variants:
+            return coding
+    return "identity"
+
+
+class StaticAssetCache:
+    def __init__(
+        self,
+        directory: Optional[str] = PROXY_STATIC_CACHE_DIR,
+        max_memory: int = PROXY_STATIC_CACHE_MEMORY_MB * 2**20,
+        max_entry: int = PROXY_STATIC_CACHE_MAX_ENTRY_MB * 2**20,
+    ):
+        self.directory = directory
+        self.max_memory = max_memory
+        self.max_entry = max_entry
+        self._memory: OrderedDict[str, CachedAsset] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    async def get(self, key: str) -> Optional[CachedAsset]:
+        with self._lock:
+            asset = self._memory.get(key)
+            if asset is not None:
+                self._memory.move_to_end(key)
+                return asset
+        if not self.directory:
+            return None
+        # a cold read from a slow disk must not stall every proxied connection
+        asset = await asyncio.to_thread(self._load, key)
+        if asset is not None:
+            self._remember(key, asset)
+        return asset
+
+    def put(self, key: str, content: bytes, headers: dict[str, str]) -> Optional[CachedAsset]:
+        """Compresses and stores an asset. Blocking: call it from a worker thread."""
+        if len(content) > self.max_entry:
+            return None
+        stored = {k.lower(): v for k, v in headers.items() if k.lower() in STORED_HEADERS}
+        variants = {"identity": content}
+        if stored.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+            variants["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants["br"] = brotli.compress(content, quality=9)
+        asset = CachedAsset(stored, variants)
+        self._remember(key, asset)
+        self._save(key, asset)
+        return asset
+
+    def response_parts(self, asset: CachedAsset, accept_encoding: str) -> tuple[dict[str, str], bytes]:
+        coding = choose_encoding(accept_encoding, asset)
+        body = asset.variants[coding]
+        headers = {
+            "Content-Type": asset.headers.get("content-type", "application/octet-stream"),
+            "Content-Length": str(len(body)),
+            "Cache-Control": IMMUTABLE,
+            "Vary": "Accept-Encoding",
+        }
+        if "etag" in asset.headers:
+            headers["ETag"] = asset.headers["etag"]
+        if "last-modified" in asset.headers:
+            headers["Last-Modified"] = asset.headers["last-modified"]
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        return headers, body
+
+    def _remember(self, key: str, asset: CachedAsset) -> None:
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old.size
+            self._memory[key] = asset
+            self._memory_bytes += asset.size
+            while self._memory_bytes > self.max_memory and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.size
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def _load(self, key: str) -> Optional[CachedAsset]:
+        if not self.directory:
+            return None
+        entry = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry, "meta.json")) as f:
+                meta = json.load(f)
+            variants = {}
+            for coding in meta["variants"]:
+                with open(os.path.join(entry, coding), "rb") as f:
+                    variants[coding] = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+        return CachedAsset(meta["headers"], variants)
+
+    def _save(self, key: str, asset: CachedAsset) -> None:
+        if not self.directory:
+            return
+        entry = self._entry_dir(key)
+        try:
+            os.makedirs(entry, exist_ok=True)
+            for coding, body in asset.variants.items():
+                _atomic_write(os.path.join(entry, coding), body)
+            # meta.json last: its presence marks a complete entry
+            meta = {"key": key, "headers": asset.headers, "variants": list(asset.variants)}
+            _atomic_write(os.path.join(entry, "meta.json"), json.dumps(meta).encode())
+        except OSError as e:
+            logger.error(f"Static cache write failed for {key}: {e}")
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
@@ -0,0 +1,218 @@
+"""
+Wake-on-request for stopped codespaces.
+
+A request for a pupil whose container is not answering starts the container
+through the Docker API and is held until code-server responds on its port.
+Concurrent requests for the same pupil share one start. Codespaces on other
+Docker hosts are started through that host's daemon and reached on the port
+it published.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import docker
+from pymongo.errors import PyMongoError
+
+from proxy import DOCKER_HOSTS, PROXY_ALIVE_TTL, PROXY_WAKE_TIMEOUT
+from proxy.routing import CODESPACE_PORT, RoutingTable
+
+logger = logging.getLogger(__name__)
+
+
+class WakeError(Exception):
+    pass
+
+
+def container_ip(attrs: dict) -> Optional[str]:
+    settings = attrs.get("NetworkSettings", {})
+    if settings.get("IPAddress"):
+        return settings["IPAddress"]
+    for network in settings.get("Networks", {}).values():
+        if network.get("IPAddress"):
+            return network["IPAddress"]
+    return None
+
+
+def published_port(attrs: dict, port: int = CODESPACE_PORT) -> Optional[int]:
+    bindings = attrs.get("NetworkSettings", {}).get("Ports", {}).get(f"{port}/tcp")
+    return int(bindings[0]["HostPort"]) if bindings else None
+
+
+def docker_host_urls(spec: Optional[str] = DOCKER_HOSTS) -> dict[str, str]:
+    """DOCKER_HOSTS "name=url[@capacity],..." → {name: url}."""
+    urls = {}
+    for item in (spec or "").split(","):
+        if item.strip():
+            name, target = item.strip().split("=", 1)
+            urls[name.strip()] = target.partition("@")[0].strip()
+    return urls
+
+
+async def accepts_connections(host: str, port: int, timeout: float = 0.5) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+async def answers_http(host: str, port: int, timeout: float = 1.0) -> bool:
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(b"GET /healthz HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        return status_line.startswith(b"HTTP/")
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+class CodespaceWaker:
+    def __init__(
+        self,
+        routes: RoutingTable,
+        docker_client=None,
+        timeout: float = PROXY_WAKE_TIMEOUT,
+        alive_ttl: float = PROXY_ALIVE_TTL,
+        docker_hosts: Optional[dict] = None,
+    ):
+        self.routes = routes
+        self._docker = docker_client
+        self._host_urls = docker_host_urls() if docker_hosts is None else {}
+        self._host_clients = dict(docker_hosts or {})  # host name → client
+        self._timeout = timeout
+        self._alive_ttl = alive_ttl
+        self._alive: dict[str, float] = {}  # username → last time upstream answered
+        self._suspended: set[str] = set()
+        self._waking: dict[str, asyncio.Future] = {}
+
+    @property
+    def docker(self):
+        if self._docker is None:
+            self._docker = docker.from_env()
+        return self._docker
+
+    def docker_for(self, username: str):
+        """Client of the Docker host the pupil's codespace runs on."""
+        host = self.routes.docker_host(username)
+        if host not in self._host_clients:
+            if host not in self._host_urls:
+                return self.docker
+            self._host_clients[host] = docker.DockerClient(base_url=self._host_urls[host])
+        return self._host_clients[host]
+
+    def mark_alive(self, username: str) -> None:
+        self._alive[username] = time.monotonic()
+
+    def mark_suspended(self, username: str) -> None:
+        # A paused container still completes TCP handshakes, so suspended
+        # codespaces are woken without probing.
+        self._alive.pop(username, None)
+        self._suspended.add(username)
+
+    async def ensure_awake(
+        self, username: str, ip: str, port: int = CODESPACE_PORT
+    ) -> tuple[str, int]:
+        """Returns the (IP, port) to route to, starting the container first if needed."""
+        if username in self._suspended:
+            return await self.wake(username)
+        seen = self._alive.get(username)
+        if seen is not None and time.monotonic() - seen < self._alive_ttl:
+            return ip, port
+        if (
+            username not in self._waking
+            and await accepts_connections(ip, port)
+            and not await self.is_paused(username)
+        ):
+            self.mark_alive(username)
+            return ip, port
+        return await self.wake(username)
+
+    async def is_paused(self, username: str) -> bool:
+        """
+        Asks Docker: _suspended is lost when the proxy restarts, and a paused
+        container still passes the TCP probe.
+        """
+        container_id = self.routes.container_id(username)
+        if not container_id:
+            return False
+        try:
+            client = self.docker_for(username)
+            container = await asyncio.to_thread(client.containers.get, container_id)
+        except docker.errors.DockerException as e:
+            logger.error(f"Could not inspect codespace of {username}: {e}")
+            return False
+        return container.status == "paused"
+
+    async def wake(self, username: str) -> tuple[str, int]:
+        future = self._waking.get(username)
+        if future is None:
+            future = asyncio.ensure_future(self._wake(username))
+            self._waking[username] = future
+            future.add_done_callback(lambda _: self._waking.pop(username, None))
+        # a client going away must not cancel the start for everyone else
+        return await asyncio.shield(future)
+
+    async def _wake(self, username: str) -> tuple[str, int]:
+        container_id = self.routes.container_id(username)
+        if not container_id:
+            raise WakeError(f"No container recorded for {username}")
+
+        try:
+            client = self.docker_for(username)
+            container = await asyncio.to_thread(client.containers.get, container_id)
+            if container.status == "paused":
+                logger.info("Unpausing codespace of %s", username)
+                await asyncio.to_thread(container.unpause)
+                await asyncio.to_thread(container.reload)
+            elif container.status != "running":
+                logger.info("Waking codespace of %s", username)
+                await asyncio.to_thread(container.start)
+                await asyncio.to_thread(container.reload)
+        except docker.errors.DockerException as e:
+            raise WakeError(f"Could not start codespace of {username}: {e}")
+
+        # Docker may hand out a different address (or published port) after a restart
+        remote = self.routes.port(username) is not None
+        if remote:
+            ip = self.routes.get(username)
+            port = published_port(container.attrs) or self.routes.port(username)
+        else:
+            ip = container_ip(container.attrs) or self.routes.get(username)
+            port = CODESPACE_PORT
+        if ip != self.routes.get(username) or (remote and port != self.routes.port(username)):
+            await asyncio.to_thread(self.routes.set_ip, username, ip, port if remote else None)
+
+        await self._wait_ready(ip, port)
+        await asyncio.to_thread(self.set_status, username, "running")
+        self._suspended.discard(username)
+        self.mark_alive(username)
+        return ip, port
+
+    async def _wait_ready(self, ip: str, port: int = CODESPACE_PORT) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._timeout
+        while loop.time() < deadline:
+            if await answers_http(ip, port):
+                return
+            await asyncio.sleep(0.25)
+        raise WakeError(f"code-server at {ip} did not answer in {self._timeout:.0f}s")
+
+    def set_status(self, username: str, status: str) -> None:
+        database = self.routes.database
+        if database is None:
+            return
+        try:
+            database["Pupil"].update_one(
+                {"username": username}, {"$set": {"container_status": status}}
+            )
+        except PyMongoError as e:
+            logger.error(f"MongoDB Error: {e}")